@@ -0,0 +1,139 @@
+import argparse
+import csv
+import os
+import sys
+from datetime import date as date_type
+from attendance_store import CSV_HEADER, SUMMARY_COLUMNS, create_attendance_store
+from encoding_store import list_face_images, template_name
+from loges import logger, stop_logging_thread
+
+ROSTER_COLUMNS = ['Name', 'Status', 'Time']
+
+
+def enrolled_names(storage_path):
+    """Names with at least one enrolled face image in storage_path/faces"""
+    faces_dir = os.path.join(storage_path, "faces")
+    if not os.path.isdir(faces_dir):
+        return set()
+    return {template_name(key) for key in list_face_images(faces_dir)}
+
+
+class AttendanceReports:
+    """Read-only reports answered from the attendance store's indexes.
+
+    Every query is bounded by a date range or a person, so its cost follows the
+    rows it returns rather than the size of the whole history.
+    """
+
+    def __init__(self, store, expected=None):
+        self.store = store
+        self.expected = set(expected or ())
+
+    def roster(self, date):
+        """Everyone present on date in arrival order, then expected people who were absent"""
+        present = [(name, "present", time) for name, _, time in self.store.rows(date, date)]
+        seen = {name for name, _, _ in present}
+        absent = [(name, "absent", "") for name in sorted(self.expected - seen)]
+        return present + absent
+
+    def summary(self, start, end):
+        """Days present and first/last arrival per person between start and end"""
+        return self.store.summary(start, end)
+
+    def history(self, name, start=None, end=None):
+        """Every mark for name; on the CSV backend give start and end to bound what is read"""
+        return self.store.rows(start, end, name=name)
+
+    def late_arrivals(self, start, end, after):
+        """Rows between start and end marked later than after (HH:MM:SS)"""
+        return [row for row in self.store.rows(start, end) if row[2] > after]
+
+
+def export_rows(rows, columns, path):
+    """Write rows to path as CSV, or as Parquet when path ends in .parquet"""
+    if path.lower().endswith(".parquet"):
+        # pandas (with pyarrow) is only needed for Parquet, so it is imported on demand
+        try:
+            import pandas as pd
+            pd.DataFrame(list(rows), columns=columns).to_parquet(path, index=False)
+        except ImportError:
+            raise RuntimeError("Parquet export requires pandas and pyarrow") from None
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    logger.info(f"Exported {len(rows)} rows to {path}")
+
+
+def print_rows(rows, columns):
+    widths = [max([len(str(c))] + [len(str(row[i])) for row in rows]) for i, c in enumerate(columns)]
+    print("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(v).ljust(w) for v, w in zip(row, widths)))
+    print(f"({len(rows)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance rosters, summaries and per-person history")
+    parser.add_argument("--storage", help="storage directory (defaults to the configured location)")
+    parser.add_argument("--backend", choices=["auto", "sqlite", "csv"],
+                        help="attendance backend (defaults to config)")
+    parser.add_argument("--output", help="export to this .csv or .parquet file instead of printing")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    roster = commands.add_parser("roster", help="who was present or absent on a day")
+    roster.add_argument("--date", default=date_type.today().isoformat())
+
+    summary = commands.add_parser("summary", help="days present per person over a date range")
+    summary.add_argument("--start", required=True)
+    summary.add_argument("--end", required=True)
+
+    history = commands.add_parser("history", help="every mark for one person")
+    history.add_argument("name")
+    history.add_argument("--start")
+    history.add_argument("--end")
+
+    late = commands.add_parser("late", help="marks after a cut-off time over a date range")
+    late.add_argument("--start", required=True)
+    late.add_argument("--end", required=True)
+    late.add_argument("--after", default="09:00:00", help="cut-off time as HH:MM:SS")
+    args = parser.parse_args()
+
+    settings = {}
+    storage_path = args.storage
+    if not storage_path or not args.backend:
+        from constant import ConfigManager
+        config = ConfigManager().get_config()
+        storage_path = storage_path or config.get('save_to_directory') or os.getcwd()
+        settings = dict(config.get("attendance", {}))
+    if args.backend:
+        settings["backend"] = args.backend
+
+    store = create_attendance_store(storage_path, settings)
+    try:
+        reports = AttendanceReports(store, enrolled_names(storage_path))
+        if args.command == "roster":
+            rows, columns = reports.roster(args.date), ROSTER_COLUMNS
+        elif args.command == "summary":
+            rows, columns = reports.summary(args.start, args.end), SUMMARY_COLUMNS
+        elif args.command == "history":
+            rows, columns = reports.history(args.name, args.start, args.end), CSV_HEADER
+        else:
+            rows, columns = reports.late_arrivals(args.start, args.end, args.after), CSV_HEADER
+
+        if args.output:
+            export_rows(rows, columns, args.output)
+        else:
+            print_rows(rows, columns)
+        return 0
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+        stop_logging_thread()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from loges import logger
+from metrics import metrics
+
+CSV_HEADER = ['Name', 'Date', 'Time']
+SUMMARY_COLUMNS = ['Name', 'Days', 'First Date', 'Last Date', 'Earliest Time', 'Latest Time']
+# Bounds that compare below and above any YYYY-MM-DD date
+MIN_DATE = ""
+MAX_DATE = "9999-99-99"
+
+
+class AttendanceStore(ABC):
+    """Storage backend for attendance rows of (name, date, time)"""
+
+    @abstractmethod
+    def marked_on(self, date):
+        """Return the set of names with attendance recorded on date"""
+
+    @abstractmethod
+    def append(self, rows):
+        """Persist new (name, date, time) rows"""
+
+    @abstractmethod
+    def rows(self, start=None, end=None, name=None):
+        """Return (name, date, time) rows with start <= date <= end, ordered by date and time"""
+
+    def summary(self, start=None, end=None):
+        """Return one SUMMARY_COLUMNS row per person seen between start and end, ordered by name"""
+        people = {}
+        for name, date, mark_time in self.rows(start, end):
+            entry = people.get(name)
+            if entry is None:
+                people[name] = [name, 1, date, date, mark_time, mark_time]
+                continue
+            entry[1] += 1
+            entry[2] = min(entry[2], date)
+            entry[3] = max(entry[3], date)
+            entry[4] = min(entry[4], mark_time)
+            entry[5] = max(entry[5], mark_time)
+        return [tuple(people[name]) for name in sorted(people)]
+
+    def close(self):
+        pass
+
+
+class SQLiteAttendanceStore(AttendanceStore):
+    """SQLite backend in WAL mode with one row per person per day"""
+
+    def __init__(self, db_path, legacy_csv=None):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS attendance ("
+            "id INTEGER PRIMARY KEY, name TEXT NOT NULL, date TEXT NOT NULL, time TEXT NOT NULL)")
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_name_date ON attendance (name, date)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        logger.info(f"Using SQLite attendance store: {db_path}")
+
+        if legacy_csv and os.path.exists(legacy_csv):
+            self.import_csv(legacy_csv)
+            logger.warning(f"{legacy_csv} is no longer updated: attendance is recorded in {db_path}. "
+                           f"Use attendance_reports.py --output to export it as CSV")
+
+    def import_csv(self, csv_path):
+        """One-time import of an existing attendance.csv"""
+        key = f"imported:{os.path.abspath(csv_path)}"
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return
+            count = 0
+            with open(csv_path, newline='') as f:
+                reader = csv.DictReader(f)
+                batch = []
+                for row in reader:
+                    batch.append((row['Name'], row['Date'], row['Time']))
+                    if len(batch) >= 10000:
+                        self.conn.executemany(
+                            "INSERT OR IGNORE INTO attendance (name, date, time) VALUES (?, ?, ?)", batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO attendance (name, date, time) VALUES (?, ?, ?)", batch)
+                    count += len(batch)
+            self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, str(count)))
+            self.conn.commit()
+        logger.info(f"Imported {count} attendance rows from {csv_path}")
+
+    def marked_on(self, date):
+        with self.lock:
+            rows = self.conn.execute("SELECT name FROM attendance WHERE date = ?", (date,)).fetchall()
+        return {row[0] for row in rows}
+
+    def append(self, rows):
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO attendance (name, date, time) VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+
+    def rows(self, start=None, end=None, name=None):
+        # Served by the (date) index, or the (name, date) index for one person
+        query = "SELECT name, date, time FROM attendance WHERE date BETWEEN ? AND ?"
+        params = [start or MIN_DATE, end or MAX_DATE]
+        if name is not None:
+            query += " AND name = ?"
+            params.append(name)
+        with self.lock:
+            return self.conn.execute(query + " ORDER BY date, time", params).fetchall()
+
+    def summary(self, start=None, end=None):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT name, COUNT(*), MIN(date), MAX(date), MIN(time), MAX(time) FROM attendance "
+                "WHERE date BETWEEN ? AND ? GROUP BY name ORDER BY name",
+                (start or MIN_DATE, end or MAX_DATE)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CSVAttendanceStore(AttendanceStore):
+    """Append-only attendance.csv that never rewrites earlier rows"""
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.lock = threading.Lock()
+        if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+            with open(csv_path, 'w', newline='') as f:
+                csv.writer(f, lineterminator="\n").writerow(CSV_HEADER)
+            logger.info(f"Created new attendance file: {csv_path}")
+        else:
+            logger.info(f"Using existing attendance file: {csv_path}")
+
+    def marked_on(self, date, chunk_size=64 * 1024, stop_after=500):
+        """Scan backwards from the end of the file until rows are older than date.
+
+        Rows are mostly appended in time order, so only the tail of the file is read.
+        The scan stops after stop_after consecutive older rows, which tolerates short
+        runs of back-filled rows appended out of order.
+        """
+        names = set()
+        older_run = 0
+        with self.lock, open(self.csv_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b''
+            while position > 0 and older_run < stop_after:
+                read_size = min(chunk_size, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + remainder
+                lines = data.split(b'\n')
+                remainder = lines.pop(0) if position > 0 else b''
+                for line in reversed(lines):
+                    row = next(csv.reader([line.decode('utf-8', errors='replace')]), None)
+                    if not row or len(row) < 2 or row == CSV_HEADER:
+                        continue
+                    if row[1] < date:
+                        older_run += 1
+                        if older_run >= stop_after:
+                            break
+                        continue
+                    older_run = 0
+                    if row[1] == date:
+                        names.add(row[0])
+        return names
+
+    def append(self, rows):
+        with self.lock, open(self.csv_path, 'a', newline='') as f:
+            csv.writer(f, lineterminator="\n").writerows(rows)
+
+    def rows(self, start=None, end=None, name=None):
+        """Read only the byte ranges the date index lists for dates in range.
+
+        For one person the range is narrowed to the dates between their first and last
+        mark, but every row on those dates is still read: a long-standing person's
+        history without start and end reads most of the file.
+        """
+        with self.lock:
+            index = CSVDateIndex(self.csv_path)
+            index.update()
+            start, end = start or MIN_DATE, end or MAX_DATE
+            if name is not None:
+                if name not in index.names:
+                    return []
+                first, last = index.names[name]
+                start, end = max(start, first), min(end, last)
+            ranges = index.ranges(start, end)
+            result = []
+            with open(self.csv_path, 'rb') as f:
+                for date, date_ranges in ranges:
+                    day = []
+                    for begin, finish in date_ranges:
+                        f.seek(begin)
+                        for row in csv.reader(f.read(finish - begin).decode('utf-8', errors='replace').splitlines()):
+                            if len(row) >= 3 and row[1] == date and (name is None or row[0] == name):
+                                day.append((row[0], row[1], row[2]))
+                    day.sort(key=lambda row: row[2])
+                    result.extend(day)
+        return result
+
+
+class CSVDateIndex:
+    """Sidecar index of the byte ranges holding each date's rows in an append-only CSV.
+
+    Rows are mostly appended in date order, so each date is usually one contiguous
+    range. The first and last date each person was marked on are kept too. The index
+    remembers how much of the file it has covered and only scans rows appended since;
+    a file that shrank is re-indexed from the start.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.index_path = csv_path + ".idx.json"
+        self.size = 0
+        self.dates = {}
+        self.names = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    data = json.load(f)
+                # An index written before names were kept is rebuilt from the start
+                self.size, self.dates, self.names = data["size"], data["dates"], data["names"]
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable attendance index {self.index_path}: {str(e)}")
+
+    def update(self, chunk_size=1024 * 1024):
+        """Index rows appended since the last update, returning how many were added"""
+        file_size = os.path.getsize(self.csv_path)
+        if file_size < self.size:
+            logger.info(f"{self.csv_path} shrank since it was indexed, re-indexing")
+            self.size = 0
+            self.dates = {}
+            self.names = {}
+        if file_size == self.size:
+            return 0
+
+        added = 0
+        with open(self.csv_path, 'rb') as f:
+            f.seek(self.size)
+            offset = self.size
+            remainder = b''
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                lines = (remainder + chunk).split(b'\n')
+                # The last piece may be a row still being written; index it next time
+                remainder = lines.pop()
+                for line in lines:
+                    end = offset + len(line) + 1
+                    row = next(csv.reader([line.decode('utf-8', errors='replace')]), None)
+                    if row and len(row) >= 3 and row != CSV_HEADER:
+                        ranges = self.dates.setdefault(row[1], [])
+                        if ranges and ranges[-1][1] == offset:
+                            ranges[-1][1] = end
+                        else:
+                            ranges.append([offset, end])
+                        span = self.names.get(row[0])
+                        if span is None:
+                            self.names[row[0]] = [row[1], row[1]]
+                        else:
+                            span[0], span[1] = min(span[0], row[1]), max(span[1], row[1])
+                        added += 1
+                    offset = end
+        self.size = offset
+        self.save()
+        return added
+
+    def ranges(self, start, end):
+        """Return [(date, [[begin, end], ...])] for the indexed dates between start and end"""
+        return [(date, self.dates[date]) for date in sorted(self.dates) if start <= date <= end]
+
+    def save(self):
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"size": self.size, "dates": self.dates, "names": self.names}, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"Error saving attendance index: {str(e)}")
+
+
+class AttendanceWriter(threading.Thread):
+    """Background writer that coalesces marks and flushes them to a store in batches.
+
+    A batch is written once max_batch rows are pending or the oldest pending
+    row has waited max_delay seconds, whichever comes first.
+    """
+
+    def __init__(self, store, max_batch=50, max_delay=1.0, retry_delay=1.0):
+        super().__init__(daemon=True)
+        self.store = store
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.condition = threading.Condition()
+        self.pending = []
+        self.oldest_pending = None
+        self.in_flight = 0
+        self.flushed = 0
+        self.batches = 0
+        self.last_error = None
+        self.stopping = False
+
+    @property
+    def pending_count(self):
+        return len(self.pending) + self.in_flight
+
+    def submit(self, row):
+        with self.condition:
+            if not self.pending:
+                self.oldest_pending = time.monotonic()
+            self.pending.append(row)
+            if len(self.pending) == 1 or len(self.pending) >= self.max_batch:
+                self.condition.notify_all()
+
+    def _next_batch(self):
+        with self.condition:
+            while True:
+                if self.pending:
+                    waited = time.monotonic() - self.oldest_pending
+                    if self.stopping or len(self.pending) >= self.max_batch or waited >= self.max_delay:
+                        break
+                    self.condition.wait(self.max_delay - waited)
+                elif self.stopping:
+                    return None
+                else:
+                    self.condition.wait()
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            self.oldest_pending = time.monotonic() if self.pending else None
+            self.in_flight = len(batch)
+            return batch
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                with metrics.timer("attendance_flush"):
+                    self.store.append(batch)
+                with self.condition:
+                    self.flushed += len(batch)
+                    self.batches += 1
+                    self.in_flight = 0
+                    self.last_error = None
+                    self.condition.notify_all()
+                metrics.count("attendance_flushed", len(batch))
+                metrics.gauge("attendance_pending", self.pending_count)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} attendance rows, will retry: {str(e)}")
+                with self.condition:
+                    self.last_error = str(e)
+                    self.pending[:0] = batch
+                    self.oldest_pending = time.monotonic() - self.max_delay
+                    self.in_flight = 0
+                    if self.stopping:
+                        logger.error(f"Dropping {len(self.pending)} unwritten attendance rows on shutdown")
+                        self.pending = []
+                        return
+                time.sleep(self.retry_delay)
+
+    def flush(self, timeout=10.0):
+        """Block until every submitted row has been written, returning False on timeout.
+
+        While the store keeps failing, last_error holds the most recent error.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.oldest_pending = time.monotonic() - self.max_delay if self.pending else None
+            self.condition.notify_all()
+            while self.pending_count > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self):
+        """Drain pending rows and stop the writer"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.join()
+        logger.info(f"Attendance writer stopped after flushing {self.flushed} rows in {self.batches} batches")
+
+
+def create_attendance_store(storage_path, settings=None):
+    """Build the attendance backend described by the "attendance" config section.
+
+    The default "auto" backend keeps using attendance.csv where one exists and no
+    attendance.db does, so whatever reads the CSV keeps seeing new marks, and uses
+    SQLite everywhere else. Choosing "sqlite" imports an existing CSV once, after
+    which the CSV is no longer updated.
+    """
+    settings = settings or {}
+    csv_path = os.path.join(storage_path, "attendance.csv")
+    db_path = os.path.join(storage_path, "attendance.db")
+    backend = settings.get("backend", "auto")
+    if backend == "auto":
+        backend = "csv" if os.path.exists(csv_path) and not os.path.exists(db_path) else "sqlite"
+    if backend == "csv":
+        return CSVAttendanceStore(csv_path)
+    if backend != "sqlite":
+        logger.warning(f"Unknown attendance backend {backend}, using sqlite")
+    return SQLiteAttendanceStore(db_path, legacy_csv=csv_path)
@@ -0,0 +1,562 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from loges import logger, stop_logging_thread
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_GALLERY_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageTimer:
+    """Collects wall-clock samples per named stage"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            stages[stage] = {
+                "count": len(ms),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p90_ms": float(np.percentile(ms, 90)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+                "per_s": float(len(ms) / ms.sum() * 1000) if ms.sum() > 0 else None
+            }
+        return stages
+
+
+def synthetic_frames(count, size=(640, 480), seed=0):
+    """Noise frames with a bright face-sized blob; exercises every stage even without real faces"""
+    import cv2
+    rng = np.random.default_rng(seed)
+    width, height = size
+    frames = []
+    for i in range(count):
+        frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        centre = (width // 2 + (i % 7) * 4, height // 2)
+        cv2.ellipse(frame, centre, (70, 90), 0, 0, 360, (180, 190, 210), -1)
+        frames.append(frame)
+    return frames
+
+
+def recorded_frames(path, count, stride=1):
+    """Up to count frames from a video file or image directory"""
+    from headless import collect_sources, iter_video_frames, iter_image_frames
+    import cv2
+    frames = []
+    for kind, source, images in collect_sources([path]):
+        iterator = (iter_video_frames(source, stride, datetime.now()) if kind == "video"
+                    else iter_image_frames(images, stride))
+        for _, _, frame in iterator:
+            frames.append(cv2.resize(frame, (640, 480)))
+            if len(frames) >= count:
+                return frames
+    return frames
+
+
+def synthetic_gallery(size, seed=0):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(0, 0.1, (size, 128)).astype(np.float32)
+    return [f"person_{i}" for i in range(size)], encodings
+
+
+def bench_detector(face_detector, frames, timer, gallery_sizes, db_manager):
+    """Time the per-frame stages, then full recognition at each gallery size"""
+    import cv2
+
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        boxes = timer.time("detect", face_detector.detect_faces, gray)
+        if not boxes:
+            h, w = frame.shape[:2]
+            boxes = [(w // 2 - 70, h // 2 - 90, 140, 180)]
+        for box in boxes:
+            timer.time("encode", face_detector.get_face_encoding_from_coords, frame, box)
+        timer.time("collect_face", face_detector.collect_face, frame.copy())
+
+    queries = np.random.default_rng(1).normal(0, 0.1, (4, 128)).astype(np.float32)
+    throughput = {}
+    for size in gallery_sizes:
+        names, encodings = synthetic_gallery(size)
+        face_detector.gallery.matcher.set_gallery(names, encodings)
+        for _ in range(50):
+            timer.time(f"match_{size}", face_detector.gallery.matcher.match, queries[:1])
+
+        face_detector.reset_tracking()
+        started = time.perf_counter()
+        for frame in frames:
+            timer.time(f"recognize_face_{size}", face_detector.recognize_face, frame.copy(), db_manager)
+        elapsed = time.perf_counter() - started
+        throughput[f"recognize_face_{size}_fps"] = len(frames) / elapsed if elapsed > 0 else None
+    return throughput
+
+
+def bench_descriptor_batches(face_detector, frames, timer, batch_sizes):
+    """Faces/s of descriptor computation at each batch size, over the faces found in frames"""
+    import cv2
+
+    faces = []
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        boxes = face_detector.detect_faces(gray)
+        if not boxes:
+            h, w = frame.shape[:2]
+            boxes = [(w // 2 - 70, h // 2 - 90, 140, 180)]
+        faces.extend((frame, face_detector.face_landmarks(gray, box)) for box in boxes)
+
+    throughput = {}
+    configured = face_detector.descriptor_batch
+    try:
+        for size in batch_sizes:
+            face_detector.descriptor_batch = size
+            started = time.perf_counter()
+            for start in range(0, len(faces), size):
+                timer.time(f"descriptor_batch_{size}", face_detector.compute_descriptors, faces[start:start + size])
+            elapsed = time.perf_counter() - started
+            throughput[f"descriptor_batch_{size}_faces_per_s"] = len(faces) / elapsed if elapsed > 0 else None
+    finally:
+        face_detector.descriptor_batch = configured
+    return throughput
+
+
+class ReplaySource:
+    """Stands in for cv2.VideoCapture, decoding recorded frames into the caller's buffer if given"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.position = 0
+
+    def read(self, image=None):
+        frame = self.frames[self.position % len(self.frames)]
+        self.position += 1
+        if image is None or image.shape != frame.shape:
+            return True, frame.copy()
+        np.copyto(image, frame)
+        return True, image
+
+
+def bench_frame_path(frames, timer, size=(640, 480)):
+    """Capture-to-display frame handling, per-call copies vs shared pooled buffers.
+
+    Times each path and reports the peak transient allocation per frame. Detection,
+    encoding and drawing are excluded; only the copies and colour conversions around
+    them are measured.
+    """
+    import cv2
+    from video_frame import FramePool
+
+    def per_call_copies(source):
+        _, frame = source.read()
+        frame = cv2.resize(frame, size)
+        snapshot = frame.copy()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        landmarks_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        display = frame.copy()
+        rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
+        return snapshot, gray, landmarks_gray, rgb
+
+    pool = FramePool(6, size)
+    display = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    def pooled(source):
+        frame = pool.read(source)
+        gray = frame.gray
+        landmarks_gray = frame.gray
+        np.copyto(display, frame.image)
+        frame.release()
+        return gray, landmarks_gray, display
+
+    results = {}
+    for name, path in (("copies", per_call_copies), ("pooled", pooled)):
+        source = ReplaySource(frames)
+        path(source)
+        peaks = []
+        tracemalloc.start()
+        for _ in frames:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            path(source)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        for _ in frames:
+            timer.time(f"frame_path_{name}", path, source)
+        results[f"frame_path_{name}_alloc_kb"] = float(np.mean(peaks)) / 1024
+    return results
+
+
+def bench_gallery_load(timer, sizes, storage_path):
+    """Gallery startup: the encoding store's float64 rows vs a mapped embedding file.
+
+    Reports load time per size plus the memory each load allocates and the file size.
+    The ivf loaders map the float32 file under an IVF index, reassigning every row to
+    the saved centroids ("ivf") or mapping the saved lists ("ivf_lists").
+    """
+    from embedding_file import EmbeddingFile, open_ivf_lists, write_embedding_file, write_ivf_lists
+    from face_index import IVFIndex
+    from face_matcher import FaceMatcher
+
+    results = {}
+    for size in sizes:
+        names, encodings = synthetic_gallery(size)
+        npz_path = os.path.join(storage_path, f"bench_{size}.npz")
+        np.savez(npz_path, names=np.array(names, dtype=str), encodings=encodings.astype(np.float64))
+
+        def from_store():
+            with np.load(npz_path, allow_pickle=False) as data:
+                rows = [row.copy() for row in data['encodings']]
+                row_names = [str(name) for name in data['names']]
+            matcher = FaceMatcher()
+            matcher.set_gallery(row_names, rows)
+            return matcher
+
+        loaders = [("store", from_store, npz_path)]
+        for dtype in ("float32", "int8"):
+            path = os.path.join(storage_path, f"bench_{size}_{dtype}.bin")
+            write_embedding_file(path, names, encodings, dtype=dtype)
+
+            def mapped(path=path):
+                matcher = FaceMatcher()
+                matcher.set_mapped(EmbeddingFile(path))
+                return matcher
+            loaders.append((dtype, mapped, path))
+
+        float32_path = os.path.join(storage_path, f"bench_{size}_float32.bin")
+        index_path = os.path.join(storage_path, f"bench_{size}_centroids.npz")
+        lists_path = os.path.join(storage_path, f"bench_{size}.ivf")
+        trained = FaceMatcher(index=IVFIndex(min_size=0, index_path=index_path))
+        trained.set_mapped(EmbeddingFile(float32_path))
+        write_ivf_lists(lists_path, trained.index.saved_lists())
+
+        def mapped_ivf(with_lists):
+            matcher = FaceMatcher(index=IVFIndex(min_size=0, index_path=index_path))
+            matcher.set_mapped(EmbeddingFile(float32_path), open_ivf_lists(lists_path, b"") if with_lists else None)
+            return matcher
+        loaders.append(("ivf", lambda: mapped_ivf(False), float32_path))
+        loaders.append(("ivf_lists", lambda: mapped_ivf(True), lists_path))
+
+        for kind, load, path in loaders:
+            tracemalloc.start()
+            matcher = load()
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            matcher.match(encodings[:1])
+            del matcher
+            for _ in range(3):
+                timer.time(f"gallery_load_{kind}_{size}", load)
+            results[f"gallery_{kind}_{size}_alloc_mb"] = allocated / (1024 * 1024)
+            results[f"gallery_{kind}_{size}_file_mb"] = os.path.getsize(path) / (1024 * 1024)
+    return results
+
+
+def bench_server(face_detector, frames, timer, clients, encoding="raw"):
+    """Requests/s and latency of a loopback recognition server with 1 and `clients` concurrent clients"""
+    import threading
+    from recognition_client import RecognitionClient
+    from recognition_server import RecognitionServer
+
+    server = RecognitionServer(face_detector, port=0).start()
+    throughput = {}
+    try:
+        for count in sorted({1, clients}):
+            def client_loop(camera):
+                client = RecognitionClient(server.url, encoding=encoding)
+                for frame in frames:
+                    timer.time(f"server_request_{count}c", client.recognize, frame, camera=camera, mark=False)
+
+            threads = [threading.Thread(target=client_loop, args=(f"bench_{i}",)) for i in range(count)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            throughput[f"server_{count}_clients_req_per_s"] = count * len(frames) / elapsed if elapsed > 0 else None
+        throughput["server_mean_batch_size"] = server.processor.stats()["mean_batch_size"]
+    finally:
+        server.stop()
+    return throughput
+
+
+def bench_attendance(db_manager, timer, count):
+    started = time.perf_counter()
+    for i in range(count):
+        timer.time("mark_attendance", db_manager.mark_attendance, f"bench_{i}")
+    elapsed = time.perf_counter() - started
+    if db_manager.writer is not None:
+        timer.time("attendance_flush", db_manager.writer.flush)
+    return {"mark_attendance_per_s": count / elapsed if elapsed > 0 else None}
+
+
+def noisy(image, rng, amplitude=3):
+    """image plus small per-pixel noise, like a camera watching a still scene"""
+    noise = rng.integers(-amplitude, amplitude + 1, image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def bench_governor(face_detector, frames, timer, fps=30.0):
+    """Recognition on a simulated fps timeline with and without the frame governor.
+
+    The timeline is a still, empty scene with sensor noise followed by the given frames,
+    so the governor should idle through the first half and go active for the second.
+    Reports the share of frames processed and CPU time spent either way.
+    """
+    from frame_governor import FrameGovernor
+    from video_frame import Frame
+
+    rng = np.random.default_rng(1)
+    still = np.full(frames[0].shape, 90, dtype=np.uint8)
+    timeline = [noisy(still, rng) for _ in frames] + list(frames)
+
+    results = {}
+    for governed in (False, True):
+        governor = FrameGovernor() if governed else None
+        tracker = face_detector.create_tracker()
+        prefilter = face_detector.create_prefilter()
+        cpu_started = time.process_time()
+        processed = 0
+        for i, image in enumerate(timeline):
+            frame = Frame(image, i)
+            now = i / fps
+            if governor is not None:
+                if not timer.time("governor_check", governor.should_process, frame, now):
+                    continue
+            started, frame_cpu = time.perf_counter(), time.thread_time()
+            faces = face_detector.process_attendance(frame, None, tracker=tracker, prefilter=prefilter)
+            if governor is not None:
+                governor.record(time.perf_counter() - started, time.thread_time() - frame_cpu, len(faces), now)
+            processed += 1
+        label = "governed" if governed else "ungoverned"
+        results[f"{label}_processed_pct"] = processed / len(timeline) * 100
+        results[f"{label}_cpu_s"] = time.process_time() - cpu_started
+    return results
+
+
+def bench_metrics_overhead(iterations=200000):
+    """Per-call cost of a stage timer with metrics disabled and enabled"""
+    from metrics import metrics
+    overhead = {}
+    was_enabled = metrics.enabled
+    for enabled in (False, True):
+        metrics.enabled = enabled
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with metrics.timer("overhead_probe"):
+                pass
+        overhead[f"metrics_timer_{'enabled' if enabled else 'disabled'}_ns"] = \
+            (time.perf_counter() - started) / iterations * 1e9
+    metrics.enabled = was_enabled
+    return overhead
+
+
+def bench_logging_overhead(iterations=50000):
+    """Per-event cost of a hot-path log line: plain, rate-limited, and below the logger level.
+
+    Records go through the same bounded queue and batched listener as the app log, but
+    into a temporary file, so the plain case also shows how many records get dropped.
+    """
+    import logging
+    from queue import Queue
+    from loges import LOG_QUEUE_SIZE, DroppingQueueHandler, HotPathLog, LoggingThread
+
+    overhead = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, "benchmark-log.txt")
+        log_queue = Queue(maxsize=LOG_QUEUE_SIZE)
+        queue_handler = DroppingQueueHandler(log_queue)
+        listener = LoggingThread(log_queue, log_path, console=False, queue_handler=queue_handler)
+        listener.start()
+        bench_logger = logging.getLogger("FileSharing:Benchmark")
+        bench_logger.propagate = False
+        bench_logger.addHandler(queue_handler)
+        hot_log = HotPathLog(bench_logger)
+
+        def plain(distance):
+            bench_logger.debug(f"Unknown face detected (distance: {distance:.3f})")
+
+        def rate_limited(distance):
+            hot_log.debug("unknown_face", "Unknown face detected (distance: %.3f)", distance)
+
+        try:
+            for name, emit, level in (("plain", plain, logging.DEBUG),
+                                      ("rate_limited", rate_limited, logging.DEBUG),
+                                      ("disabled", plain, logging.INFO)):
+                bench_logger.setLevel(level)
+                started = time.perf_counter()
+                for i in range(iterations):
+                    emit(i / iterations)
+                overhead[f"logging_{name}_ns"] = (time.perf_counter() - started) / iterations * 1e9
+        finally:
+            bench_logger.removeHandler(queue_handler)
+            listener.stop()
+        overhead["logging_dropped_records"] = queue_handler.dropped
+        overhead["logging_written_kb"] = os.path.getsize(log_path) / 1024
+    return overhead
+
+
+def compare(current, baseline, tolerance):
+    """Return (stage, baseline_p50, current_p50, ratio) for stages slower than the tolerance"""
+    regressions = []
+    for stage, stats in current["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base or not base.get("p50_ms"):
+            continue
+        ratio = stats["p50_ms"] / base["p50_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append((stage, base["p50_ms"], stats["p50_ms"], ratio))
+    return regressions
+
+
+def run(args):
+    from database_manager import DatabaseManager
+    from metrics import metrics
+
+    timer = StageTimer()
+    overhead = bench_metrics_overhead()
+    overhead.update(bench_logging_overhead())
+    metrics.reset()
+    metrics.enabled = args.metrics
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processor": platform.processor(),
+            "frames": args.frames,
+            "source": args.recorded or "synthetic",
+            "gallery_sizes": args.gallery_sizes
+        },
+        "throughput": {}
+    }
+
+    with tempfile.TemporaryDirectory() as storage_path:
+        attendance_config = {"attendance": {"backend": args.backend}}
+        db_manager = DatabaseManager(storage_path, attendance_config)
+        try:
+            if not args.skip_detector:
+                from face_detector import FaceDetector
+                config = {"tracking": {"enabled": args.tracking}, "index": {"type": args.index},
+                          "prefilter": {"enabled": args.prefilter}}
+                face_detector = FaceDetector(storage_path, config)
+                frames = (recorded_frames(args.recorded, args.frames) if args.recorded
+                          else synthetic_frames(args.frames))
+                logger.info(f"Benchmarking detector on {len(frames)} frames")
+                results["throughput"].update(bench_frame_path(frames, timer))
+                results["throughput"].update(
+                    bench_descriptor_batches(face_detector, frames, timer, args.descriptor_batches))
+                results["throughput"].update(
+                    bench_detector(face_detector, frames, timer, args.gallery_sizes, db_manager))
+                if args.governor:
+                    logger.info("Benchmarking the frame governor on a still-then-busy timeline")
+                    results["throughput"].update(bench_governor(face_detector, frames, timer))
+                if args.server:
+                    logger.info(f"Benchmarking loopback recognition server with {args.server_clients} clients")
+                    results["throughput"].update(
+                        bench_server(face_detector, frames, timer, args.server_clients, args.server_encoding))
+            if args.gallery_load:
+                logger.info("Benchmarking gallery load from the encoding store and embedding files")
+                results["throughput"].update(bench_gallery_load(timer, args.gallery_sizes, storage_path))
+            results["throughput"].update(bench_attendance(db_manager, timer, args.marks))
+        finally:
+            db_manager.close()
+
+    results["throughput"].update(overhead)
+    if args.metrics:
+        results["metrics"] = metrics.snapshot()
+    results["stages"] = timer.summary()
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def print_report(results):
+    print(f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<28}{stats['count']:>7}{stats['p50_ms']:>10.3f}{stats['p90_ms']:>10.3f}"
+              f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+    for name, value in results["throughput"].items():
+        print(f"{name}: {value:.1f}" if value is not None else f"{name}: n/a")
+    if results["peak_rss_mb"] is not None:
+        print(f"peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detection, encoding, matching and logging hot path")
+    parser.add_argument("--frames", type=int, default=50, help="frames per detector run")
+    parser.add_argument("--recorded", help="video file or image directory to use instead of synthetic frames")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=DEFAULT_GALLERY_SIZES)
+    parser.add_argument("--index", default="brute", choices=["brute", "ivf"])
+    parser.add_argument("--tracking", action="store_true", help="enable the face tracker during recognition")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="skip duplicate frames and low-quality faces before encoding")
+    parser.add_argument("--descriptor-batches", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="faces per descriptor call to compare")
+    parser.add_argument("--gallery-load", action="store_true",
+                        help="time gallery startup from the encoding store vs mapped embedding files")
+    parser.add_argument("--governor", action="store_true",
+                        help="compare recognition with and without the motion-gated frame governor")
+    parser.add_argument("--server", action="store_true",
+                        help="also time recognition through a loopback recognition server")
+    parser.add_argument("--server-clients", type=int, default=4, help="concurrent clients for --server")
+    parser.add_argument("--server-encoding", default="raw", choices=["raw", "jpeg"],
+                        help="how --server clients send frames")
+    parser.add_argument("--marks", type=int, default=2000, help="attendance marks to time")
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "csv"])
+    parser.add_argument("--metrics", action="store_true", help="run with hot-path metrics enabled")
+    parser.add_argument("--skip-detector", action="store_true", help="only benchmark attendance logging")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p50 slowdown vs baseline")
+    args = parser.parse_args()
+
+    try:
+        results = run(args)
+        print_report(results)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {args.output}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, args.tolerance)
+            for stage, base, current, ratio in regressions:
+                print(f"REGRESSION {stage}: p50 {base:.3f} ms -> {current:.3f} ms ({ratio:.2f}x)")
+            if regressions:
+                return 1
+            print("No regressions against baseline")
+        return 0
+    finally:
+        stop_logging_thread()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from encoding_store import MODEL_HASH_CACHE, EncodingStore, model_identity
+from face_models import PREDICTOR_MODEL, RECOGNITION_MODEL, load_models
+from face_gallery import reset_person_directory
+from face_quality import score_face, select_templates
+from loges import logger, stop_logging_thread
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+_worker_models = None
+
+
+def _init_worker(predictor_path, recognition_model_path):
+    """Load the dlib models once per worker process"""
+    global _worker_models
+    _worker_models = load_models(predictor_path, recognition_model_path)
+
+
+def largest_face(faces):
+    """The face enrolled from a photo with several: the largest, whatever order dlib found them in"""
+    return max(faces, key=lambda rect: rect.width() * rect.height())
+
+
+def _encode_image(path, crop_padding=None, quality_settings=None):
+    """Encode the largest face in an image file.
+
+    Returns (encoding, crop_jpeg, quality, error), quality being the face_quality
+    score of the face. The face crop is only produced when crop_padding is given.
+    """
+    detector, predictor, face_rec_model = (_worker_models.detector, _worker_models.predictor,
+                                           _worker_models.face_rec_model)
+    try:
+        image = cv2.imread(path)
+        if image is None:
+            return None, None, None, "unreadable image"
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces, scores, _ = detector.run(gray, 0)
+        if len(faces) == 0:
+            return None, None, None, "no face found"
+        face = largest_face(faces)
+        shape = predictor(gray, face)
+        encoding = np.array(face_rec_model.compute_face_descriptor(image, shape))
+
+        x, y, w, h = face.left(), face.top(), face.width(), face.height()
+        quality = score_face(gray, (x, y, w, h), shape, scores[list(faces).index(face)], quality_settings)
+        crop = None
+        if crop_padding is not None:
+            face_image = image[max(0, y-crop_padding):y+h+crop_padding,
+                               max(0, x-crop_padding):x+w+crop_padding]
+            ok, buffer = cv2.imencode(".jpg", face_image)
+            crop = buffer.tobytes() if ok else None
+        return encoding, crop, quality, None
+    except Exception as e:
+        return None, None, None, str(e)
+
+
+class ParallelEncoder:
+    """Fans face encoding out over a process pool whose workers load the models once"""
+
+    def __init__(self, predictor_path, recognition_model_path, workers=None):
+        self.predictor_path = predictor_path
+        self.recognition_model_path = recognition_model_path
+        self.workers = workers or os.cpu_count() or 1
+
+    def map(self, paths, crop_padding=None, progress=None, quality_settings=None):
+        """Yield (index, encoding, crop_jpeg, quality, error) as each image finishes, in completion order"""
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.predictor_path, self.recognition_model_path)) as pool:
+            futures = {pool.submit(_encode_image, path, crop_padding, quality_settings): i
+                       for i, path in enumerate(paths)}
+            for done, future in enumerate(as_completed(futures), 1):
+                encoding, crop, quality, error = future.result()
+                if progress:
+                    progress(done, len(paths))
+                yield futures[future], encoding, crop, quality, error
+
+    def encode_files(self, paths):
+        """Encode image files in parallel, returning one encoding (or None) per path"""
+        encodings = [None] * len(paths)
+        for index, encoding, _, _, error in self.map(paths):
+            encodings[index] = encoding
+            if error:
+                logger.warning(f"Failed to encode {paths[index]}: {error}")
+        return encodings
+
+
+class ProgressReporter:
+    """Prints a single updating progress line at most once per interval"""
+
+    def __init__(self, label, interval=1.0):
+        self.label = label
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last = 0.0
+
+    def __call__(self, done, total):
+        now = time.perf_counter()
+        if done < total and now - self.last < self.interval:
+            return
+        self.last = now
+        rate = done / max(now - self.started, 1e-9)
+        sys.stderr.write(f"\r{self.label}: {done}/{total} ({rate:.1f} images/s)")
+        if done == total:
+            sys.stderr.write("\n")
+        sys.stderr.flush()
+
+
+def read_enrollment_list(source):
+    """Return [(name, image_path)] from a CSV of name,path rows or a directory.
+
+    In a directory, name.jpg is enrolled as "name" and every image in a
+    subdirectory name/ is a candidate photo for "name".
+    """
+    entries = []
+    if os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 2 or row[0].strip().lower() == "name":
+                    continue
+                path = row[1].strip()
+                entries.append((row[0].strip(), path if os.path.isabs(path) else os.path.join(base_dir, path)))
+        return entries
+
+    for entry in sorted(os.listdir(source)):
+        path = os.path.join(source, entry)
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    entries.append((entry, os.path.join(path, filename)))
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            entries.append((os.path.splitext(entry)[0], path))
+    return entries
+
+
+def bulk_enroll(entries, storage_path, encoder, padding=20, save_every=500, templates_per_person=5,
+                quality_settings=None):
+    """Encode enrollment photos in parallel and write face crops and encodings to storage.
+
+    Each person is enrolled like a registration burst: their photos are scored with
+    face_quality and the best templates_per_person that pass the quality gate are
+    written to faces/<name>/NN.jpg, replacing any earlier templates. Ties keep input
+    order, so the result doesn't depend on which worker finishes first. A person is
+    written out as soon as all of their photos are encoded. Returns (enrolled, failed)
+    counts.
+    """
+    faces_dir = os.path.join(storage_path, "faces")
+    os.makedirs(faces_dir, exist_ok=True)
+    store = EncodingStore(os.path.join(storage_path, "face_encodings.npz"),
+                          model_identity([encoder.predictor_path, encoder.recognition_model_path],
+                                         os.path.join(storage_path, MODEL_HASH_CACHE)))
+    store.load()
+
+    pending = {}
+    for name, _ in entries:
+        pending[name] = pending.get(name, 0) + 1
+    candidates = {}
+    enrolled = set()
+    failed = 0
+    paths = [path for _, path in entries]
+    progress = ProgressReporter("Enrolling")
+    for index, encoding, crop, quality, error in encoder.map(paths, crop_padding=padding, progress=progress,
+                                                             quality_settings=quality_settings):
+        name, source_path = entries[index]
+        pending[name] -= 1
+        if error or crop is None:
+            failed += 1
+            logger.warning(f"Skipping {source_path} for {name}: {error or 'could not crop face'}")
+        else:
+            candidates.setdefault(name, []).append(
+                {"index": index, "encoding": encoding, "crop": crop, "quality": quality})
+        if pending[name] or name not in candidates:
+            continue
+
+        person = sorted(candidates.pop(name), key=lambda c: c["index"])
+        templates = select_templates(person, templates_per_person, quality_settings)
+        if not templates:
+            best = max(c["quality"]["score"] for c in person)
+            logger.warning(f"No photo passed the quality gate for {name} "
+                           f"({len(person)} candidates, best score {best:.2f})")
+            continue
+
+        try:
+            person_dir = reset_person_directory(faces_dir, name)
+        except ValueError as e:
+            logger.warning(f"Skipping {len(person)} photos: {str(e)}")
+            continue
+        store.remove_name(name)
+        for i, template in enumerate(templates):
+            file_path = os.path.join(person_dir, f"{i:02d}.jpg")
+            with open(file_path, 'wb') as f:
+                f.write(template["crop"])
+            store.put(file_path, name, template["encoding"])
+        enrolled.add(name)
+        if len(enrolled) % save_every == 0:
+            store.save()
+
+    if store.dirty:
+        store.save()
+    missing = {name for name, _ in entries} - enrolled
+    for name in sorted(missing):
+        logger.warning(f"No usable photo for {name}")
+    return len(enrolled), failed
+
+
+def main():
+    from face_detector import get_resource_path
+
+    parser = argparse.ArgumentParser(description="Bulk enroll faces or re-index the encoding store in parallel")
+    parser.add_argument("source", nargs="?", help="directory of photos or CSV of name,image_path rows")
+    parser.add_argument("--storage", help="storage directory (defaults to the configured location)")
+    parser.add_argument("--reindex", action="store_true", help="re-encode every image already in faces/")
+    parser.add_argument("--workers", type=int, help="worker processes (defaults to CPU count)")
+    args = parser.parse_args()
+    if not args.source and not args.reindex:
+        parser.error("a source is required unless --reindex is given")
+
+    from constant import ConfigManager
+    config = ConfigManager().get_config()
+    storage_path = args.storage or config.get('save_to_directory') or os.getcwd()
+    enrollment = config.get("enrollment", {})
+
+    encoder = ParallelEncoder(get_resource_path(PREDICTOR_MODEL), get_resource_path(RECOGNITION_MODEL), args.workers)
+    started = time.perf_counter()
+    try:
+        if args.source:
+            entries = read_enrollment_list(args.source)
+            logger.info(f"Bulk enrolling {len(entries)} photos with {encoder.workers} workers")
+            enrolled, failed = bulk_enroll(entries, storage_path, encoder,
+                                           templates_per_person=int(enrollment.get("templates_per_person", 5)),
+                                           quality_settings=enrollment.get("quality", {}))
+            print(f"Enrolled {enrolled} people, skipped {failed} bad photos "
+                  f"in {time.perf_counter() - started:.1f}s")
+
+        if args.reindex:
+            faces_dir = os.path.join(storage_path, "faces")
+            store = EncodingStore(os.path.join(storage_path, "face_encodings.npz"),
+                                  model_identity([encoder.predictor_path, encoder.recognition_model_path],
+                                                 os.path.join(storage_path, MODEL_HASH_CACHE)))
+            names, _ = store.sync(faces_dir, encoder.encode_files, rebuild=True)
+            print(f"Re-indexed {len(names)} faces in {time.perf_counter() - started:.1f}s")
+    finally:
+        stop_logging_thread()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -13,6 +13,94 @@ class ConfigManager(QThread):
         self.config_file_name = ".config.json"
         self.current_version = "1.0.0"
         self.config_file = self.get_config_file_path()
+        self.default_settings = {
+            "cameras": [
+                {"name": "Camera 1", "source": 0}
+            ],
+            "index": {
+                "type": "ivf",
+                "nprobe": 8,
+                "nlist": 0,
+                "min_size": 5000
+            },
+            "gallery": {
+                "watch": True,
+                "watch_interval": 2.0,
+                "full_scan_interval": 300.0,
+                "embedding_file": True,
+                "embedding_dtype": "float32"
+            },
+            "tracking": {
+                "enabled": True,
+                "iou_threshold": 0.3,
+                "max_missed": 5,
+                "reverify_every": 15
+            },
+            "prefilter": {
+                "enabled": True,
+                "min_face_size": 40,
+                "min_sharpness": 10.0,
+                "min_brightness": 40,
+                "max_brightness": 230,
+                "duplicate_threshold": 1.5,
+                "max_duplicate_frames": 15
+            },
+            "governor": {
+                "enabled": True,
+                "idle_fps": 2.0,
+                "active_fps": 0,
+                "motion_threshold": 10,
+                "motion_fraction": 0.01,
+                "active_hold": 3.0,
+                "budget_ms": 150
+            },
+            "detection": {
+                "scale": 1.0,
+                "upsample": 0,
+                "roi": None
+            },
+            "attendance": {
+                "backend": "auto",
+                "async_writes": True,
+                "flush_max_batch": 50,
+                "flush_interval": 1.0
+            },
+            "encoding": {
+                "max_batch": 32
+            },
+            "enrollment": {
+                "parallel_threshold": 50,
+                "workers": 0,
+                "burst_frames": 15,
+                "templates_per_person": 5,
+                "match_mode": "centroid",
+                "quality": {
+                    "target_face_size": 120,
+                    "target_sharpness": 120.0,
+                    "target_detection_score": 1.5,
+                    "min_face_size": 60,
+                    "min_quality": 0.4
+                }
+            },
+            "metrics": {
+                "enabled": False,
+                "format": "json",
+                "export_path": "",
+                "interval": 10,
+                "overlay": False
+            },
+            "server": {
+                "enabled": False,
+                "url": "http://127.0.0.1:8765",
+                "encoding": "raw",
+                "host": "127.0.0.1",
+                "port": 8765,
+                "unix_socket": "",
+                "workers": 2,
+                "max_batch": 8,
+                "max_wait_ms": 5
+            }
+        }
 
     def get_config_file_path(self):
         if platform.system() == 'Windows':
@@ -47,6 +135,20 @@ class ConfigManager(QThread):
         logger.info(f"Default path determined: {file_path}")
         return file_path
 
+    def apply_default_settings(self, data):
+        """Fill in any settings missing from data, returning True if something was added"""
+        changed = False
+        for key, value in self.default_settings.items():
+            if key not in data:
+                data[key] = json.loads(json.dumps(value))
+                changed = True
+            elif isinstance(value, dict) and isinstance(data[key], dict):
+                for sub_key, sub_value in value.items():
+                    if sub_key not in data[key]:
+                        data[key][sub_key] = json.loads(json.dumps(sub_value))
+                        changed = True
+        return changed
+
     def write_config(self, data):
         with open(self.config_file, 'w') as file:
             json.dump(data, file, indent=4)
@@ -70,6 +172,7 @@ class ConfigManager(QThread):
                 "version": self.current_version,
                 "save_to_directory": file_path
             }
+            self.apply_default_settings(default_config)
             self.write_config(default_config)
             logger.info("Created new configuration file.")
         else:
@@ -82,9 +185,12 @@ class ConfigManager(QThread):
                     "version": self.current_version,
                     "save_to_directory": save_to_directory
                 }
+                self.apply_default_settings(default_config)
                 self.write_config(default_config)
+            elif self.apply_default_settings(config_data):
+                logger.info("Added missing settings to configuration.")
+                self.write_config(config_data)
             else:
                 logger.info(f"Loaded configuration: {config_data}")
                 self.config_updated.emit(config_data)
         self.config_ready.emit()
-        self.config_ready.emit()
@@ -1,18 +1,27 @@
-import pandas as pd
 from datetime import datetime
 import os
+import threading
 from loges import logger
+from attendance_store import create_attendance_store, AttendanceWriter
+from attendance_reports import AttendanceReports
+from metrics import metrics
 
 class DatabaseManager:
-    def __init__(self, storage_path=None):
+    def __init__(self, storage_path=None, config=None):
         self.storage_path = storage_path or os.getcwd()
+        self.config = config or {}
         self.attendance_file = os.path.join(self.storage_path, "attendance.csv")
         logger.info(f"Database manager initialized with storage path: {self.storage_path}")
-        
+
         self.logged_attendance_today = set()
+        self.lock = threading.Lock()
+        self.closed = False
         self.current_date = datetime.now().strftime('%Y-%m-%d')
-        
+
         self.initialize_attendance_file()
+        self.marked_today = self.store.marked_on(self.current_date)
+        self.marked_other_dates = {}
+        logger.info(f"{len(self.marked_today)} people already marked today")
 
     def _check_and_update_date(self):
         """Check if date has changed and reset logged attendance tracking"""
@@ -20,43 +29,88 @@ class DatabaseManager:
         if current_date != self.current_date:
             self.current_date = current_date
             self.logged_attendance_today.clear()
+            self.marked_today = self.marked_other_dates.pop(current_date, None)
+            if self.marked_today is None:
+                self.marked_today = self.store.marked_on(current_date)
+
+    def _marked_on(self, date):
+        """Names already marked on date, loaded from the store once per date"""
+        if date == self.current_date:
+            return self.marked_today
+        if date not in self.marked_other_dates:
+            self.marked_other_dates[date] = self.store.marked_on(date)
+        return self.marked_other_dates[date]
 
     def initialize_attendance_file(self):
         os.makedirs(self.storage_path, exist_ok=True)
         logger.info(f"Ensured storage directory exists: {self.storage_path}")
-        
-        if not os.path.exists(self.attendance_file):
-            df = pd.DataFrame(columns=['Name', 'Date', 'Time'])
-            df.to_csv(self.attendance_file, index=False)
-            logger.info(f"Created new attendance file: {self.attendance_file}")
-        else:
-            logger.info(f"Using existing attendance file: {self.attendance_file}")
-
-    def mark_attendance(self, name):
+
+        settings = self.config.get("attendance", {})
+        self.store = create_attendance_store(self.storage_path, settings)
+        self.writer = None
+        if settings.get("async_writes", True):
+            self.writer = AttendanceWriter(self.store,
+                                           max_batch=settings.get("flush_max_batch", 50),
+                                           max_delay=settings.get("flush_interval", 1.0))
+            self.writer.start()
+
+    def mark_attendance(self, name, when=None):
+        """Record attendance for name at when (default now), once per person per day"""
+        with metrics.timer("mark_attendance"), self.lock:
+            return self._mark_attendance(name, when)
+
+    def _mark_attendance(self, name, when):
+        if self.closed:
+            # Replaced by a new manager; the mark is made there once the workers switch over
+            return False
         try:
             self._check_and_update_date()
-            
-            df = pd.read_csv(self.attendance_file)
-            now = datetime.now()
+
+            now = when or datetime.now()
             date = now.strftime('%Y-%m-%d')
             time = now.strftime('%H:%M:%S')
-            
-            today_attendance = df[(df['Name'] == name) & (df['Date'] == date)]
-            if len(today_attendance) == 0:
-                new_row = pd.DataFrame([{
-                    'Name': name,
-                    'Date': date,
-                    'Time': time
-                }])
-                df = pd.concat([df, new_row], ignore_index=True)
-                df.to_csv(self.attendance_file, index=False)
+            marked = self._marked_on(date)
+
+            if name not in marked:
+                metrics.count("attendance_marked")
+                if self.writer is not None:
+                    self.writer.submit((name, date, time))
+                    metrics.gauge("attendance_pending", self.writer.pending_count)
+                else:
+                    self.store.append([(name, date, time)])
+                marked.add(name)
                 logger.info(f"Attendance marked for {name} at {date} {time}")
                 return True
             else:
-                if name not in self.logged_attendance_today:
+                if date == self.current_date and name not in self.logged_attendance_today:
                     logger.info(f"Attendance already marked for {name} today")
                     self.logged_attendance_today.add(name)
                 return False
         except Exception as e:
             logger.error(f"Error marking attendance: {str(e)}")
             return False
+
+    def stats(self):
+        """Return pending and flushed attendance record counts"""
+        if self.writer is None:
+            return {"pending": 0, "flushed": None}
+        return {"pending": self.writer.pending_count, "flushed": self.writer.flushed}
+
+    def reports(self, expected=None, flush_timeout=10.0):
+        """Report queries over this manager's store, after flushing pending marks.
+
+        If the marks cannot be written within flush_timeout, the reports cover what
+        is already stored and a warning says how many marks are missing.
+        """
+        if self.writer is not None and not self.writer.flush(flush_timeout):
+            error = f": {self.writer.last_error}" if self.writer.last_error else ""
+            logger.warning(f"Attendance reports exclude {self.writer.pending_count} marks "
+                           f"not yet written{error}")
+        return AttendanceReports(self.store, expected)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        if self.writer is not None:
+            self.writer.close()
+        self.store.close()
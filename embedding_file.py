@@ -0,0 +1,256 @@
+import os
+import struct
+import numpy as np
+from loges import logger
+
+MAGIC = b"FACEEMB\x00"
+EMBEDDING_FILE_VERSION = 1
+HEADER = struct.Struct("<8sIIIIQQ32s")
+HEADER_SIZE = 128
+ALIGNMENT = 64
+DTYPES = {"float32": 0, "int8": 1}
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(dtype, rows, dim, name_count):
+    """Byte offsets of each section; every section starts on a 64-byte boundary"""
+    sections = [("matrix", np.int8 if dtype == "int8" else np.float32, (rows, dim))]
+    if dtype == "int8":
+        sections.append(("scales", np.float32, (rows,)))
+    sections += [("sq_norms", np.float32, (rows,)),
+                 ("name_ids", np.uint32, (rows,)),
+                 ("name_offsets", np.uint64, (name_count + 1,))]
+    layout = {}
+    offset = HEADER_SIZE
+    for name, section_dtype, shape in sections:
+        layout[name] = (offset, section_dtype, shape)
+        offset = _aligned(offset + int(np.prod(shape)) * np.dtype(section_dtype).itemsize)
+    layout["names"] = (offset, np.uint8, None)
+    return layout
+
+
+def quantize_rows(matrix):
+    """Symmetric per-row int8 quantization, returning (rows, scales)"""
+    scales = np.abs(matrix).max(axis=1, initial=0) / 127
+    scales[scales == 0] = 1
+    quantized = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def write_embedding_file(path, names, matrix, digest=b"", dtype="float32"):
+    """Write gallery rows and their names to path, replacing it atomically.
+
+    names holds one name per row; each distinct name is stored once in the name
+    table and rows refer to it by id. digest (up to 32 bytes) identifies the data
+    the rows were built from, so readers can tell whether the file is current.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {dtype}")
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if len(names):
+        matrix = matrix.reshape(len(names), -1)
+    else:
+        # reshape can't infer the width of zero rows; an empty gallery keeps whatever width it has
+        matrix = matrix.reshape(0, matrix.shape[-1] if matrix.ndim == 2 else 0)
+    rows, dim = matrix.shape
+
+    ids = {}
+    name_ids = np.fromiter((ids.setdefault(name, len(ids)) for name in names), dtype=np.uint32, count=rows)
+    encoded = [name.encode("utf-8") for name in ids]
+    name_offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+
+    sections = {"name_ids": name_ids, "name_offsets": name_offsets}
+    if dtype == "int8":
+        sections["matrix"], sections["scales"] = quantize_rows(matrix)
+        # Norms of the rows as they will be searched, i.e. after dequantization
+        dequantized = sections["matrix"].astype(np.float32) * sections["scales"][:, None]
+        sections["sq_norms"] = np.einsum('ij,ij->i', dequantized, dequantized)
+    else:
+        sections["matrix"] = matrix
+        sections["sq_norms"] = np.einsum('ij,ij->i', matrix, matrix)
+
+    layout = _layout(dtype, rows, dim, len(encoded))
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, EMBEDDING_FILE_VERSION, DTYPES[dtype], dim, len(encoded),
+                                rows, int(name_offsets[-1]), digest[:32]))
+            for section, (offset, section_dtype, _) in layout.items():
+                f.write(b"\0" * (offset - f.tell()))
+                if section == "names":
+                    f.write(b"".join(encoded))
+                else:
+                    f.write(np.ascontiguousarray(sections[section], dtype=section_dtype).tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class NameTable:
+    """Row names read from the mapped name table, decoded only when looked up"""
+
+    def __init__(self, name_ids, name_offsets, blob):
+        self.name_ids = name_ids
+        self.name_offsets = name_offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def name(self, name_id):
+        start, end = self.name_offsets[name_id], self.name_offsets[name_id + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __getitem__(self, row):
+        return self.name(int(self.name_ids[row]))
+
+    def __iter__(self):
+        return (self.name(int(name_id)) for name_id in self.name_ids)
+
+    def distinct(self):
+        return [self.name(i) for i in range(len(self.name_offsets) - 1)]
+
+
+class EmbeddingFile:
+    """A gallery written by write_embedding_file, opened with np.memmap.
+
+    float32 rows are searched straight from the mapping, so opening is near-instant and
+    every process that opens the file shares one copy through the page cache. int8
+    files are a quarter of the size on disk and are dequantized into memory on open.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, version, dtype_code, dim, name_count, rows, names_bytes, digest = HEADER.unpack(header)
+        if magic != MAGIC or version != EMBEDDING_FILE_VERSION:
+            raise ValueError(f"{path} is not a version {EMBEDDING_FILE_VERSION} embedding file")
+        self.dtype = {code: name for name, code in DTYPES.items()}[dtype_code]
+        self.digest = digest
+        self.dim = dim
+        self.people = name_count
+
+        layout = _layout(self.dtype, rows, dim, name_count)
+        names_offset = layout["names"][0]
+        if os.path.getsize(path) < names_offset + names_bytes:
+            raise ValueError(f"{path} is truncated")
+        sections = {}
+        for section, (offset, section_dtype, shape) in layout.items():
+            if section == "names":
+                shape = (names_bytes,)
+            # np.memmap cannot map zero bytes, so empty sections are plain arrays
+            sections[section] = (np.memmap(path, dtype=section_dtype, mode='r', offset=offset, shape=shape)
+                                 if int(np.prod(shape)) else np.zeros(shape, dtype=section_dtype))
+
+        if self.dtype == "int8":
+            self.matrix = sections["matrix"].astype(np.float32)
+            self.matrix *= sections["scales"][:, None]
+        else:
+            self.matrix = sections["matrix"]
+        self.sq_norms = sections["sq_norms"]
+        self.names = NameTable(sections["name_ids"], sections["name_offsets"], sections["names"])
+        self.max_templates = int(np.bincount(sections["name_ids"]).max()) if rows else 0
+
+    def __len__(self):
+        return len(self.names)
+
+
+def open_embedding_file(path, digest=None):
+    """Open path, or return None if it is missing, unreadable or (given digest) out of date"""
+    if not os.path.exists(path):
+        return None
+    try:
+        embeddings = EmbeddingFile(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading embedding file {path}, rebuilding: {str(e)}")
+        return None
+    if digest is not None and embeddings.digest != digest[:32].ljust(32, b"\0"):
+        return None
+    return embeddings
+
+
+LISTS_MAGIC = b"FACEIVF\x00"
+LISTS_VERSION = 1
+LISTS_HEADER = struct.Struct("<8sIIIIQ32s")
+
+
+class IVFLists:
+    """IVF centroids and list membership saved next to an embedding file.
+
+    order holds the gallery rows sorted by list and list i is order[bounds[i]:bounds[i + 1]];
+    order is mapped, so loading does not touch the rows of lists that are never probed.
+    nlist is the configured list count the lists were built for.
+    """
+
+    def __init__(self, centroids, bounds, order, nlist):
+        self.centroids = centroids
+        self.bounds = bounds
+        self.order = order
+        self.nlist = nlist
+
+
+def _lists_layout(centroid_count, dim, rows):
+    layout = {}
+    offset = HEADER_SIZE
+    for name, section_dtype, shape in (("centroids", np.float32, (centroid_count, dim)),
+                                       ("bounds", np.int64, (centroid_count + 1,)),
+                                       ("order", np.int64, (rows,))):
+        layout[name] = (offset, section_dtype, shape)
+        offset = _aligned(offset + int(np.prod(shape)) * np.dtype(section_dtype).itemsize)
+    return layout
+
+
+def write_ivf_lists(path, lists, digest=b""):
+    """Write lists to path, replacing it atomically; digest is that of the embedding file"""
+    centroids = np.ascontiguousarray(lists.centroids, dtype=np.float32)
+    sections = {"centroids": centroids, "bounds": lists.bounds, "order": lists.order}
+    layout = _lists_layout(len(centroids), centroids.shape[1], len(lists.order))
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(LISTS_HEADER.pack(LISTS_MAGIC, LISTS_VERSION, len(centroids), centroids.shape[1],
+                                      lists.nlist, len(lists.order), digest[:32]))
+            for section, (offset, section_dtype, _) in layout.items():
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(np.ascontiguousarray(sections[section], dtype=section_dtype).tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def open_ivf_lists(path, digest):
+    """Open lists written for the embedding file with digest, or None if missing or out of date"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(LISTS_HEADER.size)
+        if len(header) < LISTS_HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, version, centroid_count, dim, nlist, rows, stored_digest = LISTS_HEADER.unpack(header)
+        if magic != LISTS_MAGIC or version != LISTS_VERSION:
+            raise ValueError(f"{path} is not a version {LISTS_VERSION} IVF list file")
+        if stored_digest != digest[:32].ljust(32, b"\0"):
+            return None
+        layout = _lists_layout(centroid_count, dim, rows)
+        offset, _, shape = layout["order"]
+        if os.path.getsize(path) < offset + rows * 8:
+            raise ValueError(f"{path} is truncated")
+        sections = {section: (np.memmap(path, dtype=section_dtype, mode='r', offset=offset, shape=shape)
+                              if int(np.prod(shape)) else np.zeros(shape, dtype=section_dtype))
+                    for section, (offset, section_dtype, shape) in layout.items()}
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading IVF lists {path}, rebuilding: {str(e)}")
+        return None
+    return IVFLists(np.array(sections["centroids"]), np.array(sections["bounds"]), sections["order"], nlist)
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import numpy as np
+from loges import logger
+
+STORE_VERSION = 1
+ENCODING_SIZE = 128
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hash a file in chunks so large images don't need to be read at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+MODEL_HASH_CACHE = "model_hashes.json"
+_model_hashes = {}
+
+
+def _read_hash_cache(cache_path):
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading model hash cache {cache_path}: {str(e)}")
+        return {}
+
+
+def model_identity(model_paths, cache_path=None):
+    """Describe the model files an encoding was produced with, by size and content hash.
+
+    Hashes are cached in memory and in cache_path by path, size and mtime, so unchanged
+    models are not re-read. The mtime is not part of the identity itself: one-file
+    builds unpack the models afresh on every launch.
+    """
+    cache = _read_hash_cache(cache_path)
+    current = {}
+    identity = []
+    for path in model_paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            identity.append({"file": os.path.basename(path), "size": None, "sha256": None})
+            continue
+        key = os.path.abspath(path)
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        cached = _model_hashes.get(key) or cache.get(key)
+        if cached and cached["size"] == entry["size"] and cached["mtime_ns"] == entry["mtime_ns"]:
+            entry["sha256"] = cached["sha256"]
+        else:
+            entry["sha256"] = file_sha256(path)
+        current[key] = entry
+        identity.append({"file": os.path.basename(path), "size": stat.st_size, "sha256": entry["sha256"]})
+
+    _model_hashes.update(current)
+    if cache_path and current and cache != current:
+        try:
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(current, f, indent=2)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.error(f"Error writing model hash cache {cache_path}: {str(e)}")
+    return identity
+
+
+def template_name(key):
+    """Identity for a store key: faces/name.jpg is "name", faces/name/NN.jpg is one of name's templates"""
+    if "/" in key:
+        return key.split("/", 1)[0]
+    return os.path.splitext(key)[0]
+
+
+def list_face_images(faces_dir):
+    """Return {key: stat} for faces/*.jpg and the template images in faces/<name>/*.jpg"""
+    current = {}
+    for entry in os.scandir(faces_dir):
+        if entry.is_file() and entry.name.endswith(".jpg"):
+            current[entry.name] = entry.stat()
+        elif entry.is_dir():
+            for template in os.scandir(entry.path):
+                if template.is_file() and template.name.endswith(".jpg"):
+                    current[f"{entry.name}/{template.name}"] = template.stat()
+    return current
+
+
+class EncodingStore:
+    """On-disk cache of face encodings keyed by the source image in faces/"""
+
+    def __init__(self, store_path, model_id, faces_dir=None):
+        self.store_path = store_path
+        self.model_id = model_id
+        self.faces_dir = faces_dir or os.path.join(os.path.dirname(store_path), "faces")
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        self.entries = {}
+        if not os.path.exists(self.store_path):
+            logger.info(f"No encoding store found at {self.store_path}")
+            return False
+
+        try:
+            with np.load(self.store_path, allow_pickle=False) as data:
+                version = int(data['version'])
+                stored_model = json.loads(str(data['model']))
+                if version != STORE_VERSION:
+                    logger.info(f"Encoding store version {version} is outdated, rebuilding")
+                    return False
+                if stored_model != self.model_id:
+                    logger.info("Recognition models changed since encoding store was written, rebuilding")
+                    return False
+
+                files = data['files']
+                names = data['names']
+                mtimes = data['mtimes']
+                sizes = data['sizes']
+                hashes = data['hashes']
+                valid = data['valid']
+                encodings = data['encodings']
+
+            for i, filename in enumerate(files):
+                self.entries[str(filename)] = {
+                    "name": str(names[i]),
+                    "mtime_ns": int(mtimes[i]),
+                    "size": int(sizes[i]),
+                    "sha256": str(hashes[i]),
+                    "encoding": encodings[i].copy() if valid[i] else None
+                }
+            logger.info(f"Loaded {len(self.entries)} entries from encoding store {self.store_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error reading encoding store, rebuilding: {str(e)}")
+            self.entries = {}
+            return False
+
+    def save(self):
+        filenames = sorted(self.entries)
+        count = len(filenames)
+        encodings = np.zeros((count, ENCODING_SIZE), dtype=np.float64)
+        valid = np.zeros(count, dtype=bool)
+        for i, filename in enumerate(filenames):
+            encoding = self.entries[filename]["encoding"]
+            if encoding is not None:
+                encodings[i] = encoding
+                valid[i] = True
+
+        tmp_path = self.store_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    version=np.array(STORE_VERSION),
+                    model=np.array(json.dumps(self.model_id)),
+                    files=np.array(filenames, dtype=str),
+                    names=np.array([self.entries[f]["name"] for f in filenames], dtype=str),
+                    mtimes=np.array([self.entries[f]["mtime_ns"] for f in filenames], dtype=np.int64),
+                    sizes=np.array([self.entries[f]["size"] for f in filenames], dtype=np.int64),
+                    hashes=np.array([self.entries[f]["sha256"] for f in filenames], dtype=str),
+                    valid=valid,
+                    encodings=encodings
+                )
+            os.replace(tmp_path, self.store_path)
+            self.dirty = False
+            logger.info(f"Saved {count} entries to encoding store {self.store_path}")
+        except Exception as e:
+            logger.error(f"Error saving encoding store: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def key_for(self, path):
+        return os.path.relpath(path, self.faces_dir).replace(os.sep, "/")
+
+    def put(self, path, name, encoding):
+        """Record the encoding for an image file in faces/"""
+        stat = os.stat(path)
+        self.entries[self.key_for(path)] = {
+            "name": name,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": file_sha256(path),
+            "encoding": None if encoding is None else np.asarray(encoding, dtype=np.float64)
+        }
+        self.dirty = True
+
+    def remove_name(self, name):
+        """Forget every image enrolled for name, returning how many entries were dropped"""
+        keys = [key for key, entry in self.entries.items() if entry["name"] == name]
+        for key in keys:
+            del self.entries[key]
+        if keys:
+            self.dirty = True
+        return len(keys)
+
+    def sync(self, faces_dir, encode_files, rebuild=False):
+        """Bring the store in line with faces_dir, encoding only added or changed images.
+
+        encode_files takes a list of image paths and returns one encoding (or None) per path.
+        With rebuild, every image is re-encoded regardless of what the store holds.
+        """
+        self.faces_dir = faces_dir
+        self.load()
+        if rebuild:
+            self.entries = {}
+            self.dirty = True
+
+        current = list_face_images(faces_dir)
+
+        removed = [f for f in self.entries if f not in current]
+        for filename in removed:
+            del self.entries[filename]
+            self.dirty = True
+
+        to_encode = []
+        for filename, stat in current.items():
+            entry = self.entries.get(filename)
+            if entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                continue
+
+            path = os.path.join(faces_dir, filename)
+            if entry is not None and entry["size"] == stat.st_size and entry["sha256"] == file_sha256(path):
+                entry["mtime_ns"] = stat.st_mtime_ns
+                self.dirty = True
+                continue
+
+            to_encode.append(filename)
+
+        if to_encode:
+            logger.info(f"Encoding {len(to_encode)} new or changed face images")
+            paths = [os.path.join(faces_dir, f) for f in to_encode]
+            for filename, path, encoding in zip(to_encode, paths, encode_files(paths)):
+                name = template_name(filename)
+                self.put(path, name, encoding)
+                if encoding is None:
+                    logger.warning(f"Failed to load face encoding for {name}")
+
+        logger.info(f"Encoding store sync: {len(current)} images, {len(to_encode)} encoded, {len(removed)} removed")
+
+        if self.dirty:
+            self.save()
+
+        return self.valid_entries()
+
+    def valid_entries(self):
+        """Return (names, encodings) for every entry with a usable encoding"""
+        names = []
+        encodings = []
+        for filename in sorted(self.entries):
+            entry = self.entries[filename]
+            if entry["encoding"] is not None:
+                names.append(entry["name"])
+                encodings.append(entry["encoding"])
+        return names, encodings
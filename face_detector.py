@@ -3,8 +3,18 @@ import dlib
 import numpy as np
 import os
 import sys
+import threading
 from datetime import datetime
-from loges import logger
+from loges import hot_log, logger
+from encoding_store import MODEL_HASH_CACHE, model_identity
+from face_gallery import FaceGallery, GalleryWatcher
+from face_models import PREDICTOR_MODEL, RECOGNITION_MODEL, load_models
+from face_quality import FramePrefilter, score_face, select_templates
+from face_tracker import FaceTracker
+from bulk_enroll import ParallelEncoder, largest_face
+from metrics import metrics
+from video_frame import as_frame
+from face_overlay import draw_results
 
 def get_resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -13,33 +23,106 @@ def get_resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 class FaceDetector:
-    def __init__(self, storage_path=None):
+    def __init__(self, storage_path=None, config=None):
         self.storage_path = storage_path or os.getcwd()
-        self.faces_dir = os.path.join(self.storage_path, "faces")
+        self.config = config or {}
         logger.info(f"Face detector initialized with storage path: {self.storage_path}")
         
-        self.known_face_encodings = []
-        self.known_face_names = []
+        self.match_threshold = 0.6
+        self.lock = threading.RLock()
+        self.apply_config(self.config)
+        self.burst_remaining = 0
+        self.burst_candidates = None
         self.face_locations = []
         self.face_encodings = []
         
         self.logged_faces_today = set()
         self.current_date = datetime.now().strftime('%Y-%m-%d')
         
-        self.detector = dlib.get_frontal_face_detector()
+        self.models = load_models(get_resource_path(PREDICTOR_MODEL), get_resource_path(RECOGNITION_MODEL))
+        self.detector = self.models.detector
+        self.predictor = self.models.predictor
+        self.face_rec_model = self.models.face_rec_model
+        self.model_lock = self.models.lock
+        self.predictor_path = self.models.predictor_path
+        self.recognition_model_path = self.models.recognition_model_path
         
-        predictor_path = get_resource_path("models/shape_predictor_68_face_landmarks.dat")
-        recognition_model_path = get_resource_path("models/dlib_face_recognition_resnet_model_v1.dat")
-        
-        logger.info(f"Loading predictor from: {predictor_path}")
-        logger.info(f"Loading recognition model from: {recognition_model_path}")
-        
-        self.predictor = dlib.shape_predictor(predictor_path)
-        self.face_rec_model = dlib.face_recognition_model_v1(recognition_model_path)
-        
-        self.load_known_faces()
-        self.current_frame = None
-        self.current_face_coords = None
+        self.watcher = None
+        self.gallery = self.create_gallery(self.storage_path)
+        self.gallery.load()
+        self.current_snapshot = None
+
+    def apply_config(self, config):
+        """Read the detection, enrollment, tracking and pre-filter settings from config"""
+        self.config = config
+        detection = config.get("detection", {})
+        self.detection_scale = float(detection.get("scale", 1.0))
+        self.detection_upsample = int(detection.get("upsample", 0))
+        self.detection_roi = detection.get("roi")
+
+        enrollment = config.get("enrollment", {})
+        self.burst_frames = int(enrollment.get("burst_frames", 15))
+        self.templates_per_person = int(enrollment.get("templates_per_person", 5))
+        self.match_mode = enrollment.get("match_mode", "centroid")
+        self.quality_settings = enrollment.get("quality", {})
+
+        encoding = config.get("encoding", {})
+        self.descriptor_batch = max(1, int(encoding.get("max_batch", 32)))
+
+        gallery = config.get("gallery", {})
+        self.embedding_dtype = gallery.get("embedding_dtype", "float32") if gallery.get("embedding_file", True) else None
+
+        self.tracker = self.create_tracker()
+        self.prefilter = self.create_prefilter()
+
+    def create_gallery(self, storage_path):
+        model_id = model_identity([self.predictor_path, self.recognition_model_path],
+                                  os.path.join(storage_path, MODEL_HASH_CACHE))
+        return FaceGallery(storage_path, model_id, self.encode_image_files,
+                           self.config.get("index"), self.match_mode, self.embedding_dtype)
+
+    def reconfigure(self, storage_path, config):
+        """Apply new settings without reloading the models.
+
+        The gallery is only rebuilt when the storage location or the gallery
+        settings changed; the new one is loaded before it replaces the old, so
+        recognition continues against the old gallery meanwhile.
+        """
+        previous = (self.storage_path, self.config.get("index"), self.match_mode, self.embedding_dtype)
+        self.apply_config(config)
+        if (storage_path, config.get("index"), self.match_mode, self.embedding_dtype) != previous:
+            logger.info(f"Switching face gallery to storage path: {storage_path}")
+            gallery = self.create_gallery(storage_path)
+            gallery.load()
+            self.storage_path = storage_path
+            self.gallery = gallery
+
+    def start_watching(self, interval=2.0, full_interval=300.0):
+        """Poll faces/ in the background and apply identities added or removed by other processes"""
+        self.stop_watching()
+        self.watcher = GalleryWatcher(lambda full: self.gallery.refresh(full), interval, full_interval)
+        self.watcher.start()
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def create_tracker(self):
+        """Build a face tracker from the "tracking" config section, or None when disabled"""
+        settings = self.config.get("tracking", {})
+        if not settings.get("enabled", True):
+            return None
+        return FaceTracker(iou_threshold=settings.get("iou_threshold", 0.3),
+                           max_missed=settings.get("max_missed", 5),
+                           reverify_every=settings.get("reverify_every", 15))
+
+    def create_prefilter(self):
+        """Build a frame/face pre-filter from the "prefilter" config section, or None when disabled"""
+        settings = dict(self.config.get("prefilter", {}))
+        if not settings.pop("enabled", True):
+            return None
+        return FramePrefilter(**settings)
 
     def _check_and_update_date(self):
         """Check if date has changed and reset logged faces tracking"""
@@ -50,27 +133,38 @@ class FaceDetector:
             logger.info("Date changed, reset logged faces tracking")
 
     def load_known_faces(self):
-        if not os.path.exists(self.faces_dir):
-            os.makedirs(self.faces_dir)
-            logger.info(f"Created faces directory: {self.faces_dir}")
-            return
-
-        face_count = 0
-        for filename in os.listdir(self.faces_dir):
-            if filename.endswith(".jpg"):
-                path = os.path.join(self.faces_dir, filename)
-                name = os.path.splitext(filename)[0]
-                image = cv2.imread(path)
-                encoding = self.get_face_encoding(image)
-                if encoding is not None:
-                    self.known_face_encodings.append(encoding)
-                    self.known_face_names.append(name)
-                    face_count += 1
-                    logger.info(f"Loaded face for {name}")
-                else:
-                    logger.warning(f"Failed to load face encoding for {name}")
-        
-        logger.info(f"Loaded {face_count} known faces from {self.faces_dir}")
+        self.gallery.load()
+
+    def encode_image_files(self, paths):
+        """Encode the largest face in each image file, in parallel for large batches"""
+        enrollment = self.config.get("enrollment", {})
+        if len(paths) >= enrollment.get("parallel_threshold", 50):
+            try:
+                encoder = ParallelEncoder(self.predictor_path, self.recognition_model_path,
+                                          enrollment.get("workers") or None)
+                return encoder.encode_files(paths)
+            except Exception as e:
+                logger.error(f"Parallel encoding failed, falling back to serial: {str(e)}")
+
+        faces = []
+        indices = []
+        for i, path in enumerate(paths):
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            try:
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                detected = self.detector(gray)
+                if len(detected) > 0:
+                    faces.append((image, self.predictor(gray, largest_face(detected))))
+                    indices.append(i)
+            except Exception as e:
+                logger.error(f"Error finding face in {path}: {str(e)}")
+
+        encodings = [None] * len(paths)
+        for i, encoding in zip(indices, self.compute_descriptors(faces)):
+            encodings[i] = encoding
+        return encodings
 
     def get_face_encoding(self, image):
         """Get face encoding using dlib"""
@@ -84,124 +178,388 @@ class FaceDetector:
                 
             shape = self.predictor(gray, faces[0])
             
-            face_encoding = np.array(self.face_rec_model.compute_face_descriptor(image, shape))
+            with self.model_lock:
+                face_encoding = np.array(self.face_rec_model.compute_face_descriptor(image, shape))
             
             return face_encoding
         except Exception as e:
             logger.error(f"Error getting face encoding: {str(e)}")
             return None
 
+    def start_enrollment_burst(self, frames=None):
+        """Score the faces in the next frames registration frames as template candidates"""
+        with self.lock:
+            self.burst_candidates = []
+            self.burst_remaining = frames or self.burst_frames
+
+    def enrollment_burst_done(self):
+        with self.lock:
+            return self.burst_candidates is not None and self.burst_remaining == 0
+
     def save_face(self, name):
-        if self.current_frame is None or self.current_face_coords is None:
+        """Enroll name from the best burst candidates, replacing any earlier templates.
+
+        Without a burst, the current registration snapshot is the only candidate.
+        """
+        with self.lock:
+            candidates = self.burst_candidates
+            self.burst_candidates = None
+            self.burst_remaining = 0
+            snapshot = self.current_snapshot
+        if candidates is None and snapshot is not None:
+            candidates = [self._enrollment_candidate(*snapshot)]
+
+        if not candidates:
             logger.warning("No face detected to save")
             return False
-            
-        try:
-            x, y, w, h = self.current_face_coords
 
-            padding = 20
-            face_image = self.current_frame[max(0, y-padding):y+h+padding, 
-                                         max(0, x-padding):x+w+padding]
-            
-            os.makedirs(self.faces_dir, exist_ok=True)
-            
-            file_path = os.path.join(self.faces_dir, f"{name}.jpg")
-            cv2.imwrite(file_path, face_image)
-            logger.info(f"Saved face image to: {file_path}")
-            
-            face_encoding = self.get_face_encoding_from_coords(self.current_frame, self.current_face_coords)
-            if face_encoding is not None:
-                self.known_face_encodings.append(face_encoding)
-                self.known_face_names.append(name)
-                logger.info(f"Face encoding saved for {name}")
-                return True
-            else:
-                logger.error(f"Failed to generate face encoding for {name}")
-            
+        templates = select_templates(candidates, self.templates_per_person, self.quality_settings)
+        if not templates:
+            best = max(c["quality"]["score"] for c in candidates)
+            logger.warning(f"No face passed the quality gate for {name} "
+                           f"({len(candidates)} candidates, best score {best:.2f})")
             return False
+
+        try:
+            encodings = self.compute_descriptors([(c["image"], c["shape"]) for c in templates])
+            encoded = [(c, encoding) for c, encoding in zip(templates, encodings) if encoding is not None]
+            if not encoded:
+                return False
+
+            person_dir = self.gallery.replace(
+                name, [(c["image"], c["box"], encoding) for c, encoding in encoded])
+
+            scores = ", ".join(f"{c['quality']['score']:.2f}" for c, _ in encoded)
+            logger.info(f"Saved {len(encoded)} face templates for {name} to {person_dir} "
+                        f"from {len(candidates)} candidates (quality {scores})")
+            return True
         except Exception as e:
             logger.error(f"Error saving face: {str(e)}")
             return False
 
-    def get_face_encoding_from_coords(self, image, coords):
+    def _enrollment_candidate(self, image, box, detection_score):
+        """Landmarks and quality score for one face, kept for encoding if it is chosen as a template"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        x, y, w, h = box
+        shape = self.predictor(gray, dlib.rectangle(x, y, x+w, y+h))
+        quality = score_face(gray, box, shape, detection_score, self.quality_settings)
+        return {"image": image, "box": box, "shape": shape, "quality": quality}
+
+    def get_face_encoding_from_coords(self, image, coords, gray=None):
         """Get face encoding using pre-detected face coordinates"""
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            x, y, w, h = coords
-            face_rect = dlib.rectangle(x, y, x+w, y+h)
-            
-            shape = self.predictor(gray, face_rect)
-            
-            face_encoding = np.array(self.face_rec_model.compute_face_descriptor(image, shape))
-            
-            return face_encoding
+            if gray is None:
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            return self.compute_descriptors([(image, self.face_landmarks(gray, coords))])[0]
         except Exception as e:
             logger.error(f"Error getting face encoding from coords: {str(e)}")
             return None
 
+    def face_landmarks(self, gray, box):
+        x, y, w, h = box
+        with metrics.timer("landmarks"):
+            return self.predictor(gray, dlib.rectangle(x, y, x+w, y+h))
+
+    def compute_descriptors(self, faces):
+        """Encode [(image, shape)] faces with as few dlib calls as possible.
+
+        Faces are grouped by image and handed to dlib's batched descriptor API, at most
+        descriptor_batch faces per call, so the per-call overhead is paid once per batch
+        rather than once per face. Returns an encoding (or None on failure) per face.
+        """
+        encodings = [None] * len(faces)
+        for start in range(0, len(faces), self.descriptor_batch):
+            images = []
+            shapes = []
+            rows = []
+            slots = {}
+            for i, (image, shape) in enumerate(faces[start:start + self.descriptor_batch], start):
+                slot = slots.get(id(image))
+                if slot is None:
+                    slot = slots[id(image)] = len(images)
+                    images.append(image)
+                    shapes.append(dlib.full_object_detections())
+                    rows.append([])
+                shapes[slot].append(shape)
+                rows[slot].append(i)
+
+            try:
+                with metrics.timer("descriptor"), self.model_lock:
+                    if len(images) == 1:
+                        descriptors = [self.face_rec_model.compute_face_descriptor(images[0], shapes[0])]
+                    else:
+                        descriptors = self.face_rec_model.compute_face_descriptor(images, shapes)
+            except Exception as e:
+                logger.error(f"Error computing face descriptors: {str(e)}")
+                continue
+            metrics.count("descriptor_faces", sum(len(r) for r in rows))
+            for image_rows, image_descriptors in zip(rows, descriptors):
+                for i, descriptor in zip(image_rows, image_descriptors):
+                    encodings[i] = np.array(descriptor)
+        return encodings
+
+    def detect_faces(self, gray):
+        """Run HOG on the configured ROI at the configured scale, returning full-frame (x, y, w, h) boxes"""
+        return [box for box, _ in self._detect(gray)]
+
+    def detect_faces_scored(self, gray):
+        """Like detect_faces, but returns (box, detector score) pairs"""
+        return self._detect(gray, with_scores=True)
+
+    def _detect(self, gray, with_scores=False):
+        frame_h, frame_w = gray.shape[:2]
+        offset_x, offset_y = 0, 0
+        image = gray
+        if self.detection_roi:
+            rx, ry, rw, rh = self.detection_roi
+            offset_x, offset_y = max(0, rx), max(0, ry)
+            image = gray[offset_y:ry + rh, offset_x:rx + rw]
+            if image.size == 0:
+                return []
+
+        scale = self.detection_scale
+        if scale != 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        with metrics.timer("detect"):
+            if with_scores:
+                faces, scores, _ = self.detector.run(image, self.detection_upsample)
+            else:
+                faces = self.detector(image, self.detection_upsample)
+                scores = [0.0] * len(faces)
+
+        boxes = []
+        for face, score in zip(faces, scores):
+            x = max(0, int(face.left() / scale) + offset_x)
+            y = max(0, int(face.top() / scale) + offset_y)
+            right = min(frame_w, int(face.right() / scale) + offset_x)
+            bottom = min(frame_h, int(face.bottom() / scale) + offset_y)
+            if right > x and bottom > y:
+                boxes.append(((x, y, right - x, bottom - y), float(score)))
+        return boxes
+
+    @staticmethod
+    def _face_crop(frame, box):
+        """Copy the face in box with enough context around it for landmarks and the descriptor chip.
+
+        Returns (crop, box relative to the crop).
+        """
+        x, y, w, h = box
+        margin = max(20, w // 2, h // 2)
+        height, width = frame.shape[:2]
+        left, top = max(0, x - margin), max(0, y - margin)
+        right, bottom = min(width, x + w + margin), min(height, y + h + margin)
+        return frame.image[top:bottom, left:right].copy(), (x - left, y - top, w, h)
+
+    def detect_registration_face(self, frame):
+        """Find the face to register in frame and keep a crop of it as the save_face snapshot.
+
+        While an enrollment burst is running, the largest face in each frame is
+        scored and kept as a template candidate.
+        """
+        frame = as_frame(frame)
+        faces = self.detect_faces_scored(frame.gray)
+        face = max(faces, key=lambda f: f[0][2] * f[0][3]) if faces else None
+        snapshot = None
+        if face is not None:
+            crop, crop_box = self._face_crop(frame, face[0])
+            snapshot = (crop, crop_box, face[1])
+
+        with self.lock:
+            capturing = self.burst_remaining > 0
+        candidate = None
+        if capturing and snapshot is not None:
+            candidate = self._enrollment_candidate(*snapshot)
+
+        with self.lock:
+            self.current_snapshot = snapshot
+            if self.burst_remaining > 0:
+                self.burst_remaining -= 1
+                if candidate is not None:
+                    self.burst_candidates.append(candidate)
+
+        if face is None:
+            return []
+        result = {"box": face[0], "status": "detected"}
+        if candidate is not None:
+            result["quality"] = candidate["quality"]["score"]
+        return [result]
+
     def collect_face(self, frame):
-        self.current_frame = frame.copy()
-        
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.detector(gray)
-        
-        if faces:
-            face = faces[0]
-            x, y, w, h = face.left(), face.top(), face.width(), face.height()
-            
-            self.current_face_coords = (x, y, w, h)
+        self.draw_results(as_frame(frame).image, self.detect_registration_face(frame))
+
+    def reset_tracking(self):
+        if self.tracker is not None:
+            self.tracker.reset()
+        if self.prefilter is not None:
+            self.prefilter.reset()
+
+    def _match_encodings(self, encodings):
+        """Return (name, distance) of the best gallery match for each encoding"""
+        return self.gallery.match(encodings)
+
+    def _resolve_match(self, box, name, min_distance, db_manager, when=None, camera=None):
+        """Mark attendance for a match and build its result entry"""
+        if min_distance < self.match_threshold:
+            confidence = (1 - min_distance) * 100
             
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(frame, "Face Detected - Press SPACE", 
-                       (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 
-                       0.5, (0, 255, 0), 2)
+            if db_manager is not None and db_manager.mark_attendance(name, when):
+                source = f", camera: {camera}" if camera else ""
+                logger.info(f"Face recognized and attendance marked: {name} (confidence: {confidence:.1f}%{source})")
+                self.logged_faces_today.add(name)
+                status = "marked"
+            else:
+                if name not in self.logged_faces_today:
+                    logger.debug(f"Face recognized but attendance already marked: {name}")
+                    self.logged_faces_today.add(name)
+                status = "known"
+            metrics.count("faces_matched")
+            return {"box": box, "status": status, "name": name,
+                    "distance": min_distance, "confidence": confidence}
+
+        hot_log.debug("unknown_face", "Unknown face detected (distance: %.3f)", min_distance)
+        metrics.count("faces_unknown")
+        return {"box": box, "status": "unknown", "name": None,
+                "distance": min_distance, "confidence": 0.0}
+
+    def process_attendance(self, frame, db_manager, tracker=None, when=None, camera=None, prefilter=None):
+        """Detect, match and mark attendance for every face in frame, returning per-face results.
+
+        when is the capture time used for attendance, defaulting to now, and camera tags
+        the results with their source. With a tracker,
+        descriptors are only computed for new tracks and periodic re-verification; other
+        faces reuse the identity cached on their track. With a prefilter, frames that
+        barely changed return the previous results and poor faces are never encoded.
+        """
+        with metrics.timer("frame"):
+            job = {"frame": frame, "db_manager": db_manager, "tracker": tracker or self.tracker,
+                   "prefilter": prefilter or self.prefilter, "when": when, "camera": camera}
+            return self.process_batch([job])[0]
+
+    def process_batch(self, jobs):
+        """Recognize several frames together, returning a list of per-face results for each job.
+
+        A job is a dict with a "frame" and optionally "db_manager", "tracker", "prefilter",
+        "when" and "camera", as taken by process_attendance. With "crop" set, the frame is a
+        face crop that is encoded whole if no face is detected in it. Faces from every
+        frame are encoded together in batched descriptor calls and matched against the
+        gallery in a single call.
+        """
+        self._check_and_update_date()
+        states = []
+        for job in jobs:
+            try:
+                states.append(self._detect_job(job))
+            except Exception as e:
+                hot_log.error("recognition_error", "Error in face recognition: %s", e)
+                states.append({"results": []})
+
+        pending = []
+        faces = []
+        tracks = set()
+        for state in states:
+            frame = state.get("frame")
+            for i in state.get("to_encode", ()):
+                track = state["tracked"][i][0]
+                if track is not None:
+                    # A new track seen in several frames of the batch is encoded once
+                    if track in tracks:
+                        metrics.count("descriptors_reused")
+                        continue
+                    tracks.add(track)
+                try:
+                    faces.append((frame.image, self.face_landmarks(frame.gray, state["boxes"][i])))
+                    pending.append((state, i))
+                except Exception as e:
+                    logger.error(f"Error finding face landmarks: {str(e)}")
+
+        encoded = [(p, e) for p, e in zip(pending, self.compute_descriptors(faces)) if e is not None]
+        if encoded:
+            matches = self._match_encodings([encoding for _, encoding in encoded])
+            for ((state, i), _), (name, min_distance) in zip(encoded, matches):
+                job = state["job"]
+                entry = self._resolve_match(state["boxes"][i], name, min_distance, job.get("db_manager"),
+                                            job.get("when"), job.get("camera"))
+                state["entries"][i] = entry
+                track = state["tracked"][i][0]
+                if track is not None:
+                    track.set_identity(entry["name"], entry["distance"], entry["confidence"], entry["status"])
+
+        results = []
+        for state in states:
+            if "results" in state:
+                results.append(state["results"])
+            elif "duplicate_of" in state:
+                # Results of the previous frame, which may be earlier in this same batch
+                results.append(state["duplicate_of"].last_results)
+            else:
+                results.append(self._finish_job(state))
+        return results
+
+    def _detect_job(self, job):
+        """Detect and track the faces of one job, deciding which of them need a descriptor"""
+        frame = as_frame(job["frame"])
+        gray = frame.gray
+        tracker = job.get("tracker")
+        prefilter = job.get("prefilter")
+        metrics.count("frames")
+        if prefilter is not None and prefilter.is_duplicate(gray):
+            metrics.count("frames_duplicate")
+            metrics.count("descriptors_avoided", len(prefilter.last_results))
+            return {"duplicate_of": prefilter}
+
+        boxes = self.detect_faces(gray)
+        if not boxes and job.get("crop"):
+            boxes = [(0, 0, gray.shape[1], gray.shape[0])]
+        metrics.count("faces", len(boxes))
+
+        if tracker is not None:
+            tracked = tracker.update(boxes)
         else:
-            self.current_face_coords = None
+            tracked = [(None, True) for _ in boxes]
+
+        to_encode = []
+        for i, (track, needs_verify) in enumerate(tracked):
+            if not needs_verify:
+                metrics.count("descriptors_reused")
+                continue
+            if prefilter is not None:
+                reason = prefilter.check_face(gray, boxes[i])
+                if reason is not None:
+                    metrics.count(f"faces_rejected_{reason}")
+                    metrics.count("descriptors_avoided")
+                    continue
+            to_encode.append(i)
+
+        return {"job": job, "frame": frame, "boxes": boxes, "tracked": tracked,
+                "to_encode": to_encode, "entries": [None] * len(boxes)}
+
+    def _finish_job(self, state):
+        """Fill in cached identities for faces that weren't encoded and tag the results"""
+        job = state["job"]
+        camera = job.get("camera")
+        results = []
+        for i, (track, _) in enumerate(state["tracked"]):
+            entry = state["entries"][i]
+            if entry is None and track is not None and track.status is not None:
+                status = "known" if track.status == "marked" else track.status
+                entry = {"box": state["boxes"][i], "status": status, "name": track.name,
+                         "distance": track.distance, "confidence": track.confidence}
+            if entry is not None:
+                if track is not None:
+                    entry["track_id"] = track.id
+                if camera is not None:
+                    entry["camera"] = camera
+                results.append(entry)
+
+        prefilter = job.get("prefilter")
+        if prefilter is not None:
+            prefilter.last_results = results
+        return results
 
     def recognize_face(self, frame, db_manager):
-        try:
-            self._check_and_update_date()
-            
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.detector(gray)
-            
-            for face in faces:
-                x, y, w, h = face.left(), face.top(), face.width(), face.height()
-                
-                face_encoding = self.get_face_encoding_from_coords(frame, (x, y, w, h))
-                
-                if face_encoding is not None and len(self.known_face_encodings) > 0:
-                    distances = []
-                    for known_encoding in self.known_face_encodings:
-                        distance = np.linalg.norm(known_encoding - face_encoding)
-                        distances.append(distance)
-                    
-                    best_match_index = np.argmin(distances)
-                    min_distance = distances[best_match_index]
-                    
-                    threshold = 0.6
-                    
-                    if min_distance < threshold:
-                        name = self.known_face_names[best_match_index]
-                        confidence = (1 - min_distance) * 100
-                        
-                        if db_manager.mark_attendance(name):
-                            logger.info(f"Face recognized and attendance marked: {name} (confidence: {confidence:.1f}%)")
-                            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                            cv2.rectangle(frame, (x, y+h-35), (x+w, y+h), (0, 255, 0), cv2.FILLED)
-                            cv2.putText(frame, f"{name} - Marked! ({confidence:.1f}%)", 
-                                      (x + 6, y+h - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
-                            self.logged_faces_today.add(name)
-                        else:
-                            if name not in self.logged_faces_today:
-                                logger.debug(f"Face recognized but attendance already marked: {name}")
-                                self.logged_faces_today.add(name)
-                    else:
-                        logger.debug(f"Unknown face detected (distance: {min_distance:.3f})")
-                        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
-                        cv2.putText(frame, "Unknown", (x, y - 10), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-                        
-        except Exception as e:
-            logger.error(f"Error in face recognition: {str(e)}")
+        results = self.process_attendance(frame, db_manager)
+        self.draw_results(as_frame(frame).image, results)
+        return results
+
+    draw_results = staticmethod(draw_results)
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import cv2
+import numpy as np
+from loges import logger
+from encoding_store import EncodingStore, list_face_images
+from embedding_file import open_embedding_file, open_ivf_lists, write_embedding_file, write_ivf_lists
+from face_matcher import FaceMatcher, identity_centroids
+from face_index import create_index
+from metrics import metrics
+
+
+def _same_templates(a, b):
+    return len(a) == len(b) and all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+def person_directory(faces_dir, name):
+    """Return faces/<name>, raising ValueError unless name is a single plain path component.
+
+    Names come from users and clients, and the directory is deleted on re-enrollment,
+    so anything that could resolve outside faces/ is refused.
+    """
+    if (not name or name in (".", "..") or os.path.isabs(name) or os.path.splitdrive(name)[0]
+            or os.sep in name or (os.altsep and os.altsep in name)):
+        raise ValueError(f"Invalid name {name!r}")
+    person_dir = os.path.join(faces_dir, name)
+    if os.path.dirname(os.path.realpath(person_dir)) != os.path.realpath(faces_dir):
+        raise ValueError(f"Invalid name {name!r}: {person_dir} is outside {faces_dir}")
+    return person_dir
+
+
+def reset_person_directory(faces_dir, name):
+    """Delete name's templates and legacy faces/<name>.jpg, returning the emptied faces/<name>/"""
+    person_dir = person_directory(faces_dir, name)
+    legacy_path = person_dir + ".jpg"
+    if os.path.isdir(person_dir):
+        shutil.rmtree(person_dir)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    os.makedirs(person_dir)
+    return person_dir
+
+
+class FaceGallery:
+    """The enrolled identities of one storage location: faces/ and the encoding store on
+    disk, and the matcher searched during recognition.
+
+    Recognition threads call match() while load(), refresh() and replace() update the
+    gallery, so it can be kept in sync with faces/ or swapped for another storage
+    location without pausing recognition.
+
+    With embedding_dtype set, the matcher rows are also written to face_embeddings.bin.
+    When faces/ hasn't changed since, load() maps that file instead of reading the
+    encoding store, and the per-person templates are only read on the first update.
+    An IVF index's lists are saved beside it in face_embeddings.ivf under the same
+    digest, so mapped loads skip reassigning every row.
+    """
+
+    def __init__(self, storage_path, model_id, encode_files, index_settings=None, match_mode="centroid",
+                 embedding_dtype="float32"):
+        self.storage_path = storage_path
+        self.faces_dir = os.path.join(storage_path, "faces")
+        self.store = EncodingStore(os.path.join(storage_path, "face_encodings.npz"), model_id, self.faces_dir)
+        self.matcher = FaceMatcher(index=create_index(index_settings, os.path.join(storage_path, "face_index.npz")))
+        self.embeddings_path = os.path.join(storage_path, "face_embeddings.bin")
+        self.lists_path = os.path.join(storage_path, "face_embeddings.ivf")
+        self.encode_files = encode_files
+        self.match_mode = match_mode
+        self.embedding_dtype = embedding_dtype
+        self.model_id = model_id
+        # lock guards the matcher; update_lock serialises slow store updates without blocking matching
+        self.lock = threading.RLock()
+        self.update_lock = threading.Lock()
+        self.templates = {}
+        self.signature = None
+        self.directories = None
+        self.mapped = None
+
+    def __len__(self):
+        return len(self.matcher)
+
+    def people(self):
+        return self.mapped.people if self.templates is None else len(self.templates)
+
+    def _signature(self):
+        return frozenset((key, stat.st_mtime_ns, stat.st_size)
+                         for key, stat in list_face_images(self.faces_dir).items())
+
+    def _directory_signature(self):
+        """mtimes of faces/ and its person directories, which change whenever an image in them
+        is added, removed or renamed; far cheaper to check than stat-ing every image"""
+        directories = [(".", os.stat(self.faces_dir).st_mtime_ns)]
+        directories += [(entry.name, entry.stat().st_mtime_ns)
+                        for entry in os.scandir(self.faces_dir) if entry.is_dir()]
+        return frozenset(directories)
+
+    def _rows(self, templates):
+        """Matcher rows for {name: [encodings]}: one mean row per person, or every template"""
+        names = [name for name, encodings in templates.items() for _ in encodings]
+        encodings = [encoding for person in templates.values() for encoding in person]
+        if self.match_mode == "centroid":
+            return identity_centroids(names, encodings)
+        return names, encodings
+
+    def _digest(self, signature):
+        """Identifies the faces/ contents, models and settings an embedding file was built from"""
+        digest = hashlib.sha256(json.dumps([self.model_id, self.match_mode, self.embedding_dtype]).encode())
+        for key, mtime_ns, size in sorted(signature):
+            digest.update(f"{key}\0{mtime_ns}\0{size}\n".encode())
+        return digest.digest()
+
+    def _sync(self, signature=None):
+        """Bring the store in line with faces/, returning {name: [encodings]}"""
+        if signature is None:
+            self.directories = self._directory_signature()
+            signature = self._signature()
+        self.signature = signature
+        templates = {}
+        for name, encoding in zip(*self.store.sync(self.faces_dir, self.encode_files)):
+            templates.setdefault(name, []).append(encoding)
+        return templates
+
+    def load(self):
+        """Encode whatever changed in faces/ since the store was written and rebuild the matcher"""
+        with self.update_lock:
+            if not os.path.exists(self.faces_dir):
+                os.makedirs(self.faces_dir)
+                logger.info(f"Created faces directory: {self.faces_dir}")
+            self.directories = self._directory_signature()
+            signature = self._signature()
+            if self.embedding_dtype:
+                digest = self._digest(signature)
+                mapped = open_embedding_file(self.embeddings_path, digest)
+                if mapped is not None:
+                    lists = open_ivf_lists(self.lists_path, digest)
+                    with self.lock:
+                        self.matcher.set_mapped(mapped, lists)
+                        self.templates = None
+                        self.mapped = mapped
+                    self.signature = signature
+                    if lists is None:
+                        self._write_lists(digest)
+                    logger.info(f"Mapped {len(mapped)} gallery rows for {mapped.people} people from "
+                                f"{self.embeddings_path} ({self.match_mode} matching)")
+                    return
+
+            templates = self._sync(signature)
+            with self.lock:
+                self.matcher.set_gallery(*self._rows(templates))
+                self.templates = templates
+                self.mapped = None
+            if self.embedding_dtype:
+                self._write_embeddings(digest)
+
+        logger.info(f"Loaded {sum(len(t) for t in templates.values())} face templates for "
+                    f"{len(templates)} people from {self.faces_dir} ({self.match_mode} matching)")
+
+    def _write_embeddings(self, digest):
+        try:
+            write_embedding_file(self.embeddings_path, list(self.matcher.names), self.matcher.matrix,
+                                 digest, self.embedding_dtype)
+        except Exception as e:
+            logger.error(f"Error writing embedding file {self.embeddings_path}: {str(e)}")
+            return
+        self._write_lists(digest)
+
+    def _write_lists(self, digest):
+        """Save the IVF lists of the matcher's rows so the next mapped load can reuse them"""
+        lists = self.matcher.index.saved_lists()
+        if lists is None:
+            if os.path.exists(self.lists_path):
+                os.remove(self.lists_path)
+            return
+        try:
+            write_ivf_lists(self.lists_path, lists, digest)
+        except Exception as e:
+            logger.error(f"Error writing IVF lists {self.lists_path}: {str(e)}")
+
+    def _unmap(self):
+        """Replace a mapped gallery with one built from the encoding store, so it can be updated"""
+        templates = self._sync()
+        with self.lock:
+            self.matcher.set_gallery(*self._rows(templates))
+            self.templates = templates
+            self.mapped = None
+        return templates
+
+    def refresh(self, full=True):
+        """Apply changes made to faces/ by other processes, touching only the identities that changed.
+
+        Unless full is set, every image is only stat-ed once a directory mtime shows that
+        images were added, removed or renamed; a file overwritten in place is only noticed
+        by a full refresh. Returns (changed, removed) name lists; both are empty when
+        nothing changed on disk.
+        """
+        with self.update_lock:
+            if not os.path.isdir(self.faces_dir):
+                return [], []
+            directories = self._directory_signature()
+            if not full and directories == self.directories:
+                return [], []
+            signature = self._signature()
+            self.directories = directories
+            if signature == self.signature:
+                return [], []
+            if self.templates is None:
+                # A mapped gallery has no per-person templates to diff against
+                templates = self._unmap()
+                metrics.count("gallery_reloads")
+                logger.info(f"Gallery rebuilt from {self.faces_dir}: {len(templates)} people")
+                return list(templates), []
+            templates = self._sync(signature)
+            changed = [name for name, encodings in templates.items()
+                       if not _same_templates(encodings, self.templates.get(name, []))]
+            removed = [name for name in self.templates if name not in templates]
+            if not changed and not removed:
+                return [], []
+
+            with self.lock:
+                if len(changed) + len(removed) > max(16, len(templates) // 10):
+                    self.matcher.set_gallery(*self._rows(templates))
+                else:
+                    self.matcher.remove_names(changed + removed)
+                    for name in changed:
+                        for row_name, row in zip(*self._rows({name: templates[name]})):
+                            self.matcher.add(row_name, row)
+                self.templates = templates
+
+        metrics.count("gallery_reloads")
+        logger.info(f"Gallery updated from {self.faces_dir}: {len(changed)} added or changed, "
+                    f"{len(removed)} removed")
+        return changed, removed
+
+    def replace(self, name, templates, padding=20):
+        """Enroll name with [(image, box, encoding)] templates, replacing any it had before.
+
+        Each face is cropped from its image with padding and written to faces/<name>/NN.jpg.
+        Raises ValueError, before touching anything, if name isn't a valid person name.
+        """
+        person_directory(self.faces_dir, name)
+        with self.update_lock:
+            if self.templates is None:
+                self._unmap()
+            person_dir = reset_person_directory(self.faces_dir, name)
+            self.store.remove_name(name)
+
+            for i, (image, box, encoding) in enumerate(templates):
+                x, y, w, h = box
+                face_image = image[max(0, y-padding):y+h+padding,
+                                   max(0, x-padding):x+w+padding]
+                file_path = os.path.join(person_dir, f"{i:02d}.jpg")
+                cv2.imwrite(file_path, face_image)
+                self.store.put(file_path, name, encoding)
+            self.store.save()
+            self.directories = self._directory_signature()
+            self.signature = self._signature()
+
+            encodings = [encoding for _, _, encoding in templates]
+            with self.lock:
+                self.matcher.remove(name)
+                for row_name, row in zip(*self._rows({name: encodings})):
+                    self.matcher.add(row_name, row)
+                self.templates = {**self.templates, name: encodings}
+        return person_dir
+
+    def match(self, encodings):
+        """Return (name, distance) of the best gallery match for each encoding"""
+        with self.lock:
+            if len(self.matcher) == 0:
+                return [(None, float('inf'))] * len(encodings)
+            with metrics.timer("match"):
+                matches = self.matcher.match(encodings, k=1)
+        return [face_matches[0] if face_matches else (None, float('inf')) for face_matches in matches]
+
+
+class GalleryWatcher(threading.Thread):
+    """Polls faces/ and applies added or removed identities while recognition keeps running.
+
+    Polling (rather than OS file notifications) also picks up faces written to a
+    network share by another machine. Each poll only checks directory mtimes; every
+    full_interval seconds refresh is asked to stat every image, catching files
+    overwritten in place.
+    """
+
+    def __init__(self, refresh, interval=2.0, full_interval=300.0):
+        super().__init__(daemon=True)
+        self.refresh = refresh
+        self.interval = interval
+        self.full_interval = full_interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        last_full = time.monotonic()
+        while not self.stop_event.wait(self.interval):
+            full = time.monotonic() - last_full >= self.full_interval
+            if full:
+                last_full = time.monotonic()
+            try:
+                self.refresh(full)
+            except Exception as e:
+                logger.error(f"Error refreshing face gallery: {str(e)}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
@@ -0,0 +1,323 @@
+import argparse
+import os
+import time
+import numpy as np
+from embedding_file import IVFLists
+from loges import logger
+
+INDEX_VERSION = 1
+
+
+def exact_search(matrix, sq_norms, queries, k, ids=None):
+    """Return (indices, distances) of the k nearest rows of matrix for each query.
+
+    When ids is given, matrix and sq_norms are a subset of the gallery and the
+    returned indices are mapped back through ids.
+    """
+    count = len(matrix)
+    k = min(k, count)
+    if count == 0 or len(queries) == 0:
+        empty = np.zeros((len(queries), 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    # ||q - g||^2 = ||q||^2 + ||g||^2 - 2 q.g for every pair in one matrix product
+    sq_dist = queries @ matrix.T
+    sq_dist *= -2
+    sq_dist += sq_norms
+    sq_dist += np.einsum('ij,ij->i', queries, queries)[:, None]
+
+    if k < count:
+        indices = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(count), (len(queries), 1))
+    top = np.take_along_axis(sq_dist, indices, axis=1)
+    order = np.argsort(top, axis=1)
+    indices = np.take_along_axis(indices, order, axis=1)
+    distances = np.sqrt(np.maximum(np.take_along_axis(top, order, axis=1), 0))
+    if ids is not None:
+        indices = ids[indices]
+    return indices, distances
+
+
+class BruteForceIndex:
+    """Exact search over every gallery row"""
+    name = "brute"
+
+    def build(self, matrix, lists=None):
+        pass
+
+    def saved_lists(self):
+        return None
+
+    def add(self, row, vector):
+        pass
+
+    def remove(self, keep):
+        pass
+
+    def search(self, matrix, sq_norms, queries, k):
+        return exact_search(matrix, sq_norms, queries, k)
+
+
+class IVFIndex:
+    """Inverted-file index: k-means partitions the gallery, queries scan only the nprobe closest lists.
+
+    nprobe is the recall/latency knob. Galleries smaller than min_size are searched exactly.
+    Centroids are persisted to index_path; list membership is reassigned on load, which is
+    much cheaper than retraining, unless saved IVFLists for the same rows are passed to build().
+    """
+    name = "ivf"
+
+    def __init__(self, nlist=0, nprobe=8, min_size=5000, index_path=None,
+                 kmeans_iters=10, train_sample=20000, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.index_path = index_path
+        self.kmeans_iters = kmeans_iters
+        self.train_sample = train_sample
+        self.seed = seed
+
+        self.centroids = None
+        self.centroid_sq_norms = None
+        self.trained_size = 0
+        self.lists = []
+        self._order = None
+        self._bounds = None
+
+    def _auto_nlist(self, count):
+        return self.nlist if self.nlist > 0 else max(1, int(np.sqrt(count)))
+
+    def _assign(self, vectors, chunk_size=8192):
+        labels = np.empty(len(vectors), dtype=np.int64)
+        centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            scores = chunk @ self.centroids.T
+            scores *= -2
+            scores += centroid_sq_norms
+            labels[start:start + chunk_size] = np.argmin(scores, axis=1)
+        return labels
+
+    def _train(self, matrix):
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self._auto_nlist(len(matrix)), len(matrix))
+        if len(matrix) > self.train_sample:
+            sample = matrix[rng.choice(len(matrix), self.train_sample, replace=False)]
+        else:
+            sample = np.array(matrix)
+
+        self.centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            empty = counts == 0
+            self.centroids[~empty] = sums[~empty] / counts[~empty, None]
+            if empty.any():
+                self.centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+
+        self.trained_size = len(matrix)
+        logger.info(f"Trained IVF index with {nlist} lists on {len(sample)} of {len(matrix)} faces")
+        self.save()
+
+    def load(self, dim):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                if int(data['version']) != INDEX_VERSION or data['centroids'].shape[1] != dim:
+                    return False
+                self.centroids = data['centroids'].astype(np.float32)
+                self.trained_size = int(data['trained_size'])
+            logger.info(f"Loaded IVF index with {len(self.centroids)} lists from {self.index_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error reading IVF index, retraining: {str(e)}")
+            self.centroids = None
+            return False
+
+    def save(self):
+        if not self.index_path or self.centroids is None:
+            return
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, version=np.array(INDEX_VERSION), centroids=self.centroids,
+                         trained_size=np.array(self.trained_size))
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"Error saving IVF index: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _is_stale(self, count):
+        return self.centroids is None or count > 4 * self.trained_size
+
+    def build(self, matrix, lists=None):
+        """Partition matrix into lists, reusing saved lists built for these same rows if given"""
+        count = len(matrix)
+        self.lists = []
+        self._order = self._bounds = None
+        if count < self.min_size:
+            self.centroids = None
+            return
+
+        if lists is not None and lists.nlist == self.nlist and len(lists.order) == count:
+            self.centroids = lists.centroids
+            order, bounds = lists.order, lists.bounds
+        else:
+            if self.centroids is None:
+                self.load(matrix.shape[1])
+            if self._is_stale(count):
+                self._train(matrix)
+            labels = self._assign(matrix)
+            order = np.argsort(labels, kind='stable')
+            bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+
+        self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self._order, self._bounds = order, bounds
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def saved_lists(self):
+        """The lists of the last build() as IVFLists, or None if the gallery is searched exactly"""
+        if self.centroids is None or self._order is None:
+            return None
+        return IVFLists(self.centroids, self._bounds, self._order, self.nlist)
+
+    def add(self, row, vector):
+        if self.centroids is None:
+            return
+        label = int(self._assign(np.asarray(vector, dtype=np.float32)[None, :])[0])
+        self.lists[label] = np.append(self.lists[label], row)
+        # The saved order no longer describes the lists
+        self._order = self._bounds = None
+
+    def remove(self, keep):
+        """Drop the rows where the boolean mask keep is False; later rows move down to fill the gaps"""
+        if self.centroids is None:
+            return
+        new_ids = np.cumsum(keep) - 1
+        self.lists = [new_ids[ids[keep[ids]]] for ids in self.lists]
+        self._order = self._bounds = None
+
+    def search(self, matrix, sq_norms, queries, k):
+        if self.centroids is None:
+            return exact_search(matrix, sq_norms, queries, k)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        scores = queries @ self.centroids.T
+        scores *= -2
+        scores += self.centroid_sq_norms
+        probes = np.argpartition(scores, nprobe - 1, axis=1)[:, :nprobe]
+
+        k = min(k, len(matrix))
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            ids = np.concatenate([self.lists[p] for p in probes[i]])
+            if len(ids) == 0:
+                continue
+            found, found_dist = exact_search(matrix[ids], sq_norms[ids], query[None, :], k, ids)
+            indices[i, :found.shape[1]] = found[0]
+            distances[i, :found.shape[1]] = found_dist[0]
+        return indices, distances
+
+
+def create_index(settings=None, index_path=None):
+    """Build the gallery index described by the "index" config section"""
+    settings = settings or {}
+    index_type = settings.get("type", "ivf")
+    if index_type == "brute":
+        return BruteForceIndex()
+    if index_type == "ivf":
+        return IVFIndex(nlist=settings.get("nlist", 0),
+                        nprobe=settings.get("nprobe", 8),
+                        min_size=settings.get("min_size", 5000),
+                        index_path=index_path)
+    logger.warning(f"Unknown index type {index_type}, using brute force search")
+    return BruteForceIndex()
+
+
+def _timed_search(search, queries, batch):
+    results = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        results.append(search(queries[i:i + batch])[0])
+    ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return np.concatenate(results), ms
+
+
+def recall_report(matrix, queries, k=1, nprobes=(1, 2, 4, 8, 16, 32), nlist=0, batch=1):
+    """Compare IVF search at several nprobe values against exact search.
+
+    Queries are issued batch at a time, matching the handful of faces seen per frame.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+
+    exact, exact_ms = _timed_search(lambda q: exact_search(matrix, sq_norms, q, k), queries, batch)
+
+    index = IVFIndex(nlist=nlist, min_size=0)
+    start = time.perf_counter()
+    index.build(matrix)
+    build_s = time.perf_counter() - start
+
+    rows = [{"index": "brute", "nprobe": None, "recall": 1.0, "ms_per_query": exact_ms}]
+    for nprobe in nprobes:
+        index.nprobe = nprobe
+        approx, ms = _timed_search(lambda q: index.search(matrix, sq_norms, q, k), queries, batch)
+        hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+        rows.append({"index": "ivf", "nprobe": nprobe, "recall": hits / exact.size, "ms_per_query": ms})
+    return {"gallery_size": len(matrix), "nlist": len(index.centroids), "build_s": build_s, "rows": rows}
+
+
+def synthetic_gallery(size, clusters=0, dim=128, seed=0):
+    """Random unit-scale encodings, optionally grouped around cluster centres"""
+    rng = np.random.default_rng(seed)
+    if clusters <= 0:
+        return rng.normal(0, 0.1, (size, dim)).astype(np.float32)
+    centres = rng.normal(0, 0.1, (clusters, dim))
+    labels = rng.integers(0, clusters, size)
+    return (centres[labels] + rng.normal(0, 0.04, (size, dim))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency report for the approximate face index")
+    parser.add_argument("--store", help="face_encodings.npz or face_embeddings.bin to use as the gallery "
+                                        "instead of synthetic data")
+    parser.add_argument("--size", type=int, default=100000, help="synthetic gallery size")
+    parser.add_argument("--clusters", type=int, default=1000, help="synthetic cluster count (0 for uniform noise)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.02, help="noise added to gallery rows to form queries")
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--batch", type=int, default=1, help="queries per search call (faces per frame)")
+    args = parser.parse_args()
+
+    if args.store and args.store.endswith(".bin"):
+        from embedding_file import EmbeddingFile
+        matrix = EmbeddingFile(args.store).matrix
+    elif args.store:
+        with np.load(args.store, allow_pickle=False) as data:
+            matrix = data['encodings'][data['valid']].astype(np.float32)
+    else:
+        matrix = synthetic_gallery(args.size, args.clusters)
+
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(matrix), min(args.queries, len(matrix)), replace=False)
+    queries = matrix[picks] + rng.normal(0, args.noise, (len(picks), matrix.shape[1])).astype(np.float32)
+
+    report = recall_report(matrix, queries, args.k, args.nprobe, args.nlist, args.batch)
+    print(f"Gallery: {report['gallery_size']} faces, {report['nlist']} lists, built in {report['build_s']:.2f}s")
+    print(f"{'index':<8}{'nprobe':>8}{'recall@' + str(args.k):>12}{'ms/query':>12}")
+    for row in report["rows"]:
+        nprobe = "-" if row["nprobe"] is None else row["nprobe"]
+        print(f"{row['index']:<8}{nprobe:>8}{row['recall']:>12.4f}{row['ms_per_query']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+from collections import Counter
+import numpy as np
+from encoding_store import ENCODING_SIZE
+from face_index import BruteForceIndex
+
+
+def identity_centroids(names, encodings):
+    """Collapse several templates per name into one mean encoding per name, in first-seen order"""
+    rows = {}
+    for name, encoding in zip(names, encodings):
+        rows.setdefault(name, []).append(encoding)
+    return list(rows), [np.mean(np.asarray(templates, dtype=np.float32), axis=0) for templates in rows.values()]
+
+
+class FaceMatcher:
+    """Known face gallery held as a contiguous float32 matrix for batched matching.
+
+    A name may own several rows (enrollment templates); match() reports each
+    name once, at the distance of its closest template. The matrix may also be a
+    read-only mapped EmbeddingFile, which is copied out only when rows change.
+    """
+
+    def __init__(self, dim=ENCODING_SIZE, capacity=256, index=None):
+        self.dim = dim
+        self.index = index or BruteForceIndex()
+        self.names = []
+        self.count = 0
+        self.templates = Counter()
+        self.max_templates = 0
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def matrix(self):
+        return self._matrix[:self.count]
+
+    def _writable(self):
+        # int8 files are dequantized into memory, but their norms are still mapped
+        return self._matrix.flags.writeable and self._sq_norms.flags.writeable
+
+    def _reserve(self, needed):
+        """Make room for needed rows in writable arrays, copying out of a mapped file if need be"""
+        capacity = self._matrix.shape[0]
+        if needed <= capacity and self._writable():
+            return
+        while capacity < needed:
+            capacity = max(capacity * 2, 1)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        if self.count:
+            # An empty mapped file may have been written without a row width
+            matrix[:self.count] = self._matrix[:self.count]
+            sq_norms[:self.count] = self._sq_norms[:self.count]
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+
+    def set_gallery(self, names, encodings):
+        """Replace the gallery with the given names and encodings"""
+        self.names = list(names)
+        self.count = 0
+        if not self._writable():
+            # Never write into a mapped EmbeddingFile; its rows are replaced anyway
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._reserve(max(len(self.names), 1))
+        if self.names:
+            self._matrix[:len(self.names)] = np.asarray(encodings, dtype=np.float32)
+            self.count = len(self.names)
+            self._sq_norms[:self.count] = np.einsum('ij,ij->i', self.matrix, self.matrix)
+        self.templates = Counter(self.names)
+        self.max_templates = max(self.templates.values(), default=0)
+        self.index.build(self.matrix)
+
+    def set_mapped(self, embeddings, lists=None):
+        """Search the rows of an EmbeddingFile in place instead of copying them.
+
+        lists are IVFLists saved for the same file, letting an IVF index skip reassigning every row.
+        """
+        self.names = embeddings.names
+        self.count = len(embeddings)
+        self._matrix = embeddings.matrix
+        self._sq_norms = embeddings.sq_norms
+        # Per-name counts are only needed to update the gallery, so they are built on first update
+        self.templates = None
+        self.max_templates = embeddings.max_templates
+        self.index.build(self.matrix, lists)
+
+    def _materialize(self):
+        if self.templates is None:
+            self.names = list(self.names)
+            self.templates = Counter(self.names)
+
+    def add(self, name, encoding):
+        """Append one known face without rebuilding the gallery"""
+        self._materialize()
+        self._reserve(self.count + 1)
+        row = np.asarray(encoding, dtype=np.float32)
+        self._matrix[self.count] = row
+        self._sq_norms[self.count] = np.dot(row, row)
+        self.names.append(name)
+        self.templates[name] += 1
+        self.max_templates = max(self.max_templates, self.templates[name])
+        self.index.add(self.count, row)
+        self.count += 1
+
+    def remove(self, name):
+        """Drop every row enrolled for name, returning how many there were"""
+        return self.remove_names([name])
+
+    def remove_names(self, names):
+        """Drop every row enrolled for any of names in place, without rebuilding the index"""
+        self._materialize()
+        names = {name for name in names if name in self.templates}
+        if not names:
+            return 0
+        keep = np.fromiter((row_name not in names for row_name in self.names), dtype=bool, count=self.count)
+        kept = int(keep.sum())
+        # Copies the rows out first if they are still in a mapped file
+        self._reserve(self.count)
+        self._matrix[:kept] = self._matrix[:self.count][keep]
+        self._sq_norms[:kept] = self._sq_norms[:self.count][keep]
+        self.names = [row_name for row_name in self.names if row_name not in names]
+        removed = self.count - kept
+        self.count = kept
+        for name in names:
+            del self.templates[name]
+        self.max_templates = max(self.templates.values(), default=0)
+        self.index.remove(keep)
+        return removed
+
+    def search(self, encodings, k=1):
+        """Return (indices, distances) of the k nearest known faces for each query row"""
+        queries = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        return self.index.search(self.matrix, self._sq_norms[:self.count], queries, k)
+
+    def match(self, encodings, k=1):
+        """Return a list of [(name, distance), ...] top-k distinct names per query encoding"""
+        # Enough rows that k distinct names survive even if each has max_templates close templates
+        indices, distances = self.search(encodings, k * max(self.max_templates, 1))
+        matches = []
+        for row_indices, row_distances in zip(indices, distances):
+            seen = set()
+            face_matches = []
+            for i, d in zip(row_indices, row_distances):
+                if i < 0 or self.names[i] in seen:
+                    continue
+                seen.add(self.names[i])
+                face_matches.append((self.names[i], float(d)))
+                if len(face_matches) == k:
+                    break
+            matches.append(face_matches)
+        return matches
@@ -0,0 +1,36 @@
+import os
+import threading
+import dlib
+from loges import logger
+
+PREDICTOR_MODEL = "models/shape_predictor_68_face_landmarks.dat"
+RECOGNITION_MODEL = "models/dlib_face_recognition_resnet_model_v1.dat"
+
+
+class FaceModels:
+    """The dlib face detector, landmark predictor and ResNet encoder, loaded together"""
+
+    def __init__(self, predictor_path, recognition_model_path):
+        logger.info(f"Loading predictor from: {predictor_path}")
+        logger.info(f"Loading recognition model from: {recognition_model_path}")
+        self.predictor_path = predictor_path
+        self.recognition_model_path = recognition_model_path
+        self.detector = dlib.get_frontal_face_detector()
+        self.predictor = dlib.shape_predictor(predictor_path)
+        self.face_rec_model = dlib.face_recognition_model_v1(recognition_model_path)
+        # dlib's DNN keeps per-call state in its layers, so descriptor calls are serialised
+        self.lock = threading.Lock()
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_models(predictor_path, recognition_model_path):
+    """Return the process-wide FaceModels for these model files, loading them on first use"""
+    key = (os.path.abspath(predictor_path), os.path.abspath(recognition_model_path))
+    with _loaded_lock:
+        models = _loaded.get(key)
+        if models is None:
+            models = _loaded[key] = FaceModels(*key)
+        return models
@@ -0,0 +1,24 @@
+import cv2
+
+
+def draw_results(frame, results):
+    """Draw the boxes and labels for detection/recognition results onto frame"""
+    for result in results:
+        x, y, w, h = result["box"]
+        status = result["status"]
+        if status == "detected":
+            label = ("Face Detected - Press SPACE" if "quality" not in result
+                     else f"Capturing - quality {result['quality']:.2f}")
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            cv2.putText(frame, label, 
+                       (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 
+                       0.5, (0, 255, 0), 2)
+        elif status == "marked":
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            cv2.rectangle(frame, (x, y+h-35), (x+w, y+h), (0, 255, 0), cv2.FILLED)
+            cv2.putText(frame, f"{result['name']} - Marked! ({result['confidence']:.1f}%)", 
+                      (x + 6, y+h - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+        elif status == "unknown":
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
+            cv2.putText(frame, "Unknown", (x, y - 10), 
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
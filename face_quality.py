@@ -0,0 +1,159 @@
+import cv2
+import numpy as np
+
+# Landmark indices in dlib's 68-point layout
+JAW_LEFT = 0
+JAW_RIGHT = 16
+NOSE_TIP = 30
+LEFT_EYE_OUTER = 36
+RIGHT_EYE_OUTER = 45
+
+DEFAULT_QUALITY_SETTINGS = {
+    "target_face_size": 120,
+    "target_sharpness": 120.0,
+    "target_detection_score": 1.5,
+    "min_face_size": 60,
+    "min_quality": 0.4
+}
+
+
+def sharpness(gray, box):
+    """Variance of the Laplacian over the face box; low values mean motion blur or defocus"""
+    x, y, w, h = box
+    face = gray[max(0, y):y + h, max(0, x):x + w]
+    if face.size == 0:
+        return 0.0
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+
+def frontalness(points):
+    """1.0 for a frontal face, falling towards 0 as the head turns (yaw) or tilts (roll)"""
+    nose = points[NOSE_TIP]
+    left = np.linalg.norm(nose - points[LEFT_EYE_OUTER])
+    right = np.linalg.norm(nose - points[RIGHT_EYE_OUTER])
+    yaw = min(left, right) / max(left, right, 1e-6)
+
+    eyes = points[RIGHT_EYE_OUTER] - points[LEFT_EYE_OUTER]
+    roll = abs(np.cos(np.arctan2(eyes[1], eyes[0])))
+    return float(yaw * roll)
+
+
+def landmark_fit(points, box, margin=0.15):
+    """Fraction of landmarks inside the (slightly enlarged) detection box.
+
+    dlib's shape predictor reports no confidence, so a fit that strays outside
+    the detected face is used as the sign of an unreliable landmark set.
+    """
+    x, y, w, h = box
+    mx, my = w * margin, h * margin
+    inside = ((points[:, 0] >= x - mx) & (points[:, 0] <= x + w + mx) &
+              (points[:, 1] >= y - my) & (points[:, 1] <= y + h + my))
+    return float(inside.mean())
+
+
+def shape_points(shape):
+    return np.array([(p.x, p.y) for p in shape.parts()], dtype=np.float64)
+
+
+def score_face(gray, box, shape, detection_score, settings=None):
+    """Score one detected face for use as an enrollment template.
+
+    Returns a dict of the individual components in [0, 1] plus the combined
+    "score", their geometric mean, so a single bad component (blurred, turned
+    away, too small) sinks the template.
+    """
+    settings = {**DEFAULT_QUALITY_SETTINGS, **(settings or {})}
+    points = shape_points(shape)
+    size = min(box[2], box[3])
+    components = {
+        "size": min(1.0, size / settings["target_face_size"]),
+        "sharpness": min(1.0, sharpness(gray, box) / settings["target_sharpness"]),
+        "pose": frontalness(points),
+        "detection": float(np.clip(detection_score / settings["target_detection_score"], 0.0, 1.0)),
+        "landmarks": landmark_fit(points, box)
+    }
+    values = np.array(list(components.values()))
+    score = float(np.exp(np.log(np.maximum(values, 1e-6)).mean()))
+    return {**components, "face_size": size, "score": score}
+
+
+def select_templates(candidates, count, settings=None):
+    """Return up to count candidates with the best quality, dropping any below the gates.
+
+    Each candidate is a dict with at least "box" and "quality" keys.
+    """
+    settings = {**DEFAULT_QUALITY_SETTINGS, **(settings or {})}
+    usable = [c for c in candidates
+              if c["quality"]["face_size"] >= settings["min_face_size"]
+              and c["quality"]["score"] >= settings["min_quality"]]
+    usable.sort(key=lambda c: c["quality"]["score"], reverse=True)
+    return usable[:count]
+
+
+class FramePrefilter:
+    """Cheap checks run before the ResNet descriptor to avoid wasted work.
+
+    Frames nearly identical to the last processed one are skipped outright, and
+    faces too small, blurred, dark or washed out to ever match are not encoded.
+    The duplicate check compares against that stream's previous frame, so create
+    one per camera with FaceDetector.create_prefilter().
+    """
+
+    def __init__(self, min_face_size=40, min_sharpness=10.0, min_brightness=40, max_brightness=230,
+                 duplicate_threshold=1.5, max_duplicate_frames=15, thumbnail_size=(64, 48)):
+        self.min_face_size = min_face_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.duplicate_threshold = duplicate_threshold
+        self.max_duplicate_frames = max_duplicate_frames
+        self.thumbnail_size = tuple(thumbnail_size)
+        self.duplicate_frames = 0
+        self.rejected = {}
+        self.last_results = []
+        self._thumbnail = None
+        self._duplicates_in_row = 0
+
+    @property
+    def rejected_faces(self):
+        return sum(self.rejected.values())
+
+    def reset(self):
+        self.last_results = []
+        self._thumbnail = None
+        self._duplicates_in_row = 0
+
+    def is_duplicate(self, gray):
+        """True if gray barely differs from the last frame that was processed.
+
+        Frames are compared as small thumbnails against the last processed frame, not
+        the previous one, so slow changes still accumulate; after max_duplicate_frames
+        skips in a row a frame is processed regardless.
+        """
+        thumbnail = cv2.resize(gray, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        if self._thumbnail is not None and self._duplicates_in_row < self.max_duplicate_frames:
+            if cv2.absdiff(thumbnail, self._thumbnail).mean() < self.duplicate_threshold:
+                self._duplicates_in_row += 1
+                self.duplicate_frames += 1
+                return True
+        self._thumbnail = thumbnail
+        self._duplicates_in_row = 0
+        return False
+
+    def check_face(self, gray, box):
+        """Return why the face in box isn't worth encoding, or None if it is"""
+        x, y, w, h = box
+        if min(w, h) < self.min_face_size:
+            reason = "small"
+        else:
+            brightness = gray[max(0, y):y + h, max(0, x):x + w].mean()
+            if brightness < self.min_brightness:
+                reason = "dark"
+            elif brightness > self.max_brightness:
+                reason = "bright"
+            elif sharpness(gray, box) < self.min_sharpness:
+                reason = "blurred"
+            else:
+                return None
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return reason
@@ -0,0 +1,100 @@
+import itertools
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = ix * iy
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class Track:
+    """A face followed across frames, carrying the identity decided for it"""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.name = None
+        self.distance = float('inf')
+        self.confidence = 0.0
+        self.status = None
+        self.missed = 0
+        self.frames_since_verify = 0
+
+    def set_identity(self, name, distance, confidence, status):
+        self.name = name
+        self.distance = distance
+        self.confidence = confidence
+        self.status = status
+        self.frames_since_verify = 0
+
+
+class FaceTracker:
+    """Associates detections with existing tracks by greedy IoU matching.
+
+    A track only needs a new descriptor when it is first seen or every
+    reverify_every frames after that; in between its cached identity is reused.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, reverify_every=15):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_every = reverify_every
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.verified = 0
+        self.reused = 0
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, boxes):
+        """Match boxes to tracks, returning (track, needs_verify) for each box"""
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            for b, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, t, b))
+        pairs.sort(reverse=True)
+
+        box_tracks = [None] * len(boxes)
+        matched_tracks = set()
+        for _, t, b in pairs:
+            if t in matched_tracks or box_tracks[b] is not None:
+                continue
+            matched_tracks.add(t)
+            box_tracks[b] = self.tracks[t]
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            survivors.append(track)
+
+        results = []
+        for b, box in enumerate(boxes):
+            track = box_tracks[b]
+            if track is None:
+                track = Track(next(self._ids), box)
+                survivors.append(track)
+                needs_verify = True
+            else:
+                track.box = box
+                track.missed = 0
+                track.frames_since_verify += 1
+                needs_verify = track.status is None or track.frames_since_verify >= self.reverify_every
+            if needs_verify:
+                self.verified += 1
+            else:
+                self.reused += 1
+            results.append((track, needs_verify))
+
+        self.tracks = survivors
+        return results
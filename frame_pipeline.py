@@ -0,0 +1,309 @@
+import os
+import threading
+import time
+from collections import deque
+import cv2
+from PyQt6.QtCore import QThread, pyqtSignal
+from frame_governor import create_governor
+from loges import hot_log, logger
+from metrics import metrics
+from video_frame import FramePool
+
+
+class FrameQueue:
+    """Bounded queue that drops the oldest frame instead of blocking the producer.
+
+    The queue owns a reference to each queued frame; get() passes it to the caller
+    and dropped or cleared frames are released.
+    """
+
+    def __init__(self, maxsize=2):
+        self.frames = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, frame):
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+                metrics.count("frames_dropped")
+                self.frames.popleft().release()
+            self.frames.append(frame)
+            metrics.gauge("queue_depth", len(self.frames))
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.frames:
+                self.condition.wait(timeout)
+            if not self.frames:
+                return None
+            return self.frames.popleft()
+
+    def clear(self):
+        with self.condition:
+            while self.frames:
+                self.frames.popleft().release()
+
+    def qsize(self):
+        return len(self.frames)
+
+
+class RateMeter:
+    """Events per second over a sliding one second window"""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.events = deque()
+
+    def tick(self):
+        now = time.monotonic()
+        self.events.append(now)
+        while self.events and now - self.events[0] > self.window:
+            self.events.popleft()
+
+    @property
+    def rate(self):
+        now = time.monotonic()
+        while self.events and now - self.events[0] > self.window:
+            self.events.popleft()
+        return len(self.events) / self.window
+
+
+class CaptureThread(QThread):
+    """Reads the camera at its native rate, feeding the preview and the recognition queue.
+
+    Video files are paced to their CAP_PROP_FPS, so playback and attendance times follow
+    the recording instead of the decoder's speed. Frames are decoded into a pool of preallocated buffers sized to cover the queue, the
+    frame being processed and up to MAX_PREVIEWS frames waiting to be displayed; newer
+    frames skip the preview while that many are pending. Receivers of frame_ready must
+    call preview_done(frame) once they have finished with it.
+    """
+    frame_ready = pyqtSignal(int, object)
+    capture_failed = pyqtSignal(int, str)
+
+    MAX_PREVIEWS = 2
+
+    def __init__(self, source, frame_queue, frame_size=(640, 480), index=0):
+        super().__init__()
+        self.source = source
+        self.index = index
+        self.frame_queue = frame_queue
+        self.frame_size = frame_size
+        # One buffer being read into and one being processed, besides the queue and previews
+        self.pool = FramePool(frame_queue.frames.maxlen + self.MAX_PREVIEWS + 2, frame_size)
+        self.meter = RateMeter()
+        self.running = True
+        self.previews_lock = threading.Lock()
+        self.previews_pending = 0
+
+    def run(self):
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            logger.error(f"Could not open camera source: {self.source}")
+            self.capture_failed.emit(self.index, str(self.source))
+            return
+
+        is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        fps = capture.get(cv2.CAP_PROP_FPS) if is_file else 0
+        interval = 1.0 / fps if fps > 0 else 0.0
+        due = time.monotonic()
+        logger.info(f"Capture started for source: {self.source}")
+        while self.running:
+            if interval:
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                # After a stall, carry on at the file's rate rather than racing to catch up
+                due = max(due + interval, time.monotonic())
+            frame = self.pool.read(capture)
+            if frame is None:
+                time.sleep(0.01)
+                continue
+            self.meter.tick()
+            self.frame_queue.put(frame.retain())
+            with self.previews_lock:
+                preview = self.previews_pending < self.MAX_PREVIEWS
+                if preview:
+                    self.previews_pending += 1
+            if preview:
+                self.frame_ready.emit(self.index, frame.retain())
+            frame.release()
+
+        capture.release()
+        logger.info(f"Capture stopped for source: {self.source}")
+
+    def preview_done(self, frame):
+        frame.release()
+        with self.previews_lock:
+            self.previews_pending -= 1
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+
+class RecognitionWorker(QThread):
+    """Runs detection and recognition on queued frames as fast as the CPU allows.
+
+    The face detector and attendance manager may be shared between workers;
+    each worker keeps its own tracker. In attendance mode a FrameGovernor, when
+    configured, skips frames while the scene is still and backs off when over budget.
+    """
+    results_ready = pyqtSignal(int, object)
+    enrollment_done = pyqtSignal(int)
+    enrollment_saved = pyqtSignal(int, str, bool)
+
+    MODE_IDLE = "idle"
+    MODE_REGISTER = "register"
+    MODE_ATTENDANCE = "attendance"
+
+    def __init__(self, frame_queue, face_detector=None, db_manager=None, camera=None, index=0):
+        super().__init__()
+        self.frame_queue = frame_queue
+        self.camera = camera
+        self.index = index
+        self.mode = self.MODE_IDLE
+        self.meter = RateMeter()
+        self.running = True
+        self.components_lock = threading.Lock()
+        self.face_detector = None
+        self.db_manager = None
+        self.tracker = None
+        self.prefilter = None
+        self.governor = None
+        self.pending_saves = deque()
+        self.set_components(face_detector, db_manager)
+
+    def set_components(self, face_detector, db_manager):
+        with self.components_lock:
+            self.face_detector = face_detector
+            self.db_manager = db_manager
+            self.tracker = face_detector.create_tracker() if face_detector is not None else None
+            self.prefilter = face_detector.create_prefilter() if face_detector is not None else None
+            self.governor = create_governor(face_detector.config) if face_detector is not None else None
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.frame_queue.clear()
+        with self.components_lock:
+            if self.tracker is not None:
+                self.tracker.reset()
+            if self.prefilter is not None:
+                self.prefilter.reset()
+            if self.governor is not None:
+                self.governor.reset()
+        self.results_ready.emit(self.index, [])
+
+    def save_enrollment(self, name):
+        """Save name's enrollment burst on this worker's thread; enrollment_saved reports the outcome.
+
+        Saving encodes the templates and rewrites the encoding store, which takes too long
+        for the GUI thread.
+        """
+        self.pending_saves.append(name)
+
+    def _save_pending(self):
+        while self.pending_saves:
+            name = self.pending_saves.popleft()
+            with self.components_lock:
+                face_detector = self.face_detector
+            try:
+                saved = face_detector is not None and face_detector.save_face(name)
+            except Exception as e:
+                logger.error(f"Error saving face for {name}: {str(e)}")
+                saved = False
+            self.enrollment_saved.emit(self.index, name, bool(saved))
+
+    def run(self):
+        while self.running:
+            self._save_pending()
+            frame = self.frame_queue.get(timeout=0.1)
+            if frame is None:
+                continue
+            try:
+                results = self._process(frame)
+            finally:
+                # The pooled buffers may be reused as soon as the frame is released
+                frame.release()
+            if results is not None:
+                self.meter.tick()
+                self.results_ready.emit(self.index, results)
+
+    def _process(self, frame):
+        """Run the current mode on frame, returning its results or None if it was skipped"""
+        if self.mode == self.MODE_IDLE:
+            return None
+        with self.components_lock:
+            face_detector = self.face_detector
+            db_manager = self.db_manager
+            tracker = self.tracker
+            prefilter = self.prefilter
+            governor = self.governor if self.mode == self.MODE_ATTENDANCE else None
+        if face_detector is None:
+            return None
+        if governor is not None and not governor.should_process(frame):
+            return None
+
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            if self.mode == self.MODE_REGISTER:
+                results = face_detector.detect_registration_face(frame)
+                # Checked here rather than by the GUI, which must not wait on a remote detector
+                if face_detector.enrollment_burst_done():
+                    self.enrollment_done.emit(self.index)
+            else:
+                results = face_detector.process_attendance(frame, db_manager, tracker=tracker,
+                                                           camera=self.camera, prefilter=prefilter)
+        except Exception as e:
+            hot_log.error(f"frame_error:{self.camera}", "Error processing frame from %s: %s", self.camera, e)
+            return None
+
+        if governor is not None:
+            governor.record(time.perf_counter() - started, time.thread_time() - cpu_started, len(results))
+        return results
+
+    def stop(self):
+        self.running = False
+        self.wait()
+        if self.governor is not None and self.governor.processed:
+            stats = self.governor.stats()
+            logger.info(f"Governor for {self.camera}: {stats['processed']} frames processed, "
+                        f"{stats['skipped']} skipped, {stats['cpu_used_s']:.1f}s CPU used, "
+                        f"~{stats['cpu_saved_s']:.1f}s saved")
+
+
+class CameraPipeline:
+    """Capture thread, frame queue and recognition worker for one camera source"""
+
+    def __init__(self, index, name, source, face_detector, db_manager, queue_size=2):
+        self.index = index
+        self.name = name
+        self.source = source
+        self.latest_results = []
+        self.frame_queue = FrameQueue(maxsize=queue_size)
+        self.worker = RecognitionWorker(self.frame_queue, face_detector, db_manager, camera=name, index=index)
+        self.capture = CaptureThread(source, self.frame_queue, index=index)
+
+    def start(self):
+        self.worker.start()
+        self.capture.start()
+
+    def stop(self):
+        self.capture.stop()
+        self.worker.stop()
+
+
+def camera_sources(config):
+    """Return (name, source) for each entry of the "cameras" config section.
+
+    Sources are device indices or file/stream URLs; numeric strings are treated as indices.
+    """
+    sources = []
+    for i, camera in enumerate(config.get("cameras") or [{"name": "Camera 1", "source": 0}]):
+        source = camera.get("source", 0)
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        sources.append((camera.get("name") or f"Camera {i + 1}", source))
+    return sources
@@ -0,0 +1,257 @@
+import argparse
+import csv
+import os
+import struct
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import cv2
+from recognition_client import RemoteFaceDetector
+from database_manager import DatabaseManager
+from constant import ConfigManager
+from metrics import configure_metrics, stop_metrics
+from loges import logger, stop_logging_thread
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm')
+RESULT_COLUMNS = ['source', 'frame', 'timestamp', 'track_id', 'status', 'name', 'distance', 'x', 'y', 'w', 'h']
+# MP4/QuickTime times count seconds from this epoch
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+
+def _find_box(f, kind, start, end):
+    """Return (payload start, end) of the first kind box between start and end of an MP4 file"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            return None
+        if box_type == kind:
+            return position + header, position + size
+        position += size
+    return None
+
+
+def video_creation_time(path):
+    """When recording started, from the movie header of an MP4/MOV container, as local time.
+
+    Returns None for other containers or when the header leaves it unset. Unlike the file
+    mtime, this isn't moved by the recording ending or the file being copied.
+    """
+    try:
+        with open(path, 'rb') as f:
+            moov = _find_box(f, b"moov", 0, os.fstat(f.fileno()).st_size)
+            mvhd = moov and _find_box(f, b"mvhd", *moov)
+            if not mvhd:
+                return None
+            f.seek(mvhd[0])
+            version = f.read(4)[0]
+            seconds = struct.unpack(">Q" if version == 1 else ">I", f.read(8 if version == 1 else 4))[0]
+    except (OSError, struct.error, IndexError):
+        return None
+    if not seconds:
+        return None
+    return (MP4_EPOCH + timedelta(seconds=seconds)).astimezone().replace(tzinfo=None)
+
+
+def video_start_time(path, start=None):
+    """Timestamp of a video's first frame: start (ISO or "mtime"), else the container's creation time.
+
+    Returns None when neither is known; the file mtime is only used when asked for, since it
+    is usually when recording ended or the file was copied.
+    """
+    if start == "mtime":
+        logger.warning(f"Using the file mtime of {path} as its start time; "
+                       f"attendance may be shifted by the clip length")
+        return datetime.fromtimestamp(os.path.getmtime(path))
+    if start:
+        return datetime.fromisoformat(start)
+    return video_creation_time(path)
+
+
+def iter_video_frames(path, stride, start_time):
+    """Yield (frame_index, timestamp, frame) for every stride-th frame of a video"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        logger.error(f"Could not open video: {path}")
+        return
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    try:
+        while True:
+            if index % stride == 0:
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                yield index, start_time + timedelta(seconds=index / fps), frame
+            elif not capture.grab():
+                break
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_image_frames(paths, stride):
+    """Yield (frame_index, timestamp, frame) for every stride-th image, timestamped by file mtime"""
+    for index, path in enumerate(paths):
+        if index % stride:
+            continue
+        frame = cv2.imread(path)
+        if frame is None:
+            logger.warning(f"Could not read image: {path}")
+            continue
+        yield index, datetime.fromtimestamp(os.path.getmtime(path)), frame
+
+
+def iter_batches(frames, size):
+    """Group (frame_index, timestamp, frame) items into lists of up to size"""
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def collect_sources(inputs):
+    """Expand input paths into ("video", path) and ("images", [paths]) sources"""
+    sources = []
+    for path in inputs:
+        if os.path.isdir(path):
+            images = sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+            videos = sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if f.lower().endswith(VIDEO_EXTENSIONS))
+            if images:
+                sources.append(("images", path, images))
+            sources.extend(("video", video, None) for video in videos)
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            sources.append(("images", path, [path]))
+        elif os.path.isfile(path):
+            sources.append(("video", path, None))
+        else:
+            logger.warning(f"Skipping missing input: {path}")
+    return sources
+
+
+def run(args):
+    config = ConfigManager().get_config()
+    storage_path = args.storage or config.get('save_to_directory') or os.getcwd()
+    logger.info(f"Headless recognition with storage path: {storage_path}")
+    configure_metrics(config.get("metrics"), storage_path)
+
+    if args.server:
+        # The server marks attendance itself; no models or database are opened here
+        face_detector = RemoteFaceDetector(args.server, config, mark_attendance=not args.no_attendance)
+        db_manager = None
+    else:
+        from face_detector import FaceDetector
+        face_detector = FaceDetector(storage_path, config)
+        db_manager = None if args.no_attendance else DatabaseManager(storage_path, config)
+
+    results_file = open(args.results, 'w', newline='') if args.results else None
+    writer = csv.writer(results_file) if results_file else None
+    if writer:
+        writer.writerow(RESULT_COLUMNS)
+
+    total_frames = 0
+    total_faces = 0
+    started = time.perf_counter()
+    try:
+        for kind, source, images in collect_sources(args.inputs):
+            logger.info(f"Processing {kind} source: {source}")
+            face_detector.reset_tracking()
+            if kind == "video":
+                start_time = video_start_time(source, args.start)
+                if start_time is None:
+                    logger.error(f"Skipping {source}: it records no creation time; pass --start "
+                                 f"with the time of its first frame (or --start mtime)")
+                    continue
+                frames = iter_video_frames(source, args.stride, start_time)
+            else:
+                frames = iter_image_frames(images, args.stride)
+
+            source_frames = 0
+            source_faces = 0
+            source_started = time.perf_counter()
+            for batch in iter_batches(frames, args.batch):
+                jobs = []
+                for index, timestamp, frame in batch:
+                    if args.resize:
+                        frame = cv2.resize(frame, args.resize)
+                    job = {"frame": frame, "db_manager": db_manager, "when": timestamp,
+                           "tracker": face_detector.tracker, "prefilter": face_detector.prefilter}
+                    if kind == "images":
+                        # Separate images share no tracks and are never duplicates of each other
+                        job["tracker"], job["prefilter"] = None, face_detector.create_prefilter()
+                    jobs.append(job)
+
+                for (index, timestamp, _), results in zip(batch, face_detector.process_batch(jobs)):
+                    source_frames += 1
+                    source_faces += len(results)
+                    if writer:
+                        name = source if kind == "video" else images[index]
+                        for result in results:
+                            writer.writerow([name, index, timestamp.isoformat(timespec='milliseconds'),
+                                             result.get("track_id", ""), result["status"], result["name"] or "",
+                                             f"{result['distance']:.4f}", *result["box"]])
+
+            elapsed = time.perf_counter() - source_started
+            logger.info(f"{source}: {source_frames} frames, {source_faces} faces in {elapsed:.1f}s "
+                        f"({source_frames / max(elapsed, 1e-9):.1f} frames/s)")
+            total_frames += source_frames
+            total_faces += source_faces
+    finally:
+        if results_file:
+            results_file.close()
+        if db_manager:
+            db_manager.close()
+        stop_metrics()
+
+    elapsed = time.perf_counter() - started
+    print(f"Processed {total_frames} frames and {total_faces} faces in {elapsed:.1f}s: "
+          f"{total_frames / max(elapsed, 1e-9):.2f} frames/s, {total_faces / max(elapsed, 1e-9):.2f} faces/s")
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognize faces and mark attendance from recorded video or images")
+    parser.add_argument("inputs", nargs="+", help="video files, image files or directories of either")
+    parser.add_argument("--storage", help="storage directory (defaults to the configured location)")
+    parser.add_argument("--stride", type=int, default=1, help="process every Nth frame")
+    parser.add_argument("--results", help="write per-frame results to this CSV file")
+    parser.add_argument("--start", help="ISO timestamp of the first video frame, or \"mtime\" for the file's "
+                                        "mtime (defaults to the creation time recorded in MP4/MOV files)")
+    parser.add_argument("--resize", type=parse_size, help="resize frames to WIDTHxHEIGHT before detection")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="recognize this many frames together, batching their face descriptors")
+    parser.add_argument("--no-attendance", action="store_true", help="only write results, don't mark attendance")
+    parser.add_argument("--server", help="send frames to a recognition server at this URL "
+                                         "(http://host:port or unix:///path) instead of loading models")
+    args = parser.parse_args()
+    if args.stride < 1:
+        parser.error("--stride must be at least 1")
+    if args.batch < 1:
+        parser.error("--batch must be at least 1")
+
+    try:
+        run(args)
+    finally:
+        stop_logging_thread()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
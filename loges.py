@@ -2,9 +2,18 @@ import json
 import platform
 import os
 import logging
+import sys
+import threading
+import time
+from collections import Counter
 from logging.handlers import QueueHandler
 from PyQt6.QtCore import QThread, pyqtSignal
-from queue import Queue
+from queue import Empty, Full, Queue
+
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
 
 
 def get_logger_file_path():
@@ -21,60 +30,214 @@ def get_logger_file_path():
     return logger_dir
 
 
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler for a bounded queue that never blocks the logging thread.
+
+    When the queue is full, debug and info records are dropped; warnings and errors
+    evict the oldest queued record instead. Drops are counted and reported by the
+    LoggingThread.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except Full:
+            pass
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (Empty, Full):
+                pass
+        self.dropped += 1
+
+
+class RotatingLogFile:
+    """Append-only log file rotated by size, written a batch at a time.
+
+    The size is tracked from the bytes written rather than asked of the file, so
+    nothing reaches the OS until flush(), which also rotates once the file has
+    reached max_bytes. A file can therefore exceed max_bytes by up to one batch.
+    """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._open()
+
+    def _open(self):
+        self.stream = open(self.path, 'ab')
+        self.size = self.stream.tell()
+
+    def write(self, text):
+        data = text.encode('utf-8', 'backslashreplace')
+        self.stream.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        self.stream.flush()
+        if self.max_bytes and self.size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.stream.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def close(self):
+        self.stream.close()
+
+
 class LoggingThread(QThread):
+    """Writes queued records to the rotating log file (and the console) in batches.
+
+    Each record is formatted once; the batch is then written to the file and the
+    console with one write and one flush each.
+    """
     log_signal = pyqtSignal(str)
 
-    def __init__(self, log_queue, log_file_path):
+    def __init__(self, log_queue, log_file_path, console=True, queue_handler=None,
+                 max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
         super().__init__()
         self.log_queue = log_queue
         self.log_file_path = log_file_path
+        self.console = console
+        self.queue_handler = queue_handler
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
         self.running = True
+        self.reported_drops = 0
 
     def run(self):
-        listener_logger = logging.getLogger('FileSharing:Listener')
-        listener_logger.setLevel(logging.DEBUG)
-
         formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s')
-
-        file_handler = logging.FileHandler(self.log_file_path, mode='a')
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.DEBUG)
-        console_handler.setFormatter(formatter)
-
-        listener_logger.addHandler(file_handler)
-        listener_logger.addHandler(console_handler)
-
-        while self.running:
-            try:
-                record = self.log_queue.get(timeout=0.1)
-                listener_logger.handle(record)
-            except Exception:
-                continue
-
-    def stop(self):
-        self.running = False
+        log_file = RotatingLogFile(self.log_file_path, self.max_bytes, self.backup_count)
+        try:
+            while self.running:
+                # Block for the first record, then take whatever else is already queued
+                batch = [self.log_queue.get()]
+                while len(batch) < LOG_BATCH_SIZE:
+                    try:
+                        batch.append(self.log_queue.get_nowait())
+                    except Empty:
+                        break
+                lines = []
+                for record in batch:
+                    if record is None:
+                        self.running = False
+                    else:
+                        lines.append(formatter.format(record) + "\n")
+                drops = self._drop_report()
+                if drops is not None:
+                    lines.append(formatter.format(drops) + "\n")
+                text = "".join(lines)
+                log_file.write(text)
+                log_file.flush()
+                if self.console:
+                    sys.stderr.write(text)
+                    sys.stderr.flush()
+        finally:
+            log_file.close()
+
+    def _drop_report(self):
+        """A warning record for records dropped since the last report, or None"""
+        dropped = self.queue_handler.dropped if self.queue_handler is not None else 0
+        if dropped <= self.reported_drops:
+            return None
+        record = logging.makeLogRecord({
+            "name": 'FileSharing:Listener', "levelno": logging.WARNING, "levelname": "WARNING",
+            "msg": f"Log queue full, dropped {dropped - self.reported_drops} records"})
+        self.reported_drops = dropped
+        return record
+
+    def stop(self, timeout=5.0):
+        # The sentinel ends the loop once everything queued before it is written
+        try:
+            self.log_queue.put(None, timeout=1.0)
+        except Full:
+            # Not draining (or no longer running): stop after the current batch instead
+            self.running = False
         self.quit()
-        self.wait()
-
-log_queue = Queue()
+        self.wait(int(timeout * 1000))
+
+
+class HotPathLog:
+    """Rate-limited logging for events that can happen on every frame.
+
+    Each event key is written at most once per interval; occurrences in between are
+    only counted, and the count is added to the next line written for that key.
+    Arguments are %-formatted only when a line is actually written.
+    """
+
+    def __init__(self, logger, interval=5.0):
+        self.logger = logger
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {}
+        self.suppressed = Counter()
+        self.totals = Counter()
+
+    def log(self, level, key, msg, *args):
+        now = time.monotonic()
+        with self.lock:
+            self.totals[key] += 1
+            if now - self.last.get(key, -self.interval) < self.interval:
+                self.suppressed[key] += 1
+                return
+            self.last[key] = now
+            suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            msg += " (%d more since the last report)"
+            args += (suppressed,)
+        self.logger.log(level, msg, *args)
+
+    def debug(self, key, msg, *args):
+        self.log(logging.DEBUG, key, msg, *args)
+
+    def info(self, key, msg, *args):
+        self.log(logging.INFO, key, msg, *args)
+
+    def warning(self, key, msg, *args):
+        self.log(logging.WARNING, key, msg, *args)
+
+    def error(self, key, msg, *args):
+        self.log(logging.ERROR, key, msg, *args)
+
+    def counts(self):
+        with self.lock:
+            return dict(self.totals)
+
+log_queue = Queue(maxsize=LOG_QUEUE_SIZE)
 log_dir = get_logger_file_path()
 if log_dir is None:
     raise RuntimeError("Unsupported OS!")
 
 log_file_path = os.path.join(log_dir, 'Face-Recoglog.txt')
-if os.path.exists(log_file_path) and os.path.getsize(log_file_path) > (500 * 1024):
-    os.remove(log_file_path)
+queue_handler = DroppingQueueHandler(log_queue)
 
-logging_thread = LoggingThread(log_queue, log_file_path)
+logging_thread = LoggingThread(log_queue, log_file_path, queue_handler=queue_handler)
 logging_thread.start()
 
 logger = logging.getLogger('FileSharing: ')
 logger.setLevel(logging.DEBUG)
-queue_handler = QueueHandler(log_queue)
 logger.addHandler(queue_handler)
 
+hot_log = HotPathLog(logger)
+
 def stop_logging_thread():
+    counts = hot_log.counts()
+    if counts:
+        logger.info("Rate-limited log events: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
     logging_thread.stop()
\ No newline at end of file
@@ -1,12 +1,23 @@
+import time
+# Startup timings are measured from here, before the heavy imports below
+STARTED = time.perf_counter()
 import sys
+import math
+import multiprocessing
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QPushButton, QLabel, QInputDialog, QMessageBox, 
-                           QFileDialog, QHBoxLayout)
+                           QFileDialog, QHBoxLayout, QGridLayout)
 from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QImage, QPixmap
 import cv2
-from face_detector import FaceDetector
+import numpy as np
+from face_overlay import draw_results
+from face_gallery import person_directory
+from model_loader import ModelLoader
+from recognition_client import DEFAULT_SERVER_URL, RemoteFaceDetector
 from database_manager import DatabaseManager
+from frame_pipeline import RecognitionWorker, CameraPipeline, camera_sources
+from metrics import metrics, configure_metrics, stop_metrics
 from constant import ConfigManager
 from loges import logger
 import os
@@ -21,7 +32,7 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Face Attendance System")
-        self.setFixedSize(900, 600)
+        self.setFixedSize(900, 630)
         self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
 
         self.config_manager = ConfigManager()
@@ -31,7 +42,14 @@ class MainWindow(QMainWindow):
         self.config_data = {}
         self.face_detector = None
         self.db_manager = None
-        self.capture = None
+        self.pipelines = []
+        self.failed_cameras = []
+        self.preview_labels = []
+        self.display_buffers = []
+        self.model_loader = None
+        self.reload_pending = False
+        self.first_preview_at = None
+        self.ready_at = None
         
         self.setup_ui()
         
@@ -57,10 +75,12 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(storage_layout)
 
-        self.camera_label = QLabel()
-        self.camera_label.setFixedSize(640, 480)
-        self.camera_label.setStyleSheet("QLabel { border: 1px solid gray; }")
-        layout.addWidget(self.camera_label, alignment=Qt.AlignmentFlag.AlignCenter)
+        self.preview_widget = QWidget()
+        self.preview_widget.setFixedSize(640, 480)
+        self.preview_grid = QGridLayout(self.preview_widget)
+        self.preview_grid.setContentsMargins(0, 0, 0, 0)
+        self.preview_grid.setSpacing(0)
+        layout.addWidget(self.preview_widget, alignment=Qt.AlignmentFlag.AlignCenter)
 
         button_style = """
         QPushButton {
@@ -86,7 +106,13 @@ class MainWindow(QMainWindow):
         self.status_label.setStyleSheet("QLabel { color: blue; font-size: 14px; }")
         layout.addWidget(self.status_label, alignment=Qt.AlignmentFlag.AlignCenter)
 
+        self.stats_label = QLabel("")
+        self.stats_label.setStyleSheet("QLabel { color: gray; font-size: 11px; }")
+        layout.addWidget(self.stats_label, alignment=Qt.AlignmentFlag.AlignCenter)
+
         self.is_registering = False
+        self.is_capturing_burst = False
+        self.is_saving_face = False
         self.is_marking_attendance = False
         self.current_name = None
 
@@ -100,8 +126,8 @@ class MainWindow(QMainWindow):
         logger.info("Configuration updated")
         self.update_storage_display()
         
-        if self.face_detector and self.db_manager:
-            logger.info("Reinitializing components with new storage path")
+        if self.face_detector:
+            logger.info("Applying new configuration to running components")
             self.initialize_components()
 
     def update_storage_display(self):
@@ -112,7 +138,9 @@ class MainWindow(QMainWindow):
             logger.info(f"Storage location display updated: {path}")
 
     def initialize_components(self):
-        if not self.check_models():
+        server = self.config_data.get("server", {})
+        remote = server.get("enabled", False)
+        if not remote and not self.check_models():
             logger.error("Required dlib models not found")
             QMessageBox.critical(self, "Missing Models", 
                 "Dlib models not found. Please run setup_models.py first.")
@@ -121,32 +149,94 @@ class MainWindow(QMainWindow):
         try:
             storage_path = self.config_data.get('save_to_directory', '')
             logger.info(f"Initializing components with storage path: {storage_path}")
-            
-            self.face_detector = FaceDetector(storage_path)
-            self.db_manager = DatabaseManager(storage_path)
-            
+            configure_metrics(self.config_data.get("metrics"), storage_path)
+
+            previous_db_manager = self.db_manager
+            if (remote or previous_db_manager is None or previous_db_manager.storage_path != storage_path
+                    or previous_db_manager.config.get("attendance") != self.config_data.get("attendance")):
+                # The old manager is closed first so its pending marks are written
+                # before the new one loads who is already marked today
+                if previous_db_manager is not None:
+                    previous_db_manager.close()
+                self.db_manager = None if remote else DatabaseManager(storage_path, self.config_data)
             self.update_storage_display()
-            
-            if self.capture is None:
-                self.capture = cv2.VideoCapture(0)
-                self.timer = QTimer()
-                self.timer.timeout.connect(self.update_frame)
-                self.timer.start(30)
-                logger.info("Camera initialized successfully")
-
-            self.register_btn.setEnabled(True)
-            self.mark_attendance_btn.setEnabled(True)
-            self.change_location_btn.setEnabled(True)
-            
-            self.status_label.setText("Status: Ready")
-            logger.info("Application initialization completed successfully")
-            
+
+            if remote:
+                # Recognition and attendance run in a shared recognition server
+                if not isinstance(self.face_detector, RemoteFaceDetector):
+                    if self.face_detector is not None:
+                        self.face_detector.stop_watching()
+                    self.face_detector = RemoteFaceDetector(server.get("url", DEFAULT_SERVER_URL), self.config_data)
+                    logger.info(f"Using recognition server at {server.get('url', DEFAULT_SERVER_URL)}")
+                self.face_detector.reconfigure(storage_path, self.config_data)
+            elif isinstance(self.face_detector, RemoteFaceDetector):
+                self.face_detector = None
+
+            # The preview starts right away; recognition is enabled once the models are ready
+            if not self.pipelines:
+                self.start_pipelines()
+            else:
+                for pipeline in self.pipelines:
+                    pipeline.worker.set_components(self.face_detector, self.db_manager)
+
+            if remote:
+                self.on_models_ready(self.face_detector)
+            else:
+                self.load_models(storage_path)
+
         except Exception as e:
             logger.error(f"Failed to initialize components: {str(e)}")
             QMessageBox.critical(self, "Initialization Error", 
                 f"Failed to initialize components: {str(e)}")
             sys.exit()
 
+    def load_models(self, storage_path):
+        """Load (or reconfigure) the face detector on a ModelLoader thread"""
+        if self.model_loader is not None and self.model_loader.isRunning():
+            self.reload_pending = True
+            return
+        self.model_loader = ModelLoader(storage_path, self.config_data, self.face_detector)
+        self.model_loader.progress.connect(lambda message: self.status_label.setText(f"Status: {message}"))
+        self.model_loader.ready.connect(self.on_models_ready)
+        self.model_loader.failed.connect(self.on_models_failed)
+        self.model_loader.start()
+
+    def on_models_ready(self, face_detector):
+        if self.reload_pending:
+            # Settings changed while loading; apply them before going ready
+            self.reload_pending = False
+            self.face_detector = face_detector
+            self.load_models(self.config_data.get('save_to_directory', ''))
+            return
+
+        self.face_detector = face_detector
+        gallery_settings = self.config_data.get("gallery", {})
+        if gallery_settings.get("watch", True):
+            self.face_detector.start_watching(gallery_settings.get("watch_interval", 2.0),
+                                              gallery_settings.get("full_scan_interval", 300.0))
+        else:
+            self.face_detector.stop_watching()
+        for pipeline in self.pipelines:
+            pipeline.worker.set_components(self.face_detector, self.db_manager)
+
+        self.register_btn.setEnabled(True)
+        self.mark_attendance_btn.setEnabled(True)
+        self.change_location_btn.setEnabled(True)
+        if self.failed_cameras:
+            self.status_label.setText(f"Status: Ready, could not open camera {', '.join(self.failed_cameras)}")
+        else:
+            self.status_label.setText("Status: Ready")
+        if self.ready_at is None:
+            self.ready_at = time.perf_counter() - STARTED
+            metrics.gauge("startup_ready_s", self.ready_at)
+            logger.info(f"Time to ready: {self.ready_at:.2f}s")
+        logger.info("Application initialization completed successfully")
+
+    def on_models_failed(self, message):
+        QMessageBox.critical(self, "Initialization Error",
+            f"Failed to load face models: {message}")
+        sys.exit()
+
     def change_storage_location(self):
         current_path = self.config_data.get('save_to_directory', '')
         new_path = QFileDialog.getExistingDirectory(
@@ -177,31 +267,144 @@ class MainWindow(QMainWindow):
         logger.info("All required models found")
         return True
 
-    def update_frame(self):
-        if self.capture is None:
+    def start_pipelines(self):
+        """Create one capture/recognition pipeline per configured camera, sharing the models"""
+        sources = camera_sources(self.config_data)
+        self.build_preview_tiles(len(sources))
+
+        for index, (name, source) in enumerate(sources):
+            pipeline = CameraPipeline(index, name, source, self.face_detector, self.db_manager)
+            pipeline.worker.results_ready.connect(self.on_results_ready)
+            pipeline.worker.enrollment_done.connect(self.on_enrollment_done)
+            pipeline.worker.enrollment_saved.connect(self.on_enrollment_saved)
+            pipeline.capture.frame_ready.connect(self.on_frame_ready)
+            pipeline.capture.capture_failed.connect(self.on_capture_failed)
+            pipeline.start()
+            self.pipelines.append(pipeline)
+            logger.info(f"Camera pipeline started: {name} ({source})")
+
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(1000)
+        logger.info("Camera initialized successfully")
+
+    def build_preview_tiles(self, count):
+        columns = 1 if count <= 1 else 2 if count <= 4 else 3
+        rows = math.ceil(count / columns)
+        self.tile_size = (640 // columns, min(480 // rows, (640 // columns) * 3 // 4))
+        for index in range(count):
+            label = QLabel()
+            label.setFixedSize(*self.tile_size)
+            label.setStyleSheet("QLabel { border: 1px solid gray; }")
+            self.preview_grid.addWidget(label, index // columns, index % columns)
+            self.preview_labels.append(label)
+            # Overlays are drawn on a private buffer; the captured frame is shared with the worker
+            self.display_buffers.append(np.empty((self.tile_size[1], self.tile_size[0], 3), dtype=np.uint8))
+
+    def on_capture_failed(self, index, source):
+        name = self.pipelines[index].name
+        self.failed_cameras.append(name)
+        self.preview_labels[index].setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.preview_labels[index].setText(f"{name}: could not open\n{source}")
+        self.status_label.setText(f"Status: Could not open camera {', '.join(self.failed_cameras)}")
+
+    def on_frame_ready(self, index, frame):
+        try:
+            self.show_preview(index, frame)
+        finally:
+            # Hands the pooled frame buffer back to the capture thread
+            self.pipelines[index].capture.preview_done(frame)
+
+    def show_preview(self, index, frame):
+        pipeline = self.pipelines[index]
+        display = self.display_buffers[index]
+        results = pipeline.latest_results
+        if display.shape == frame.shape:
+            np.copyto(display, frame.image)
+        else:
+            cv2.resize(frame.image, self.tile_size, dst=display, interpolation=cv2.INTER_AREA)
+            sx = display.shape[1] / frame.shape[1]
+            sy = display.shape[0] / frame.shape[0]
+            results = [{**r, "box": (int(r["box"][0] * sx), int(r["box"][1] * sy),
+                                     int(r["box"][2] * sx), int(r["box"][3] * sy))} for r in results]
+        draw_results(display, results)
+        if metrics.enabled and self.config_data.get("metrics", {}).get("overlay"):
+            for i, line in enumerate(metrics.overlay_lines()):
+                cv2.putText(display, line, (8, 16 + i * 14), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.4, (0, 255, 255), 1)
+        if len(self.pipelines) > 1:
+            cv2.putText(display, pipeline.name, (6, self.tile_size[1] - 8), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5, (255, 255, 255), 1)
+
+        # QImage wraps the buffer as BGR without conversion; the pixmap is the only copy
+        image = QImage(display.data, display.shape[1], display.shape[0], display.strides[0],
+                       QImage.Format.Format_BGR888)
+        self.preview_labels[index].setPixmap(QPixmap.fromImage(image))
+        if self.first_preview_at is None:
+            self.first_preview_at = time.perf_counter() - STARTED
+            metrics.gauge("startup_preview_s", self.first_preview_at)
+            logger.info(f"Time to first preview: {self.first_preview_at:.2f}s")
+
+    def on_results_ready(self, index, results):
+        self.pipelines[index].latest_results = results
+
+    def on_enrollment_done(self, index):
+        # Frames still queued when the burst ended report it again; only the first one saves
+        if self.is_capturing_burst:
+            self.finish_registration(index)
+
+    def update_stats(self):
+        if not self.pipelines:
             return
-            
-        ret, frame = self.capture.read()
-        if ret:
-            frame = cv2.resize(frame, (640, 480))
-            
+        writes = self.db_manager.stats() if self.db_manager else {"pending": 0, "flushed": None}
+        parts = [
+            f"{p.name}: {p.capture.meter.rate:.0f}/{p.worker.meter.rate:.1f} fps, "
+            f"queue {p.frame_queue.qsize()}, dropped {p.frame_queue.dropped}"
+            for p in self.pipelines
+        ]
+        trackers = [p.worker.tracker for p in self.pipelines if p.worker.tracker]
+        if trackers:
+            parts.append(f"Descriptors: {sum(t.verified for t in trackers)} computed, "
+                         f"{sum(t.reused for t in trackers)} reused")
+        prefilters = [p.worker.prefilter for p in self.pipelines if p.worker.prefilter]
+        if prefilters:
+            parts.append(f"Skipped: {sum(f.duplicate_frames for f in prefilters)} frames, "
+                         f"{sum(f.rejected_faces for f in prefilters)} faces")
+        governors = [p.worker.governor.stats() for p in self.pipelines if p.worker.governor]
+        if governors:
+            active = sum(g["state"] == "active" for g in governors)
+            parts.append(f"Governor: {active}/{len(governors)} active, "
+                         f"{sum(g['skipped'] for g in governors)} frames idled, "
+                         f"~{sum(g['cpu_saved_s'] for g in governors):.0f}s CPU saved")
+        if writes['flushed'] is not None:
+            parts.append(f"Marks: {writes['pending']} pending, {writes['flushed']} written")
+        self.stats_label.setText(" | ".join(parts))
+
+    def update_worker_mode(self):
+        for pipeline in self.pipelines:
             if self.is_registering:
-                self.face_detector.collect_face(frame)
+                # Registration snapshots come from the first camera only
+                mode = RecognitionWorker.MODE_REGISTER if pipeline.index == 0 else RecognitionWorker.MODE_IDLE
             elif self.is_marking_attendance:
-                self.face_detector.recognize_face(frame, self.db_manager)
-            
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            image = QImage(frame_rgb.data, frame_rgb.shape[1], frame_rgb.shape[0], QImage.Format.Format_RGB888)
-            self.camera_label.setPixmap(QPixmap.fromImage(image))
+                mode = RecognitionWorker.MODE_ATTENDANCE
+            else:
+                mode = RecognitionWorker.MODE_IDLE
+            pipeline.worker.set_mode(mode)
 
     def register_face(self):
         if not self.is_registering:
             name, ok = QInputDialog.getText(self, 'Register New Face', 
                                           'Enter person name:')
             if ok and name:
+                try:
+                    person_directory(os.path.join(self.config_data.get('save_to_directory', ''), "faces"), name)
+                except ValueError as e:
+                    QMessageBox.warning(self, "Invalid Name", str(e))
+                    return
                 logger.info(f"Starting face registration for: {name}")
                 self.current_name = name
                 self.is_registering = True
+                self.update_worker_mode()
                 self.register_btn.setText("Press SPACE to capture face")
                 self.status_label.setText("Status: Position face and press SPACE")
                 QMessageBox.information(self, "Instructions", 
@@ -209,43 +412,73 @@ class MainWindow(QMainWindow):
         else:
             logger.info("Face registration cancelled")
             self.is_registering = False
+            self.is_capturing_burst = False
+            self.update_worker_mode()
             self.current_name = None
             self.register_btn.setText("Register New Face")
             self.status_label.setText("Status: Ready")
 
     def mark_attendance(self):
         self.is_marking_attendance = not self.is_marking_attendance
+        self.update_worker_mode()
         self.mark_attendance_btn.setText("Stop Marking" if self.is_marking_attendance else "Mark Attendance")
         logger.info(f"Attendance marking {'started' if self.is_marking_attendance else 'stopped'}")
 
     def keyPressEvent(self, event):
-        if event.key() == Qt.Key.Key_Space and self.is_registering and self.current_name:
-            self.status_label.setText("Status: Capturing face...")
+        if (event.key() == Qt.Key.Key_Space and self.is_registering and self.current_name
+                and not self.is_capturing_burst and not self.is_saving_face):
+            try:
+                self.face_detector.start_enrollment_burst()
+            except RuntimeError as e:
+                # A recognition server registers one client at a time
+                logger.warning(f"Could not start face capture: {str(e)}")
+                self.status_label.setText("Status: Registration busy, try again shortly")
+                return
+            self.status_label.setText("Status: Capturing face, hold still...")
             logger.info(f"Capturing face for: {self.current_name}")
-            success = self.face_detector.save_face(self.current_name)
-            if success:
-                logger.info(f"Face registered successfully for: {self.current_name}")
-                QMessageBox.information(self, "Success", 
-                    f"Face registered successfully for {self.current_name}")
-                self.status_label.setText("Status: Face registered successfully!")
-                self.is_registering = False
-                self.current_name = None
-                self.register_btn.setText("Register New Face")
-            else:
-                logger.warning(f"Failed to capture face for: {self.current_name}")
-                self.status_label.setText("Status: No face detected! Try again.")
-                QMessageBox.warning(self, "Error", 
-                    "Could not detect face. Please try again.")
+            self.is_capturing_burst = True
+
+    def finish_registration(self, index):
+        """Have the worker that ran the capture burst save its best templates"""
+        self.is_capturing_burst = False
+        self.is_saving_face = True
+        self.status_label.setText("Status: Saving face...")
+        self.pipelines[index].worker.save_enrollment(self.current_name)
+
+    def on_enrollment_saved(self, index, name, success):
+        self.is_saving_face = False
+        if success:
+            logger.info(f"Face registered successfully for: {name}")
+            QMessageBox.information(self, "Success", 
+                f"Face registered successfully for {name}")
+            self.status_label.setText("Status: Face registered successfully!")
+            self.is_registering = False
+            self.update_worker_mode()
+            self.current_name = None
+            self.register_btn.setText("Register New Face")
+        else:
+            logger.warning(f"Failed to capture face for: {name}")
+            self.status_label.setText("Status: No clear face captured! Try again.")
+            QMessageBox.warning(self, "Error", 
+                "Could not capture a clear face. Face the camera in good light and try again.")
 
     def closeEvent(self, event):
         logger.info("Application closing")
-        if self.capture:
-            self.capture.release()
+        for pipeline in self.pipelines:
+            pipeline.stop()
+        if self.model_loader is not None:
+            self.model_loader.wait()
+        if self.face_detector:
+            self.face_detector.stop_watching()
+        if self.db_manager:
+            self.db_manager.close()
+        stop_metrics()
         if hasattr(self, 'config_manager'):
             self.config_manager.quit()
             self.config_manager.wait()
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from loges import logger
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, float('inf'))
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are estimated from bucket bounds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max,
+            "buckets": dict(zip([str(b) for b in self.buckets], self.counts))
+        }
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Process-wide stage timers, counters and gauges.
+
+    Every recording call returns immediately while disabled, so instrumentation
+    can stay in the hot path.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+            self.started = time.time()
+
+    def timer(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name, value_ms):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value_ms)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        if not self.enabled:
+            return
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """Return all current metrics as a JSON-serialisable dict"""
+        with self.lock:
+            counters = dict(self.counters)
+            snapshot = {
+                "timestamp": time.time(),
+                "uptime_s": time.time() - self.started,
+                "stages": {name: h.snapshot() for name, h in self.histograms.items()},
+                "counters": counters,
+                "gauges": dict(self.gauges)
+            }
+        faces = counters.get("faces_matched", 0) + counters.get("faces_unknown", 0)
+        frames = counters.get("frames", 0)
+        snapshot["rates"] = {
+            "faces_per_frame": counters.get("faces", 0) / frames if frames else None,
+            "match_rate": counters.get("faces_matched", 0) / faces if faces else None,
+            "unknown_rate": counters.get("faces_unknown", 0) / faces if faces else None
+        }
+        return snapshot
+
+    def to_prometheus(self, snapshot=None):
+        """Render a snapshot in the Prometheus text exposition format"""
+        snapshot = snapshot or self.snapshot()
+        lines = []
+        with self.lock:
+            histograms = {name: (list(h.buckets), list(h.counts), h.count, h.total)
+                          for name, h in self.histograms.items()}
+        if histograms:
+            lines.append("# TYPE face_recog_stage_ms histogram")
+        for name, (buckets, counts, count, total) in histograms.items():
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                lines.append(f'face_recog_stage_ms_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'face_recog_stage_ms_sum{{stage="{name}"}} {total:.3f}')
+            lines.append(f'face_recog_stage_ms_count{{stage="{name}"}} {count}')
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE face_recog_{name}_total counter")
+            lines.append(f"face_recog_{name}_total {value}")
+        for name, value in snapshot["gauges"].items():
+            lines.append(f"# TYPE face_recog_{name} gauge")
+            lines.append(f"face_recog_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def overlay_lines(self):
+        """Short per-stage summary for drawing over the preview"""
+        with self.lock:
+            stages = [(name, h.percentile(0.5)) for name, h in self.histograms.items()]
+            dropped = self.counters.get("frames_dropped", 0)
+            depth = self.gauges.get("queue_depth")
+        lines = [f"{name}: {p50:.1f} ms" for name, p50 in stages if p50 is not None]
+        lines.append(f"dropped: {dropped} queue: {depth if depth is not None else '-'}")
+        return lines
+
+
+class MetricsExporter(threading.Thread):
+    """Periodically writes a metrics snapshot to a local file as JSON or Prometheus text"""
+
+    def __init__(self, metrics, path, interval=10.0, fmt="json"):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.fmt = fmt
+        self.stop_event = threading.Event()
+
+    def write(self):
+        snapshot = self.metrics.snapshot()
+        if self.fmt == "prometheus":
+            content = self.metrics.to_prometheus(snapshot)
+        else:
+            content = json.dumps(snapshot, indent=2)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error writing metrics to {self.path}: {str(e)}")
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+        self.write()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+metrics = Metrics()
+_exporter = None
+
+
+def configure_metrics(settings, storage_path):
+    """Enable or disable metrics from the "metrics" config section and (re)start the file exporter"""
+    global _exporter
+    settings = settings or {}
+    if _exporter is not None:
+        _exporter.stop()
+        _exporter = None
+
+    metrics.enabled = bool(settings.get("enabled", False))
+    if not metrics.enabled:
+        return
+
+    fmt = settings.get("format", "json")
+    default_name = "metrics.prom" if fmt == "prometheus" else "metrics.json"
+    path = settings.get("export_path") or os.path.join(storage_path, default_name)
+    interval = float(settings.get("interval", 10))
+    if interval > 0:
+        _exporter = MetricsExporter(metrics, path, interval, fmt)
+        _exporter.start()
+        logger.info(f"Writing {fmt} metrics to {path} every {interval}s")
+
+
+def stop_metrics():
+    global _exporter
+    if _exporter is not None:
+        _exporter.stop()
+        _exporter = None
@@ -0,0 +1,44 @@
+import time
+from PyQt6.QtCore import QThread, pyqtSignal
+from loges import logger
+
+
+class ModelLoader(QThread):
+    """Loads the dlib models and the face gallery off the GUI thread.
+
+    Emits progress(message) as each stage starts, then ready(face_detector) or
+    failed(message). Given a running detector it is reconfigured instead, which
+    keeps the loaded models and only reloads the gallery if the settings changed.
+    """
+    progress = pyqtSignal(str)
+    ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, storage_path, config, face_detector=None):
+        super().__init__()
+        self.storage_path = storage_path
+        self.config = config
+        self.face_detector = face_detector
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            if self.face_detector is not None:
+                self.progress.emit("Loading face gallery...")
+                self.face_detector.reconfigure(self.storage_path, self.config)
+                face_detector = self.face_detector
+            else:
+                self.progress.emit("Loading face models...")
+                # dlib is imported here rather than at startup so the window opens without it
+                from face_detector import FaceDetector, get_resource_path
+                from face_models import PREDICTOR_MODEL, RECOGNITION_MODEL, load_models
+                load_models(get_resource_path(PREDICTOR_MODEL), get_resource_path(RECOGNITION_MODEL))
+                self.progress.emit("Loading face gallery...")
+                face_detector = FaceDetector(self.storage_path, self.config)
+        except Exception as e:
+            logger.error(f"Failed to load face models: {str(e)}")
+            self.failed.emit(str(e))
+            return
+
+        logger.info(f"Face models and gallery loaded in {time.perf_counter() - started:.2f}s")
+        self.ready.emit(face_detector)
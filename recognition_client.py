@@ -0,0 +1,176 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlencode, urlsplit
+import cv2
+import numpy as np
+from face_quality import FramePrefilter
+from video_frame import as_frame
+
+DEFAULT_SERVER_URL = "http://127.0.0.1:8765"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP over a Unix domain socket"""
+
+    def __init__(self, socket_path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        import socket
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RecognitionClient:
+    """Talks to a recognition server over http://host:port or unix:///path/to/socket.
+
+    Connections are kept alive and held per thread, so one client can be shared by
+    several camera workers.
+    """
+
+    def __init__(self, url=DEFAULT_SERVER_URL, timeout=30, encoding="raw"):
+        self.url = url
+        self.timeout = timeout
+        self.encoding = encoding
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            parts = urlsplit(self.url)
+            if parts.scheme == "unix":
+                connection = UnixHTTPConnection(parts.path, self.timeout)
+            else:
+                connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def request(self, method, path, body=None, headers=None):
+        """Send one request, reconnecting once if the kept-alive connection was dropped"""
+        for attempt in (0, 1):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (ConnectionError, http.client.HTTPException, OSError):
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+        payload = json.loads(data) if data else {}
+        if response.status != 200:
+            raise RuntimeError(f"Recognition server error {response.status}: {payload.get('error', '')}")
+        return payload
+
+    def _image_body(self, image):
+        if self.encoding == "jpeg":
+            ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if not ok:
+                raise RuntimeError("Could not encode frame")
+            return buffer.tobytes(), {"Content-Type": "image/jpeg"}
+        image = np.ascontiguousarray(image)
+        return image.tobytes(), {"Content-Type": "application/octet-stream",
+                                 "X-Frame-Shape": f"{image.shape[0]},{image.shape[1]}"}
+
+    def post_image(self, path, image, **params):
+        body, headers = self._image_body(image)
+        query = urlencode({k: v for k, v in params.items() if v is not None})
+        return self.request("POST", f"{path}?{query}" if query else path, body, headers)
+
+    def post_json(self, path, data):
+        return self.request("POST", path, json.dumps(data).encode(), {"Content-Type": "application/json"})
+
+    def recognize(self, image, camera=None, mark=True, when=None, crop=False):
+        """Return per-face results for a frame, or for a face crop with crop=True"""
+        payload = self.post_image("/recognize", image, camera=camera, mark=int(mark),
+                                  when=when.isoformat() if when else None, crop=int(crop))
+        return [_result_from_json(result) for result in payload["results"]]
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def stats(self):
+        return self.request("GET", "/stats")
+
+
+def _result_from_json(result):
+    result["box"] = tuple(result["box"])
+    return result
+
+
+class RemoteFaceDetector:
+    """Stands in for FaceDetector, forwarding recognition and registration to a server.
+
+    Nothing here loads dlib models or the gallery; duplicate frames are still skipped
+    locally so they never cross the socket. Attendance is marked by the server.
+    """
+
+    def __init__(self, url=DEFAULT_SERVER_URL, config=None, mark_attendance=True):
+        self.config = config or {}
+        self.client = RecognitionClient(url, encoding=self.config.get("server", {}).get("encoding", "raw"))
+        self.mark_attendance = mark_attendance
+        self.tracker = None
+        self.prefilter = self.create_prefilter()
+        self.burst = None
+        self.burst_done = False
+
+    def create_tracker(self):
+        # Tracking happens on the server, per camera
+        return None
+
+    def create_prefilter(self):
+        settings = dict(self.config.get("prefilter", {}))
+        if not settings.pop("enabled", True):
+            return None
+        return FramePrefilter(**settings)
+
+    def process_attendance(self, frame, db_manager=None, tracker=None, when=None, camera=None, prefilter=None):
+        frame = as_frame(frame)
+        prefilter = prefilter or self.prefilter
+        if prefilter is not None and prefilter.is_duplicate(frame.gray):
+            return prefilter.last_results
+        results = self.client.recognize(frame.image, camera=camera, mark=self.mark_attendance, when=when)
+        if prefilter is not None:
+            prefilter.last_results = results
+        return results
+
+    def process_batch(self, jobs):
+        """Send process_batch jobs one at a time; the server does its own batching across clients"""
+        return [self.process_attendance(job["frame"], when=job.get("when"), camera=job.get("camera"),
+                                        prefilter=job.get("prefilter")) for job in jobs]
+
+    def detect_registration_face(self, frame):
+        payload = self.client.post_image("/registration/frame", as_frame(frame).image, burst=self.burst)
+        self.burst_done = payload.get("burst_done", False)
+        return [_result_from_json(result) for result in payload["results"]]
+
+    def start_enrollment_burst(self, frames=None):
+        """Start a burst on the server; raises RuntimeError while another client is registering"""
+        self.burst_done = False
+        self.burst = self.client.post_json("/registration/start", {"frames": frames})["burst"]
+
+    def enrollment_burst_done(self):
+        """Burst status as of the last registration frame, so checking it costs no request"""
+        return self.burst_done
+
+    def save_face(self, name):
+        burst, self.burst = self.burst, None
+        return self.client.post_json("/registration/save", {"name": name, "burst": burst})["saved"]
+
+    def reset_tracking(self):
+        if self.prefilter is not None:
+            self.prefilter.reset()
+
+    def reconfigure(self, storage_path, config):
+        self.config = config
+
+    def start_watching(self, interval=2.0, full_interval=300.0):
+        pass
+
+    def stop_watching(self):
+        pass
@@ -0,0 +1,414 @@
+import argparse
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import cv2
+import numpy as np
+from face_detector import FaceDetector
+from face_gallery import person_directory
+from database_manager import DatabaseManager
+from constant import ConfigManager
+from metrics import configure_metrics, metrics, stop_metrics
+from loges import hot_log, logger, stop_logging_thread
+
+
+class BatchProcessor:
+    """Pool of workers that recognize queued jobs in micro-batches.
+
+    Each worker runs up to max_batch jobs through a single FaceDetector.process_batch
+    call. Once it has one job it waits up to max_wait for more, but only while other
+    requests for it are still open, so a lone client never pays the wait. Jobs from the
+    same camera always go to the same worker, so that camera's tracker is only ever
+    updated by one thread and in arrival order.
+    """
+
+    def __init__(self, face_detector, workers=2, max_batch=8, max_wait=0.005):
+        self.face_detector = face_detector
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.queues = [queue.Queue() for _ in range(max(1, workers))]
+        self.open = [0] * len(self.queues)
+        self.trackers = {}
+        self.next_queue = 0
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.batches = 0
+        self.threads = [threading.Thread(target=self._run, args=(slot,), daemon=True)
+                        for slot in range(len(self.queues))]
+        for thread in self.threads:
+            thread.start()
+
+    @contextmanager
+    def reserve(self, camera=None):
+        """Hold a worker slot for a request whose frame is still being received"""
+        with self.lock:
+            if camera is None:
+                self.next_queue = (self.next_queue + 1) % len(self.queues)
+                slot = self.next_queue
+            else:
+                if camera not in self.trackers:
+                    self.trackers[camera] = self.face_detector.create_tracker()
+                slot = hash(camera) % len(self.queues)
+            self.open[slot] += 1
+        try:
+            yield slot
+        finally:
+            with self.lock:
+                self.open[slot] -= 1
+
+    def submit(self, slot, job):
+        """Queue a process_batch job on a reserved slot and return a Future for its results"""
+        future = Future()
+        camera = job.get("camera")
+        if camera is not None:
+            job["tracker"] = self.trackers[camera]
+        self.queues[slot].put((job, future))
+        return future
+
+    def _collect(self, slot):
+        """Take a first job, then whatever else arrives within max_wait, up to max_batch"""
+        jobs = self.queues[slot]
+        item = jobs.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < min(self.max_batch, self.open[slot]):
+            remaining = deadline - time.monotonic()
+            try:
+                item = jobs.get(timeout=remaining) if remaining > 0 else jobs.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                jobs.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self, slot):
+        while True:
+            batch = self._collect(slot)
+            if batch is None:
+                return
+            with self.lock:
+                self.jobs += len(batch)
+                self.batches += 1
+            try:
+                with metrics.timer("server_batch"):
+                    results = self.face_detector.process_batch([job for job, _ in batch])
+                for (_, future), job_results in zip(batch, results):
+                    future.set_result(job_results)
+            except Exception as e:
+                hot_log.error("server_batch_error", "Error processing recognition batch: %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self):
+        with self.lock:
+            return {"jobs": self.jobs, "batches": self.batches, "cameras": len(self.trackers),
+                    "mean_batch_size": self.jobs / self.batches if self.batches else 0.0,
+                    "queued": sum(q.qsize() for q in self.queues)}
+
+    def stop(self):
+        for jobs in self.queues:
+            jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+def _decode_image(headers, body):
+    """A BGR image from a request body: raw pixels with X-Frame-Shape, or any format cv2 decodes"""
+    shape = headers.get("X-Frame-Shape")
+    if shape:
+        height, width = (int(v) for v in shape.split(","))
+        if len(body) != height * width * 3:
+            raise ValueError(f"Body is {len(body)} bytes, expected {height}x{width}x3")
+        return np.frombuffer(body, dtype=np.uint8).reshape(height, width, 3)
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+class RegistrationBusy(Exception):
+    """Another client's enrollment burst is in progress"""
+
+
+def _result_json(result):
+    result = dict(result)
+    result["box"] = [int(v) for v in result["box"]]
+    for key in ("distance", "confidence", "quality"):
+        if key in result:
+            result[key] = float(result[key])
+    return result
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    """HTTP API of the recognition server; see RecognitionServer for the endpoints"""
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; with Nagle on, each response waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_request(self, code='-', size='-'):
+        # One line per frame would flood the log; errors still go through log_message
+        pass
+
+    def log_message(self, format, *args):
+        logger.warning(f"Recognition server: {format % args}")
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _json_body(self):
+        body = self._body()
+        return json.loads(body) if body else {}
+
+    def do_GET(self):
+        server = self.server.recognition
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send(200, server.health())
+        elif path == "/stats":
+            self._send(200, server.stats())
+        elif path == "/registration/status":
+            burst = parse_qs(urlsplit(self.path).query).get("burst", [None])[-1]
+            self._send(200, {"done": server.registration_done(burst)})
+        else:
+            self._send(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        server = self.server.recognition
+        parts = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        try:
+            with metrics.timer("server_request"):
+                if parts.path == "/recognize":
+                    with server.processor.reserve(params.get("camera")) as slot:
+                        image = _decode_image(self.headers, self._body())
+                        results = server.recognize(image, params.get("camera"), params.get("mark", "1") == "1",
+                                                   params.get("when"), params.get("crop", "0") == "1", slot)
+                    self._send(200, {"results": [_result_json(r) for r in results]})
+                elif parts.path == "/registration/frame":
+                    image = _decode_image(self.headers, self._body())
+                    results, done = server.registration_frame(image, params.get("burst"))
+                    self._send(200, {"results": [_result_json(r) for r in results], "burst_done": done})
+                elif parts.path == "/registration/start":
+                    self._send(200, {"started": True,
+                                     "burst": server.start_registration(self._json_body().get("frames"))})
+                elif parts.path == "/registration/save":
+                    body = self._json_body()
+                    self._send(200, {"saved": server.save_registration(body.get("name", "").strip(),
+                                                                       body.get("burst"))})
+                else:
+                    self._send(404, {"error": f"Unknown path {parts.path}"})
+        except RegistrationBusy as e:
+            self._send(409, {"error": str(e)})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"Error handling {parts.path}: {str(e)}")
+            self._send(500, {"error": str(e)})
+
+
+class UnixRecognitionHandler(RecognitionHandler):
+    # TCP_NODELAY does not apply to Unix sockets
+    disable_nagle_algorithm = False
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class RecognitionServer:
+    """Serves one FaceDetector and DatabaseManager to local clients over HTTP or a Unix socket.
+
+    Endpoints:
+      POST /recognize?camera=&mark=1&when=&crop=0   frame or face crop -> {"results": [...]}
+      POST /registration/frame?burst=               registration preview frame ->
+                                                    {"results": [...], "burst_done": bool}
+      POST /registration/start {"frames": n}        begin an enrollment burst -> {"burst": id}
+      GET  /registration/status?burst=              {"done": bool}
+      POST /registration/save {"name":, "burst":}   {"saved": bool}
+      GET  /health, GET /stats
+
+    Images are either raw BGR bytes with an X-Frame-Shape: height,width header or an
+    encoded image (JPEG, PNG). Recognition runs in micro-batches on a worker pool.
+
+    The face detector holds a single enrollment burst, so one client registers at a
+    time: the burst id returned by /registration/start must accompany its frames and
+    save, and other clients get 409 until it is saved or idle for REGISTRATION_TIMEOUT.
+    """
+    REGISTRATION_TIMEOUT = 30.0
+
+    def __init__(self, face_detector, db_manager=None, host="127.0.0.1", port=8765, unix_socket=None,
+                 workers=2, max_batch=8, max_wait_ms=5):
+        self.face_detector = face_detector
+        self.db_manager = db_manager
+        self.processor = BatchProcessor(face_detector, workers, max_batch, max_wait_ms / 1000)
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self.httpd = UnixHTTPServer(unix_socket, UnixRecognitionHandler)
+            self.url = f"unix://{unix_socket}"
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), RecognitionHandler)
+            self.httpd.daemon_threads = True
+            self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.httpd.recognition = self
+        self.unix_socket = unix_socket
+        self.thread = None
+        self.registration_lock = threading.Lock()
+        self.burst = None
+        self.burst_seen = 0.0
+
+    def recognize(self, image, camera=None, mark=True, when=None, crop=False, slot=None):
+        """Recognize one frame (or face crop with crop=True) on the worker pool, blocking until done"""
+        job = {"frame": image, "db_manager": self.db_manager if mark else None,
+               "when": datetime.fromisoformat(when) if when else None, "camera": camera, "crop": crop}
+        if slot is not None:
+            return self.processor.submit(slot, job).result()
+        with self.processor.reserve(camera) as slot:
+            return self.processor.submit(slot, job).result()
+
+    def _check_burst(self, burst):
+        """Raise RegistrationBusy unless burst is the live enrollment burst or none is live"""
+        now = time.monotonic()
+        if self.burst is not None and now - self.burst_seen > self.REGISTRATION_TIMEOUT:
+            logger.info(f"Enrollment burst {self.burst} abandoned")
+            self.burst = None
+        if self.burst is not None and burst != self.burst:
+            raise RegistrationBusy("Another client is registering a face")
+        if self.burst is not None:
+            self.burst_seen = now
+
+    def start_registration(self, frames=None):
+        """Begin an enrollment burst, returning the id its frames and save must carry"""
+        with self.registration_lock:
+            self._check_burst(None)
+            self.face_detector.start_enrollment_burst(frames)
+            self.burst = uuid.uuid4().hex
+            self.burst_seen = time.monotonic()
+            return self.burst
+
+    def registration_frame(self, image, burst=None):
+        """Detect the registration face in image, returning (results, whether burst is done)"""
+        with self.registration_lock:
+            self._check_burst(burst)
+            results = self.face_detector.detect_registration_face(image)
+            return results, self.burst is not None and self.face_detector.enrollment_burst_done()
+
+    def registration_done(self, burst):
+        with self.registration_lock:
+            self._check_burst(burst)
+            return self.burst is not None and self.face_detector.enrollment_burst_done()
+
+    def save_registration(self, name, burst):
+        """Enroll name from burst's templates; raises ValueError for an invalid name"""
+        person_directory(self.face_detector.gallery.faces_dir, name)
+        with self.registration_lock:
+            self._check_burst(burst)
+            if self.burst is None:
+                raise RegistrationBusy("No enrollment burst to save; start one first")
+            try:
+                return self.face_detector.save_face(name)
+            finally:
+                self.burst = None
+
+    def health(self):
+        return {"status": "ok", "people": self.face_detector.gallery.people(),
+                "templates": len(self.face_detector.gallery)}
+
+    def stats(self):
+        stats = {"batching": self.processor.stats(), "metrics": metrics.snapshot()}
+        if self.db_manager is not None:
+            stats["attendance"] = self.db_manager.stats()
+        return stats
+
+    def serve_forever(self):
+        logger.info(f"Recognition server listening on {self.url}")
+        self.httpd.serve_forever()
+
+    def start(self):
+        """Serve from a background thread, returning once the socket is accepting requests"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.processor.stop()
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+        if self.thread is not None:
+            self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve face recognition and attendance marking to local clients")
+    parser.add_argument("--storage", help="storage directory (defaults to the configured location)")
+    parser.add_argument("--host", help="address to listen on (defaults to the server config, 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="port to listen on (defaults to the server config, 8765)")
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, help="recognition worker threads")
+    parser.add_argument("--max-batch", type=int, help="most frames recognized in one batch")
+    parser.add_argument("--max-wait-ms", type=float, help="how long a worker waits to fill a batch")
+    parser.add_argument("--no-attendance", action="store_true", help="only recognize, never mark attendance")
+    args = parser.parse_args()
+
+    config = ConfigManager().get_config()
+    settings = config.get("server", {})
+    storage_path = args.storage or config.get('save_to_directory') or os.getcwd()
+    logger.info(f"Recognition server with storage path: {storage_path}")
+    configure_metrics(config.get("metrics"), storage_path)
+
+    face_detector = FaceDetector(storage_path, config)
+    db_manager = None if args.no_attendance else DatabaseManager(storage_path, config)
+    gallery_settings = config.get("gallery", {})
+    if gallery_settings.get("watch", True):
+        face_detector.start_watching(gallery_settings.get("watch_interval", 2.0),
+                                     gallery_settings.get("full_scan_interval", 300.0))
+
+    server = RecognitionServer(
+        face_detector, db_manager,
+        host=args.host or settings.get("host", "127.0.0.1"),
+        port=args.port if args.port is not None else settings.get("port", 8765),
+        unix_socket=args.unix or settings.get("unix_socket") or None,
+        workers=args.workers or settings.get("workers", 2),
+        max_batch=args.max_batch or settings.get("max_batch", 8),
+        max_wait_ms=args.max_wait_ms if args.max_wait_ms is not None else settings.get("max_wait_ms", 5))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Recognition server stopping")
+    finally:
+        server.stop()
+        face_detector.stop_watching()
+        if db_manager:
+            db_manager.close()
+        stop_metrics()
+        stop_logging_thread()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,188 @@
+import argparse
+import bz2
+import hashlib
 import os
+import sys
+import urllib.parse
 import urllib.request
-import bz2
+from concurrent.futures import ThreadPoolExecutor
+
+# Download URL and SHA-256 of the extracted model as published by dlib
+MODELS = {
+    "shape_predictor_68_face_landmarks.dat": (
+        "http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2",
+        "fbdc2cb80eb9aa7a758672cbfdda32ba6300efe9b6e6c7a299ff7e736b11b92f"),
+    "dlib_face_recognition_resnet_model_v1.dat": (
+        "http://dlib.net/files/dlib_face_recognition_resnet_model_v1.dat.bz2",
+        "55533b28a95800a551ba546ba62fe69625c7e95a7061c338adffead08719da30")
+}
+CHUNK_SIZE = 1024 * 1024
+
+
+def read_checksums(path):
+    """Read a sha256sum-style manifest ("<hex>  <file name>" per line) into {name: hex}"""
+    checksums = {}
+    if not os.path.exists(path):
+        return checksums
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                checksums[os.path.basename(parts[1].lstrip('*'))] = parts[0].lower()
+    return checksums
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_archive(model_name, url, mirror=None, archives=None):
+    """Open the compressed model from a pre-fetched file, a mirror directory or URL, or url"""
+    archive_name = model_name + ".bz2"
+    for path in archives or ():
+        if os.path.basename(path) == archive_name:
+            return open(path, 'rb'), path
+    if mirror:
+        if os.path.isdir(mirror):
+            path = os.path.join(mirror, archive_name)
+            return open(path, 'rb'), path
+        url = mirror.rstrip('/') + '/' + urllib.parse.quote(archive_name)
+    return urllib.request.urlopen(url, timeout=60), url
+
+
+def decompress_stream(source, out, digest):
+    """Decompress the bz2 stream in source into out, CHUNK_SIZE at a time in both directions.
+
+    Raises ValueError if the stream ends before the end-of-stream marker, so a truncated
+    download never gets installed.
+    """
+    decompressor = bz2.BZ2Decompressor()
+    size = 0
+    while not decompressor.eof:
+        if decompressor.needs_input:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("compressed stream is truncated")
+            data = decompressor.decompress(chunk, CHUNK_SIZE)
+        else:
+            data = decompressor.decompress(b"", CHUNK_SIZE)
+        digest.update(data)
+        out.write(data)
+        size += len(data)
+    return size
+
+
+def install_model(model_name, url, models_dir, expected, mirror=None, archives=None):
+    """Fetch, decompress and verify one model, returning its SHA-256.
+
+    The model is written to a temporary file and only renamed into place once it is
+    complete and matches expected.
+    """
+    model_path = os.path.join(models_dir, model_name)
+    tmp_path = model_path + ".part"
+    source, location = open_archive(model_name, url, mirror, archives)
+    print(f"Fetching {model_name} from {location}...")
+    digest = hashlib.sha256()
+    try:
+        with source, open(tmp_path, 'wb') as out:
+            size = decompress_stream(source, out, digest)
+            out.flush()
+            os.fsync(out.fileno())
+        sha256 = digest.hexdigest()
+        if sha256 != expected:
+            raise ValueError(f"checksum mismatch: expected {expected}, got {sha256}")
+        os.replace(tmp_path, model_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    print(f"Extracted {model_name} ({size / (1024 * 1024):.1f} MB)")
+    return sha256
 
-def download_dlib_models():
-    """Download required dlib models"""
-    models_dir = "models"
+
+def download_dlib_models(models_dir="models", mirror=None, archives=None, checksums=None, force=False):
+    """Download required dlib models, verifying each against its SHA-256.
+
+    Every model must match the digest dlib published for it (see MODELS), or the digest
+    given in checksums for a model built elsewhere; nothing that fails to verify is
+    installed or kept. Existing models are kept if they verify unless force is set.
+    Returns {model name: SHA-256}.
+    """
     os.makedirs(models_dir, exist_ok=True)
-    
-    models = {
-        "shape_predictor_68_face_landmarks.dat": "http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2",
-        "dlib_face_recognition_resnet_model_v1.dat": "http://dlib.net/files/dlib_face_recognition_resnet_model_v1.dat.bz2"
-    }
-    
-    for model_name, url in models.items():
+    expected = {name: digest for name, (_, digest) in MODELS.items()}
+    expected.update({name: digest.lower() for name, digest in (checksums or {}).items()})
+
+    def setup(model_name):
         model_path = os.path.join(models_dir, model_name)
-        compressed_path = model_path + ".bz2"
-        
-        if not os.path.exists(model_path):
-            print(f"Downloading {model_name}...")
-            
-            urllib.request.urlretrieve(url, compressed_path)
-            
-            with bz2.BZ2File(compressed_path, 'rb') as f:
-                with open(model_path, 'wb') as out:
-                    out.write(f.read())
-            
-            os.remove(compressed_path)
-            print(f"Downloaded and extracted {model_name}")
-        else:
-            print(f"{model_name} already exists")
+        if os.path.exists(model_path) and not force:
+            if file_sha256(model_path) == expected[model_name]:
+                print(f"{model_name} already exists and verified")
+                return expected[model_name]
+            print(f"{model_name} does not match its checksum, reinstalling")
+            os.remove(model_path)
+        return install_model(model_name, MODELS[model_name][0], models_dir, expected[model_name],
+                             mirror, archives)
 
-if __name__ == "__main__":
-    download_dlib_models()
+    # Downloading, decompression and hashing all release the GIL, so threads overlap them
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=len(MODELS)) as executor:
+        futures = {name: executor.submit(setup, name) for name in MODELS}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+                print(f"Failed to set up {name}: {str(e)}")
+
+    if errors:
+        raise RuntimeError(f"Could not set up {', '.join(errors)}")
+    return results
+
+
+def parse_checksum(value):
+    name, sep, digest = value.partition("=")
+    if not sep or len(digest) != 64:
+        raise argparse.ArgumentTypeError("expected MODEL_NAME=SHA256")
+    return name, digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download, extract and verify the dlib models")
+    parser.add_argument("archives", nargs="*", help="pre-fetched .bz2 model files to install instead of downloading")
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--mirror", help="directory or base URL holding the .bz2 files")
+    parser.add_argument("--checksums",
+                        help="SHA256SUMS file of digests to expect instead of the published ones")
+    parser.add_argument("--sha256", type=parse_checksum, action="append", default=[],
+                        help="digest to expect for an extracted model instead of the published one, "
+                             "as MODEL_NAME=SHA256; repeatable")
+    parser.add_argument("--force", action="store_true", help="reinstall models that already exist")
+    args = parser.parse_args()
+
+    if args.checksums and not os.path.exists(args.checksums):
+        parser.error(f"checksum file {args.checksums} not found")
+    for name, _ in args.sha256:
+        if name not in MODELS:
+            parser.error(f"unknown model {name}")
+    for path in args.archives:
+        if os.path.basename(path)[:-len(".bz2")] not in MODELS:
+            parser.error(f"{path} is not one of: {', '.join(name + '.bz2' for name in MODELS)}")
+
+    checksums = read_checksums(args.checksums) if args.checksums else {}
+    checksums.update(args.sha256)
+    try:
+        download_dlib_models(args.models_dir, args.mirror, args.archives, checksums, args.force)
+    except RuntimeError as e:
+        print(str(e))
+        return 1
     print("All models downloaded successfully!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def logging_thread():
+    # loges starts its writer thread on import; stop it so the run exits cleanly
+    yield
+    import loges
+    loges.stop_logging_thread()
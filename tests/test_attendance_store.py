@@ -0,0 +1,102 @@
+import csv
+
+import pytest
+
+from attendance_store import AttendanceStore, CSVAttendanceStore, SQLiteAttendanceStore
+
+ROWS = [("ann", "2026-10-01", "09:00:00"), ("bob", "2026-10-01", "08:30:00"),
+        ("ann", "2026-10-02", "09:15:00"), ("cy", "2026-10-03", "10:00:00")]
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "csv":
+        store = CSVAttendanceStore(str(tmp_path / "attendance.csv"))
+    else:
+        store = SQLiteAttendanceStore(str(tmp_path / "attendance.db"))
+    yield store
+    store.close()
+
+
+def write_legacy_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["Name", "Date", "Time"])
+        writer.writerows(rows)
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        AttendanceStore()
+
+
+def test_marked_on(store):
+    store.append(ROWS)
+    assert store.marked_on("2026-10-01") == {"ann", "bob"}
+    assert store.marked_on("2026-10-04") == set()
+
+
+def test_rows_are_filtered_and_ordered(store):
+    store.append(ROWS)
+    assert store.rows() == [ROWS[1], ROWS[0], ROWS[2], ROWS[3]]
+    assert store.rows("2026-10-02", "2026-10-03") == ROWS[2:]
+    assert store.rows(name="ann") == [ROWS[0], ROWS[2]]
+    assert store.rows(end="2026-10-01", name="ann") == [ROWS[0]]
+    assert store.rows(name="nobody") == []
+
+
+def test_rows_see_later_appends(store):
+    store.append(ROWS[:2])
+    assert len(store.rows()) == 2
+    store.append(ROWS[2:])
+    assert store.rows(start="2026-10-02") == ROWS[2:]
+
+
+def test_summary(store):
+    store.append(ROWS)
+    assert [tuple(row) for row in store.summary()] == [
+        ("ann", 2, "2026-10-01", "2026-10-02", "09:00:00", "09:15:00"),
+        ("bob", 1, "2026-10-01", "2026-10-01", "08:30:00", "08:30:00"),
+        ("cy", 1, "2026-10-03", "2026-10-03", "10:00:00", "10:00:00")]
+    assert [row[0] for row in store.summary(start="2026-10-02")] == ["ann", "cy"]
+
+
+def test_csv_store_writes_unix_line_endings(tmp_path):
+    path = tmp_path / "attendance.csv"
+    store = CSVAttendanceStore(str(path))
+    store.append(ROWS[:1])
+    assert path.read_bytes() == b"Name,Date,Time\nann,2026-10-01,09:00:00\n"
+
+
+def test_csv_store_keeps_existing_rows(tmp_path):
+    path = str(tmp_path / "attendance.csv")
+    write_legacy_csv(path, ROWS[:2])
+    store = CSVAttendanceStore(path)
+    store.append(ROWS[2:])
+    assert store.rows() == [ROWS[1], ROWS[0], ROWS[2], ROWS[3]]
+
+
+def test_sqlite_store_keeps_one_row_per_person_per_day(tmp_path):
+    store = SQLiteAttendanceStore(str(tmp_path / "attendance.db"))
+    store.append(ROWS)
+    store.append([("ann", "2026-10-01", "17:00:00")])
+    assert store.rows(name="ann") == [ROWS[0], ROWS[2]]
+    store.close()
+
+
+def test_import_csv_is_idempotent(tmp_path):
+    csv_path = str(tmp_path / "attendance.csv")
+    db_path = str(tmp_path / "attendance.db")
+    write_legacy_csv(csv_path, ROWS)
+
+    store = SQLiteAttendanceStore(db_path, legacy_csv=csv_path)
+    assert len(store.rows()) == len(ROWS)
+    store.import_csv(csv_path)
+    store.close()
+
+    # Rows added to the CSV after the import are not picked up again on restart
+    with open(csv_path, 'a', newline='') as f:
+        csv.writer(f, lineterminator="\n").writerow(["dee", "2026-10-04", "11:00:00"])
+    store = SQLiteAttendanceStore(db_path, legacy_csv=csv_path)
+    assert len(store.rows()) == len(ROWS)
+    store.close()
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from embedding_file import (IVFLists, open_embedding_file, open_ivf_lists, quantize_rows,
+                            write_embedding_file, write_ivf_lists)
+from face_index import IVFIndex
+from face_matcher import FaceMatcher
+
+
+def rows(count, dim=128, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (count, dim)).astype(np.float32)
+
+
+def test_float32_round_trip(tmp_path):
+    path = str(tmp_path / "face_embeddings.bin")
+    names = ["ann", "bob", "ann", "cy"]
+    matrix = rows(len(names))
+    write_embedding_file(path, names, matrix, digest=b"abc")
+
+    embeddings = open_embedding_file(path, b"abc")
+    assert len(embeddings) == 4
+    assert embeddings.dim == 128
+    assert embeddings.people == 3
+    assert embeddings.max_templates == 2
+    assert list(embeddings.names) == names
+    assert sorted(embeddings.names.distinct()) == ["ann", "bob", "cy"]
+    assert np.array_equal(embeddings.matrix, matrix)
+    assert np.allclose(embeddings.sq_norms, np.einsum('ij,ij->i', matrix, matrix))
+
+
+def test_int8_round_trip_is_close(tmp_path):
+    path = str(tmp_path / "face_embeddings.bin")
+    matrix = rows(20)
+    matrix[3] = 0
+    write_embedding_file(path, [f"p{i}" for i in range(20)], matrix, dtype="int8")
+
+    embeddings = open_embedding_file(path)
+    assert embeddings.dtype == "int8"
+    assert np.allclose(embeddings.matrix, matrix, atol=np.abs(matrix).max() / 127)
+    assert not embeddings.matrix[3].any()
+
+
+def test_quantize_rows_keeps_zero_rows():
+    quantized, scales = quantize_rows(np.zeros((2, 4), dtype=np.float32))
+    assert not quantized.any()
+    assert np.array_equal(scales, [1, 1])
+    assert quantize_rows(np.zeros((0, 4), dtype=np.float32))[0].shape == (0, 4)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+@pytest.mark.parametrize("matrix", [np.zeros((0, 128)), []], ids=["zero-rows", "no-rows"])
+def test_empty_gallery_round_trip(tmp_path, dtype, matrix):
+    path = str(tmp_path / "face_embeddings.bin")
+    write_embedding_file(path, [], matrix, digest=b"empty", dtype=dtype)
+
+    embeddings = open_embedding_file(path, b"empty")
+    assert len(embeddings) == 0
+    assert embeddings.people == 0
+    assert embeddings.max_templates == 0
+    assert embeddings.matrix.shape[0] == 0
+
+    # A fresh install maps the empty file, then enrolls its first person
+    matcher = FaceMatcher()
+    matcher.set_mapped(embeddings)
+    assert matcher.match(rows(1)) == [[]]
+    matcher.add("ann", rows(1)[0])
+    assert matcher.match(rows(1))[0][0][0] == "ann"
+
+
+def test_digest_mismatch_and_corrupt_files_are_ignored(tmp_path):
+    path = str(tmp_path / "face_embeddings.bin")
+    assert open_embedding_file(path) is None
+    write_embedding_file(path, ["ann"], rows(1), digest=b"old")
+    assert open_embedding_file(path, b"new") is None
+    with open(path, 'r+b') as f:
+        f.write(b"garbage!")
+    assert open_embedding_file(path) is None
+
+
+def test_unknown_dtype_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_embedding_file(str(tmp_path / "face_embeddings.bin"), ["ann"], rows(1), dtype="float16")
+
+
+def test_ivf_lists_round_trip(tmp_path):
+    path = str(tmp_path / "face_embeddings.ivf")
+    matrix = rows(300, dim=16)
+    index = IVFIndex(nlist=6, min_size=0)
+    index.build(matrix)
+    write_ivf_lists(path, index.saved_lists(), digest=b"rows")
+
+    assert open_ivf_lists(path, b"other") is None
+    lists = open_ivf_lists(path, b"rows")
+    assert isinstance(lists, IVFLists)
+    assert lists.nlist == 6
+    assert np.array_equal(lists.centroids, index.centroids)
+
+    restored = IVFIndex(nlist=6, min_size=0)
+    restored.build(matrix, lists)
+    assert [list(ids) for ids in restored.lists] == [list(ids) for ids in index.lists]
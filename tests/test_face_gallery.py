@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+
+from face_gallery import FaceGallery, person_directory
+
+
+def encode_files(paths):
+    return [np.full(128, 0.1, dtype=np.float32) for _ in paths]
+
+
+def template(value=0.1):
+    image = np.full((100, 100, 3), 128, dtype=np.uint8)
+    return image, (30, 30, 40, 40), np.full(128, value, dtype=np.float32)
+
+
+@pytest.fixture
+def gallery(tmp_path):
+    storage = tmp_path / "storage"
+    gallery = FaceGallery(str(storage), "test-model", encode_files, {"type": "brute"})
+    gallery.load()
+    return gallery
+
+
+def test_replace_enrolls_and_replaces_templates(gallery):
+    person_dir = gallery.replace("ann", [template(0.1), template(0.2)])
+    assert sorted(os.listdir(person_dir)) == ["00.jpg", "01.jpg"]
+    assert gallery.match([np.full(128, 0.15)])[0][0] == "ann"
+
+    gallery.replace("ann", [template(0.5)])
+    assert os.listdir(person_dir) == ["00.jpg"]
+    assert gallery.people() == 1
+    assert gallery.match([np.full(128, 0.5)])[0] == ("ann", pytest.approx(0, abs=1e-5))
+
+
+def test_replace_removes_legacy_image(gallery):
+    legacy_path = os.path.join(gallery.faces_dir, "ann.jpg")
+    open(legacy_path, 'wb').close()
+    gallery.replace("ann", [template()])
+    assert not os.path.exists(legacy_path)
+
+
+@pytest.mark.parametrize("name", ["", ".", "..", "../x", "a/b", os.path.join("..", "..", "x")])
+def test_replace_rejects_names_outside_faces_dir(gallery, tmp_path, name):
+    gallery.replace("ann", [template()])
+    before = sorted(os.walk(tmp_path))
+    with pytest.raises(ValueError):
+        gallery.replace(name, [template()])
+    assert sorted(os.walk(tmp_path)) == before
+
+
+def test_replace_rejects_absolute_names(gallery, tmp_path):
+    victim = tmp_path / "victim"
+    victim.mkdir()
+    (victim / "keep.txt").write_text("data")
+    with pytest.raises(ValueError):
+        gallery.replace(str(victim), [template()])
+    assert (victim / "keep.txt").exists()
+
+
+def test_replace_rejects_symlinks_out_of_faces_dir(gallery, tmp_path):
+    victim = tmp_path / "victim"
+    victim.mkdir()
+    (victim / "keep.txt").write_text("data")
+    os.symlink(victim, os.path.join(gallery.faces_dir, "link"))
+    with pytest.raises(ValueError):
+        gallery.replace("link", [template()])
+    assert (victim / "keep.txt").exists()
+
+
+def test_person_directory(tmp_path):
+    faces_dir = str(tmp_path)
+    assert person_directory(faces_dir, "Ann Lee") == os.path.join(faces_dir, "Ann Lee")
+    with pytest.raises(ValueError):
+        person_directory(faces_dir, "..")
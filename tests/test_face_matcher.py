@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from face_index import BruteForceIndex, IVFIndex, exact_search, recall_report, synthetic_gallery
+from face_matcher import FaceMatcher, identity_centroids
+
+
+def gallery(size, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"p{i}" for i in range(size)], rng.normal(0, 0.1, (size, dim)).astype(np.float32)
+
+
+def brute_force(matrix, query, k):
+    distances = np.linalg.norm(matrix - query, axis=1)
+    order = np.argsort(distances)[:k]
+    return order, distances[order]
+
+
+def test_match_returns_nearest_names_in_order():
+    names, matrix = gallery(50)
+    matcher = FaceMatcher(dim=16)
+    matcher.set_gallery(names, matrix)
+    query = matrix[7] + 0.001
+    order, distances = brute_force(matrix, query, 3)
+    [matches] = matcher.match([query], k=3)
+    assert [name for name, _ in matches] == [names[i] for i in order]
+    assert np.allclose([d for _, d in matches], distances, atol=1e-4)
+
+
+def test_match_reports_each_name_once_at_its_closest_template():
+    matcher = FaceMatcher(dim=2)
+    matcher.set_gallery(["a", "a", "a", "b"], [[0, 0], [1, 0], [0.1, 0], [0.5, 0]])
+    [matches] = matcher.match([[0.2, 0]], k=2)
+    assert [name for name, _ in matches] == ["a", "b"]
+    assert matches[0][1] == pytest.approx(0.1)
+    assert matches[1][1] == pytest.approx(0.3)
+
+
+def test_empty_gallery_matches_nothing():
+    matcher = FaceMatcher(dim=4)
+    matcher.set_gallery([], [])
+    assert matcher.match(np.zeros((2, 4)), k=1) == [[], []]
+
+
+def test_add_grows_past_capacity():
+    names, matrix = gallery(10)
+    matcher = FaceMatcher(dim=16, capacity=1)
+    for name, row in zip(names, matrix):
+        matcher.add(name, row)
+    assert len(matcher) == 10
+    assert matcher.match([matrix[9]])[0][0][0] == "p9"
+
+
+def test_identity_centroids_averages_templates_in_first_seen_order():
+    names, rows = identity_centroids(["b", "a", "b"], [[0, 2], [1, 1], [2, 0]])
+    assert names == ["b", "a"]
+    assert np.allclose(rows, [[1, 1], [1, 1]])
+
+
+@pytest.mark.parametrize("index", [BruteForceIndex(), IVFIndex(nlist=8, nprobe=8, min_size=0)],
+                         ids=["brute", "ivf"])
+def test_remove_names_matches_a_rebuild(index):
+    names, matrix = gallery(400, seed=1)
+    names = [f"p{i % 100}" for i in range(len(names))]
+    matcher = FaceMatcher(dim=16, index=index)
+    matcher.set_gallery(names, matrix)
+    removed = {"p3", "p50", "p99", "missing"}
+    assert matcher.remove_names(removed) == 12
+
+    keep = [i for i, name in enumerate(names) if name not in removed]
+    rebuilt = FaceMatcher(dim=16)
+    rebuilt.set_gallery([names[i] for i in keep], matrix[keep])
+    assert matcher.names == rebuilt.names
+    assert np.array_equal(matcher.matrix, rebuilt.matrix)
+    assert sorted(matcher.templates) == sorted(rebuilt.templates)
+    queries = matrix[:40] + 0.001
+    # Every list is probed, so the IVF index must find the same names as exact search
+    matches, expected = matcher.match(queries, k=3), rebuilt.match(queries, k=3)
+    assert [[name for name, _ in row] for row in matches] == [[name for name, _ in row] for row in expected]
+    assert np.allclose([[d for _, d in row] for row in matches], [[d for _, d in row] for row in expected],
+                       atol=1e-5)
+    assert matcher.remove("p3") == 0
+
+
+def test_ivf_probing_every_list_is_exact():
+    matrix = synthetic_gallery(2000, clusters=50, dim=32)
+    sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+    index = IVFIndex(nlist=16, nprobe=16, min_size=0)
+    index.build(matrix)
+    queries = matrix[::50] + 0.01
+    indices, distances = index.search(matrix, sq_norms, queries, 5)
+    exact_indices, exact_distances = exact_search(matrix, sq_norms, queries, 5)
+    assert np.array_equal(indices, exact_indices)
+    assert np.allclose(distances, exact_distances, atol=1e-5)
+
+
+def test_ivf_recall_on_clustered_gallery():
+    rng = np.random.default_rng(2)
+    matrix = synthetic_gallery(5000, clusters=200, dim=32)
+    queries = matrix[rng.choice(len(matrix), 200, replace=False)] + rng.normal(0, 0.02, (200, 32))
+    report = recall_report(matrix, queries, k=1, nprobes=(8,), batch=20)
+    assert report["nlist"] == int(np.sqrt(len(matrix)))
+    assert report["rows"][1]["recall"] >= 0.9
+
+
+def test_ivf_finds_added_rows():
+    names, matrix = gallery(600, seed=3)
+    matcher = FaceMatcher(dim=16, index=IVFIndex(nlist=4, nprobe=4, min_size=0))
+    matcher.set_gallery(names, matrix)
+    new_row = np.full(16, 0.5, dtype=np.float32)
+    matcher.add("new", new_row)
+    assert matcher.match([new_row])[0][0] == ("new", pytest.approx(0, abs=1e-3))
+
+
+def test_ivf_below_min_size_searches_exactly():
+    names, matrix = gallery(20)
+    matcher = FaceMatcher(dim=16, index=IVFIndex(min_size=5000))
+    matcher.set_gallery(names, matrix)
+    assert matcher.index.centroids is None
+    assert matcher.match([matrix[4]])[0][0][0] == "p4"
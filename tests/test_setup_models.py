@@ -0,0 +1,93 @@
+import argparse
+import bz2
+import hashlib
+import os
+
+import pytest
+
+import setup_models
+
+MODEL_NAME = "test_model.dat"
+MODEL_DATA = b"model weights " * 1000
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    path = tmp_path / (MODEL_NAME + ".bz2")
+    path.write_bytes(bz2.compress(MODEL_DATA))
+    monkeypatch.setattr(setup_models, "MODELS", {
+        MODEL_NAME: ("http://example.invalid/test_model.dat.bz2", hashlib.sha256(MODEL_DATA).hexdigest())})
+    return str(path)
+
+
+def test_installs_model_matching_pinned_digest(tmp_path, archive):
+    models_dir = str(tmp_path / "models")
+    results = setup_models.download_dlib_models(models_dir, archives=[archive])
+    assert results == {MODEL_NAME: hashlib.sha256(MODEL_DATA).hexdigest()}
+    with open(os.path.join(models_dir, MODEL_NAME), 'rb') as f:
+        assert f.read() == MODEL_DATA
+    assert os.listdir(models_dir) == [MODEL_NAME]
+
+
+def test_rejects_download_not_matching_pinned_digest(tmp_path, archive):
+    with open(archive, 'wb') as f:
+        f.write(bz2.compress(os.urandom(4096)))
+    models_dir = str(tmp_path / "models")
+    with pytest.raises(RuntimeError):
+        setup_models.download_dlib_models(models_dir, archives=[archive])
+    assert os.listdir(models_dir) == []
+
+
+def test_rejects_truncated_download(tmp_path, archive):
+    with open(archive, 'r+b') as f:
+        f.truncate(os.path.getsize(archive) // 2)
+    models_dir = str(tmp_path / "models")
+    with pytest.raises(RuntimeError):
+        setup_models.download_dlib_models(models_dir, archives=[archive])
+    assert os.listdir(models_dir) == []
+
+
+def test_reinstalls_corrupt_existing_model(tmp_path, archive):
+    models_dir = tmp_path / "models"
+    models_dir.mkdir()
+    (models_dir / MODEL_NAME).write_bytes(os.urandom(1024))
+    setup_models.download_dlib_models(str(models_dir), archives=[archive])
+    assert (models_dir / MODEL_NAME).read_bytes() == MODEL_DATA
+
+
+def test_removes_corrupt_existing_model_it_cannot_replace(tmp_path, archive):
+    models_dir = tmp_path / "models"
+    models_dir.mkdir()
+    (models_dir / MODEL_NAME).write_bytes(os.urandom(1024))
+    os.remove(archive)
+    with pytest.raises(RuntimeError):
+        setup_models.download_dlib_models(str(models_dir), archives=[archive], mirror=str(tmp_path / "empty"))
+    assert not (models_dir / MODEL_NAME).exists()
+
+
+def test_checksums_override_pinned_digest(tmp_path, archive):
+    other_data = b"locally built model"
+    with open(archive, 'wb') as f:
+        f.write(bz2.compress(other_data))
+    models_dir = str(tmp_path / "models")
+    with pytest.raises(RuntimeError):
+        setup_models.download_dlib_models(models_dir, archives=[archive])
+    checksums = {MODEL_NAME: hashlib.sha256(other_data).hexdigest().upper()}
+    setup_models.download_dlib_models(models_dir, archives=[archive], checksums=checksums)
+    with open(os.path.join(models_dir, MODEL_NAME), 'rb') as f:
+        assert f.read() == other_data
+
+
+def test_read_checksums(tmp_path):
+    path = tmp_path / "SHA256SUMS"
+    path.write_text("ABC123  models/a.dat\ndef456 *b.dat\nnot a checksum line at all\n")
+    assert setup_models.read_checksums(str(path)) == {"a.dat": "abc123", "b.dat": "def456"}
+    assert setup_models.read_checksums(str(tmp_path / "missing")) == {}
+
+
+def test_parse_checksum():
+    digest = "0" * 64
+    assert setup_models.parse_checksum(f"a.dat={digest}") == ("a.dat", digest)
+    for value in ("a.dat", f"a.dat={digest[:-1]}"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            setup_models.parse_checksum(value)
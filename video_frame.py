@@ -0,0 +1,110 @@
+import itertools
+import threading
+import cv2
+import numpy as np
+
+
+class Frame:
+    """A captured BGR image plus derived views computed once and shared by every stage.
+
+    When the frame comes from a FramePool, gray is written into the pool's
+    preallocated buffer instead of a fresh array, and every holder of the frame
+    takes a reference with retain() and gives it back with release() so the
+    buffers are not reused while still in use. Both are no-ops for other frames.
+    """
+    __slots__ = ("image", "index", "_gray", "_gray_buffer", "_pool", "_slot")
+
+    def __init__(self, image, index=0, gray_buffer=None, pool=None, slot=None):
+        self.image = image
+        self.index = index
+        self._gray = None
+        self._gray_buffer = gray_buffer
+        self._pool = pool
+        self._slot = slot
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY, dst=self._gray_buffer)
+        return self._gray
+
+    def retain(self):
+        if self._pool is not None:
+            self._pool.retain(self._slot)
+        return self
+
+    def release(self):
+        if self._pool is not None:
+            self._pool.release(self._slot)
+
+
+def as_frame(frame):
+    """Wrap a plain BGR array as a Frame; Frames pass through unchanged"""
+    return frame if isinstance(frame, Frame) else Frame(frame)
+
+
+class FramePool:
+    """Preallocated BGR and grayscale buffers reused by a capture thread.
+
+    Each buffer carries a reference count; read() hands out a frame holding one
+    reference and only reuses buffers whose frames have all been released. When
+    every buffer is still held the new frame is dropped, so size should cover the
+    frames that can be in flight at once (queued, being processed and waiting to
+    be displayed) to avoid drops.
+    """
+
+    def __init__(self, size, frame_size):
+        width, height = frame_size
+        self.images = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(size)]
+        self.grays = [np.empty((height, width), dtype=np.uint8) for _ in range(size)]
+        self.frame_size = frame_size
+        self.exhausted = 0
+        self._refs = [0] * size
+        self._lock = threading.Lock()
+        self._slots = itertools.cycle(range(size))
+        self._count = itertools.count()
+        self._raw = None
+
+    def retain(self, slot):
+        with self._lock:
+            self._refs[slot] += 1
+
+    def release(self, slot):
+        with self._lock:
+            self._refs[slot] -= 1
+
+    def _next(self):
+        """Claim the next free buffer for the caller, or None if every buffer is held"""
+        with self._lock:
+            for _ in range(len(self._refs)):
+                slot = next(self._slots)
+                if self._refs[slot] == 0:
+                    self._refs[slot] = 1
+                    return slot
+        return None
+
+    def read(self, capture):
+        """Read the next frame from capture straight into the pool, or None if no frame was read.
+
+        Sources already at frame_size are decoded in place; others are decoded into one
+        reusable buffer and resized into the pool. The caller owns the returned frame's
+        reference. With no free buffer the frame is grabbed and discarded.
+        """
+        slot = self._next()
+        if slot is None:
+            self.exhausted += 1
+            capture.grab()
+            return None
+        image = self.images[slot]
+        ret, raw = capture.read(self._raw if self._raw is not None else image)
+        if not ret:
+            self.release(slot)
+            return None
+        if raw is not image:
+            self._raw = raw
+            cv2.resize(raw, self.frame_size, dst=image)
+        return Frame(image, next(self._count), self.grays[slot], self, slot)